@@ -1,6 +1,22 @@
-from flask import Flask, render_template,request,redirect,url_for,session,flash,jsonify
-from datetime import datetime
+from flask import Flask, render_template,request,redirect,url_for,session,flash,jsonify,g,has_app_context,Response,send_file
+from datetime import datetime, timedelta
 import sqlite3
+import click
+import csv
+import io
+import functools
+import hashlib
+import json
+import logging
+import math
+import tempfile
+import threading
+import bisect
+import time
+import re
+import socket
+import unicodedata
+from urllib.parse import urlsplit
 import os
 
 
@@ -12,143 +28,1487 @@ UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads', 'proveedor_facturas'
 ALLOWED_EXTENSIONS = {'pdf'}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['PDF_MAX_BYTES'] = int(os.environ.get('KIOSCO_PDF_MAX_BYTES', 10 * 1024 * 1024))
+# Tope de cualquier request (el PDF más el resto del formulario): Werkzeug corta con 413 antes de leer el cuerpo
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('KIOSCO_MAX_CONTENT_LENGTH', app.config['PDF_MAX_BYTES'] + 1024 * 1024))
+# Un archivo sin referencias se borra recién cuando pasó este tiempo desde su última escritura
+app.config['ARCHIVOS_GRACIA_SEGUNDOS'] = float(os.environ.get('KIOSCO_ARCHIVOS_GRACIA_SEGUNDOS', 300))
+# Cada cuánto la cola barre los PDFs huérfanos que no borró ninguna tarea (proceso cortado, subida a medias)
+app.config['ARCHIVOS_LIMPIEZA_SEGUNDOS'] = float(os.environ.get('KIOSCO_ARCHIVOS_LIMPIEZA_SEGUNDOS', 24 * 3600))
+# Con un proxy delante (Apache mod_xsendfile, lighttpd) el servidor manda el archivo en lugar de Flask
+app.config['USE_X_SENDFILE'] = os.environ.get('KIOSCO_USE_X_SENDFILE', '') == '1'
+# Comprobantes imprimibles ya renderizados (las facturas no cambian una vez registradas)
+app.config['IMPRESIONES_FOLDER'] = os.environ.get('KIOSCO_IMPRESIONES_FOLDER', os.path.join(BASE_DIR, 'cache', 'impresiones'))
+# Impresora térmica ESC/POS: 'tcp://host:9100', 'archivo:/dev/usb/lp0' o 'falsa' (vacío = sin impresora)
+app.config['IMPRESORA_TERMICA'] = os.environ.get('KIOSCO_IMPRESORA_TERMICA', '')
+app.config['IMPRESORA_COLUMNAS'] = int(os.environ.get('KIOSCO_IMPRESORA_COLUMNAS', 42))  # 42 en papel de 80 mm, 32 en 58 mm
+# Cola de tareas: hilos por proceso; con 0 o TAREAS_EN_SEGUNDO_PLANO=False las corre `flask --app app worker`
+app.config['TAREAS_HILOS'] = int(os.environ.get('KIOSCO_TAREAS_HILOS', 2))
+app.config['TAREAS_EN_SEGUNDO_PLANO'] = os.environ.get('KIOSCO_TAREAS_EN_SEGUNDO_PLANO', '1') == '1'
+
+# Configuración de la base de datos (se puede sobreescribir con variables de entorno)
+app.config['DATABASE'] = os.environ.get('KIOSCO_DATABASE', os.path.join(BASE_DIR, 'basededatosflask.db'))
+app.config['DB_BUSY_TIMEOUT'] = float(os.environ.get('KIOSCO_DB_BUSY_TIMEOUT', 5))  # segundos
+app.config['DB_CACHE_SIZE_KB'] = int(os.environ.get('KIOSCO_DB_CACHE_SIZE_KB', 16384))
+app.config['DB_MMAP_SIZE'] = int(os.environ.get('KIOSCO_DB_MMAP_SIZE', 64 * 1024 * 1024))
+# Consultas más lentas que esto se loguean con sus parámetros
+app.config['METRICAS_SQL_LENTA_MS'] = float(os.environ.get('KIOSCO_METRICAS_SQL_LENTA_MS', 100))
+# Cada worker recarga el catálogo cacheado como mucho cada tantos segundos (otros procesos pueden haberlo cambiado)
+app.config['CATALOGO_CACHE_TTL'] = float(os.environ.get('KIOSCO_CATALOGO_CACHE_TTL', 60))
+# Varios usuarios refrescando el dashboard comparten el mismo resultado por estos segundos
+app.config['DASHBOARD_CACHE_TTL'] = float(os.environ.get('KIOSCO_DASHBOARD_CACHE_TTL', 5))
+
+#----------------------------------------------------- Métricas ------------------------------------------------------
+# Latencia por endpoint (histograma), tiempo y cantidad de ejecuciones por consulta SQL
+# normalizada y log de consultas lentas. Se publica en /metrics (formato Prometheus) y cada
+# request deja una línea JSON en el logger 'kiosco'. Los contadores son por proceso.
+
+log = logging.getLogger('kiosco')
+if not log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+
+
+def log_evento(nivel, evento, **campos):
+    """Una línea JSON por evento, fácil de filtrar con jq o de mandar a un colector."""
+    campos = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'nivel': logging.getLevelName(nivel),
+              'evento': evento, **campos}
+    log.log(nivel, json.dumps(campos, ensure_ascii=False, default=str))
+
+
+_SQL_LITERALES = re.compile(r"'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SQL_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*')
+_SQL_ESPACIOS = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=2048)
+def normalizar_sql(sql):
+    """Agrupa consultas que solo difieren en valores: literales -> ?, listas IN/VALUES -> (...)."""
+    sql = _SQL_ESPACIOS.sub(' ', sql).strip()
+    sql = _SQL_LITERALES.sub('?', sql)
+    return _SQL_LISTAS.sub('(...)', sql)
+
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metricas:
+    """Contadores en memoria, protegidos por un lock (se actualizan desde varios hilos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self._requests = {}      # (endpoint, metodo) -> [buckets..., más lentos, suma, cantidad]
+            self._estados = {}       # (endpoint, metodo, estado) -> cantidad
+            self._sql = {}           # sql normalizado -> [cantidad, segundos, maximo]
+            self._sql_lentas = 0
+
+    def observar_request(self, endpoint, metodo, estado, segundos):
+        with self._lock:
+            serie = self._requests.get((endpoint, metodo))
+            if serie is None:
+                serie = self._requests[(endpoint, metodo)] = [0] * (len(BUCKETS_LATENCIA) + 3)
+            serie[bisect.bisect_left(BUCKETS_LATENCIA, segundos)] += 1
+            serie[-2] += segundos
+            serie[-1] += 1
+            clave = (endpoint, metodo, estado)
+            self._estados[clave] = self._estados.get(clave, 0) + 1
+
+    def observar_sql(self, sql, parametros, segundos):
+        normalizada = normalizar_sql(sql)
+        with self._lock:
+            serie = self._sql.get(normalizada)
+            if serie is None:
+                serie = self._sql[normalizada] = [0, 0.0, 0.0]
+            serie[0] += 1
+            serie[1] += segundos
+            serie[2] = max(serie[2], segundos)
+            lenta = segundos * 1000 >= app.config['METRICAS_SQL_LENTA_MS']
+            if lenta:
+                self._sql_lentas += 1
+        if has_app_context():
+            g.consultas = g.get('consultas', 0) + 1
+            g.segundos_sql = g.get('segundos_sql', 0.0) + segundos
+        if lenta:
+            log_evento(logging.WARNING, 'sql_lenta', sql=normalizada, ms=round(segundos * 1000, 2),
+                       parametros=repr(parametros)[:500])
+
+    def consultas(self):
+        """Consultas normalizadas ordenadas por tiempo total (la que más pesa primero)."""
+        with self._lock:
+            filas = [{'sql': sql, 'cantidad': c, 'segundos': s, 'maximo': m} for sql, (c, s, m) in self._sql.items()]
+        return sorted(filas, key=lambda f: f['segundos'], reverse=True)
+
+    def prometheus(self):
+        with self._lock:
+            requests = {k: list(v) for k, v in self._requests.items()}
+            estados = dict(self._estados)
+            sql = {k: list(v) for k, v in self._sql.items()}
+            lentas = self._sql_lentas
+
+        lineas = ['# HELP kiosco_http_request_duration_seconds Latencia de los requests por endpoint.',
+                  '# TYPE kiosco_http_request_duration_seconds histogram']
+        for (endpoint, metodo), serie in sorted(requests.items()):
+            etiquetas = f'endpoint="{_etiqueta(endpoint)}",method="{metodo}"'
+            acumulado = 0
+            for limite, cantidad in zip(BUCKETS_LATENCIA, serie):
+                acumulado += cantidad
+                lineas.append(f'kiosco_http_request_duration_seconds_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            # +Inf cuenta todos los requests, también los más lentos que el último bucket
+            lineas.append(f'kiosco_http_request_duration_seconds_bucket{{{etiquetas},le="+Inf"}} {serie[-1]}')
+            lineas.append(f'kiosco_http_request_duration_seconds_sum{{{etiquetas}}} {serie[-2]:.6f}')
+            lineas.append(f'kiosco_http_request_duration_seconds_count{{{etiquetas}}} {serie[-1]}')
+
+        lineas += ['# HELP kiosco_http_requests_total Requests por endpoint y código de respuesta.',
+                   '# TYPE kiosco_http_requests_total counter']
+        for (endpoint, metodo, estado), cantidad in sorted(estados.items()):
+            lineas.append(f'kiosco_http_requests_total{{endpoint="{_etiqueta(endpoint)}",method="{metodo}",status="{estado}"}} {cantidad}')
+
+        lineas += ['# HELP kiosco_sql_queries_total Ejecuciones por consulta normalizada.',
+                   '# TYPE kiosco_sql_queries_total counter']
+        lineas += [f'kiosco_sql_queries_total{{query="{_etiqueta(q)}"}} {c}' for q, (c, _, _) in sorted(sql.items())]
+        lineas += ['# HELP kiosco_sql_query_seconds_total Tiempo acumulado por consulta normalizada.',
+                   '# TYPE kiosco_sql_query_seconds_total counter']
+        lineas += [f'kiosco_sql_query_seconds_total{{query="{_etiqueta(q)}"}} {s:.6f}' for q, (_, s, _) in sorted(sql.items())]
+        lineas += ['# HELP kiosco_sql_query_max_seconds Ejecución más lenta por consulta normalizada.',
+                   '# TYPE kiosco_sql_query_max_seconds gauge']
+        lineas += [f'kiosco_sql_query_max_seconds{{query="{_etiqueta(q)}"}} {m:.6f}' for q, (_, _, m) in sorted(sql.items())]
+        lineas += ['# HELP kiosco_sql_slow_queries_total Consultas por encima de METRICAS_SQL_LENTA_MS.',
+                   '# TYPE kiosco_sql_slow_queries_total counter',
+                   f'kiosco_sql_slow_queries_total {lentas}']
+        return '\n'.join(lineas) + '\n'
+
+
+def _etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metricas = Metricas()
+
+
+@app.before_request
+def _iniciar_medicion():
+    g.inicio_request = time.perf_counter()
+
+
+@app.after_request
+def _registrar_medicion(response):
+    inicio = g.pop('inicio_request', None)
+    if inicio is None:
+        return response
+    segundos = time.perf_counter() - inicio
+    # Sin ruta (404) se agrupa en una sola serie para no crear una por URL
+    endpoint = request.endpoint or 'sin_ruta'
+    metricas.observar_request(endpoint, request.method, response.status_code, segundos)
+    log_evento(logging.INFO, 'request', endpoint=endpoint, metodo=request.method, ruta=request.path,
+               estado=response.status_code, ms=round(segundos * 1000, 2),
+               consultas=g.get('consultas', 0), ms_sql=round(g.get('segundos_sql', 0.0) * 1000, 2))
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(metricas.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+#----------------------------------------------------- Conexiones ------------------------------------------------------
+
+class PooledConnection(sqlite3.Connection):
+    """Conexión reutilizable: close() la devuelve al pool en lugar de cerrarla.
+
+    execute/executemany quedan medidos en `metricas` (el tiempo hasta la primera fila).
+    """
 
-def get_db_connection():
-    # Esto busca en la carpeta del proyecto
-    db_path = os.path.join(os.path.dirname(__file__), 'basededatosflask.db')
-    conn = sqlite3.connect(db_path)
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            metricas.observar_sql(sql, parametros, time.perf_counter() - inicio)
+
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            metricas.observar_sql(sql, '<executemany>', time.perf_counter() - inicio)
+
+    def close(self):
+        # Igual que sqlite3: lo que no se commiteó se descarta
+        if self.in_transaction:
+            self.rollback()
+
+    def close_real(self):
+        super().close()
+
+
+# Una conexión por hilo y por archivo de base de datos
+_db_pool = threading.local()
+
+
+def _open_db_connection(db_path):
+    conn = sqlite3.connect(db_path, timeout=app.config['DB_BUSY_TIMEOUT'], factory=PooledConnection)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f"PRAGMA cache_size = -{int(app.config['DB_CACHE_SIZE_KB'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(app.config['DB_MMAP_SIZE'])}")
+    conn.execute('PRAGMA temp_store = MEMORY')
+    # Al arrancar solo comparamos la versión; las migraciones se corren con `flask --app app migrate`
+    version = get_schema_version(conn)
+    if version < SCHEMA_VERSION:
+        conn.close_real()
+        raise RuntimeError(f"La base {db_path} está en la versión {version} del esquema y se necesita la "
+                           f"{SCHEMA_VERSION}. Ejecutá: flask --app app migrate")
     return conn
 
 
-def ensure_cajas_table():
-    """Crea la tabla 'cajas' si no existe."""
-    conn = get_db_connection()
+def get_db_connection():
+    """Devuelve la conexión del hilo actual (la crea la primera vez).
+
+    Dentro de un request/app context queda guardada en `g`, así las funciones
+    que llaman varias veces a get_db_connection() comparten la misma conexión.
+    """
+    if has_app_context() and 'db' in g:
+        return g.db
+
+    db_path = app.config['DATABASE']
+    conexiones = getattr(_db_pool, 'conexiones', None)
+    if conexiones is None:
+        conexiones = _db_pool.conexiones = {}
+    conn = conexiones.get(db_path)
+    if conn is None:
+        conn = conexiones[db_path] = _open_db_connection(db_path)
+
+    if has_app_context():
+        g.db = conn
+    return conn
+
+
+def close_db_pool():
+    """Cierra de verdad las conexiones del hilo actual (tests, CLI, cambio de base)."""
+    conexiones = getattr(_db_pool, 'conexiones', None) or {}
+    for conn in conexiones.values():
+        conn.close_real()
+    conexiones.clear()
+
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        # Si el handler no hizo commit, descartamos para no dejar el lock tomado
+        conn.close()
+
+
+#----------------------------------------------------- Migraciones ------------------------------------------------------
+# Cada migración recibe una conexión dentro de una transacción y deja el esquema
+# en la versión siguiente. La versión actual se guarda en PRAGMA user_version.
+
+def _columnas(conn, tabla):
+    return {r[1] for r in conn.execute(f'PRAGMA table_info({tabla})').fetchall()}
+
+
+def _agregar_columna_si_falta(conn, tabla, columna, definicion):
+    if columna not in _columnas(conn, tabla):
+        conn.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}')
+
+
+def _migracion_esquema_base(conn):
+    """Esquema original. Usa IF NOT EXISTS porque las bases existentes ya lo tienen (versión 0)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id_usuario INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            rol TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS clientes (
+            id_cliente INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            direccion TEXT,
+            telefono TEXT,
+            email TEXT UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS productos (
+            id_producto INTEGER PRIMARY KEY AUTOINCREMENT,
+            descripcion TEXT NOT NULL,
+            precio REAL NOT NULL,
+            stock INTEGER NOT NULL,
+            margen_ganancia REAL DEFAULT 0,
+            precio_costo REAL DEFAULT 0,
+            codigo_barras TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS facturas (
+            id_factura INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_cliente INTEGER NOT NULL,
+            fecha TEXT NOT NULL,
+            total REAL NOT NULL,
+            FOREIGN KEY (id_cliente) REFERENCES clientes(id_cliente)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS detalle_factura (
+            id_detalle INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_factura INTEGER NOT NULL,
+            id_producto INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            precio_unitario REAL NOT NULL,
+            subtotal REAL NOT NULL,
+            metodo_pago TEXT,
+            FOREIGN KEY (id_factura) REFERENCES facturas(id_factura),
+            FOREIGN KEY (id_producto) REFERENCES productos(id_producto)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS proveedores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            razon_social TEXT NOT NULL,
+            nombre_comercial TEXT,
+            cuit TEXT NOT NULL UNIQUE,
+            telefono TEXT,
+            email TEXT,
+            direccion_fiscal TEXT,
+            calle_numero TEXT,
+            ciudad TEXT,
+            provincia TEXT,
+            codigo_postal TEXT,
+            pais TEXT,
+            contacto TEXT,
+            condicion_pago TEXT,
+            estado TEXT NOT NULL DEFAULT 'activo' CHECK (estado IN ('activo','inactivo','suspendido')),
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now'))
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cajas (
+            id_caja INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha_apertura TEXT NOT NULL,
+            usuario TEXT,
+            monto_apertura REAL NOT NULL,
+            monto_cierre REAL,
+            fecha_cierre TEXT,
+            estado TEXT NOT NULL -- 'abierta' o 'cerrada'
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS facturas_proveedores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_proveedor INTEGER NOT NULL,
+            numero TEXT,
+            fecha TEXT,
+            monto REAL,
+            descripcion TEXT,
+            archivo TEXT,
+            creado_en TEXT
+        )
+    ''')
+    # Columnas que se fueron agregando a bases viejas
+    _agregar_columna_si_falta(conn, 'detalle_factura', 'metodo_pago', 'TEXT')
+    _agregar_columna_si_falta(conn, 'productos', 'margen_ganancia', 'REAL DEFAULT 0')
+    _agregar_columna_si_falta(conn, 'productos', 'precio_costo', 'REAL DEFAULT 0')
+    _agregar_columna_si_falta(conn, 'productos', 'codigo_barras', 'TEXT')
+    # Índice único sobre codigo_barras para prevenir duplicados (permite NULLs)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_codigo_barras ON productos(codigo_barras)')
+
+
+def _migracion_indices_consultas(conn):
+    """Índices para los filtros y joins de listados, detalle de factura y dashboard."""
+    # detalle de una factura y el metodo_pago de la primera línea (covering)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detalle_factura_factura ON detalle_factura(id_factura, metodo_pago)')
+    # rangos de fecha del dashboard: cuenta y suma sin tocar la tabla
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_fecha ON facturas(fecha, total)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_cliente ON facturas(id_cliente, fecha)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_proveedores_proveedor ON facturas_proveedores(id_proveedor, creado_en)')
+    # conteos de stock y listado de stock bajo
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_productos_stock ON productos(stock)')
+
+
+def _migracion_indice_listado_facturas(conn):
+    """Orden (fecha, id_factura) del listado paginado: el rowid es la última columna del índice."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_fecha_id ON facturas(fecha)')
+
+
+def _migracion_ganancia_precalculada(conn):
+    """Costo congelado en cada línea y ganancia/método guardados en la factura.
+
+    Las facturas existentes quedan en NULL hasta correr `flask --app app backfill-ganancias`.
+    """
+    _agregar_columna_si_falta(conn, 'detalle_factura', 'precio_costo', 'REAL')
+    _agregar_columna_si_falta(conn, 'facturas', 'ganancia', 'REAL')
+    _agregar_columna_si_falta(conn, 'facturas', 'metodo_pago', 'TEXT')
+
+
+def fts5_disponible(conn):
     try:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS cajas (
-                id_caja INTEGER PRIMARY KEY AUTOINCREMENT,
-                fecha_apertura TEXT NOT NULL,
-                usuario TEXT,
-                monto_apertura REAL NOT NULL,
-                monto_cierre REAL,
-                fecha_cierre TEXT,
-                estado TEXT NOT NULL -- 'abierta' o 'cerrada'
-            )
-        ''')
-        conn.commit()
-    except Exception as e:
-        print(f"Error creando tabla cajas: {e}")
+        conn.execute('CREATE VIRTUAL TABLE temp._prueba_fts5 USING fts5(x)')
+        conn.execute('DROP TABLE temp._prueba_fts5')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _migracion_busqueda_fts(conn):
+    """Índice full-text de productos.descripcion, sincronizado por triggers.
+
+    unicode61 con remove_diacritics hace que "azucar" encuentre "Azúcar". Si el
+    SQLite no trae FTS5 no se crea y la búsqueda usa el índice en memoria.
+    """
+    if not fts5_disponible(conn):
+        return
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+            descripcion,
+            content='productos',
+            content_rowid='id_producto',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+            INSERT INTO productos_fts(rowid, descripcion) VALUES (new.id_producto, new.descripcion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+            INSERT INTO productos_fts(productos_fts, rowid, descripcion) VALUES ('delete', old.id_producto, old.descripcion);
+        END
+    ''')
+    # Solo cuando cambia la descripción: los cambios de stock de cada venta no tocan el índice
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE OF descripcion ON productos BEGIN
+            INSERT INTO productos_fts(productos_fts, rowid, descripcion) VALUES ('delete', old.id_producto, old.descripcion);
+            INSERT INTO productos_fts(rowid, descripcion) VALUES (new.id_producto, new.descripcion);
+        END
+    ''')
+    conn.execute("INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')")
+
+
+def _migracion_ventas_diarias(conn):
+    """Acumulado de ventas por día y método de pago, mantenido por registrar_venta()."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            fecha TEXT NOT NULL,                    -- 'YYYY-MM-DD'
+            metodo_pago TEXT NOT NULL DEFAULT '',   -- '' si la venta no lo informó
+            cantidad_ventas INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            ganancia REAL NOT NULL DEFAULT 0,
+            items INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, metodo_pago)
+        ) WITHOUT ROWID
+    ''')
+    _reconstruir_ventas_diarias(conn)
+
+
+def _migracion_categoria_proveedor_producto(conn):
+    """Categoría y proveedor habitual del producto, para filtrar repreciados e importaciones."""
+    _agregar_columna_si_falta(conn, 'productos', 'categoria', 'TEXT')
+    _agregar_columna_si_falta(conn, 'productos', 'id_proveedor', 'INTEGER REFERENCES proveedores(id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_productos_categoria ON productos(categoria)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_productos_proveedor ON productos(id_proveedor)')
+
+
+def _migracion_cola_tareas(conn):
+    """Tabla de la cola de tareas en segundo plano."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tareas (
+            id_tarea INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            datos TEXT NOT NULL DEFAULT '{}',      -- JSON
+            estado TEXT NOT NULL DEFAULT 'pendiente', -- 'pendiente', 'en_curso', 'hecha' o 'fallida'
+            intentos INTEGER NOT NULL DEFAULT 0,
+            max_intentos INTEGER NOT NULL DEFAULT 3,
+            error TEXT,
+            ejecutar_desde TEXT NOT NULL,
+            creada_en TEXT NOT NULL,
+            actualizada_en TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tareas_pendientes ON tareas(estado, ejecutar_desde)')
+
+
+def _migracion_conciliacion_cajas(conn):
+    """Cada factura queda asociada a la caja abierta y cajas_totales acumula por caja y método de pago."""
+    _agregar_columna_si_falta(conn, 'facturas', 'id_caja', 'INTEGER REFERENCES cajas(id_caja)')
+    _agregar_columna_si_falta(conn, 'cajas', 'monto_esperado', 'REAL')
+    _agregar_columna_si_falta(conn, 'cajas', 'diferencia', 'REAL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_caja ON facturas(id_caja)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cajas_estado ON cajas(estado)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cajas_totales (
+            id_caja INTEGER NOT NULL REFERENCES cajas(id_caja),
+            metodo_pago TEXT NOT NULL DEFAULT '',
+            cantidad_ventas INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (id_caja, metodo_pago)
+        ) WITHOUT ROWID
+    ''')
+    # Las ventas anteriores se asignan por horario a la última caja abierta en ese momento
+    conn.execute('''
+        UPDATE facturas
+        SET id_caja = (SELECT c.id_caja FROM cajas c
+                       WHERE c.fecha_apertura <= facturas.fecha
+                         AND (c.fecha_cierre IS NULL OR c.fecha_cierre >= facturas.fecha)
+                       ORDER BY c.fecha_apertura DESC LIMIT 1)
+        WHERE id_caja IS NULL
+    ''')
+    _reconstruir_cajas_totales(conn)
+
+
+def _reconstruir_cajas_totales(conn):
+    conn.execute('DELETE FROM cajas_totales')
+    conn.execute('''
+        INSERT INTO cajas_totales (id_caja, metodo_pago, cantidad_ventas, total)
+        SELECT id_caja, IFNULL(metodo_pago, ''), COUNT(*), IFNULL(SUM(total), 0)
+        FROM facturas
+        WHERE id_caja IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+
+
+def _migracion_indices_grilla_productos(conn):
+    """Índices para ordenar la grilla de productos por descripción o precio sin ordenar en memoria."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_productos_descripcion ON productos(descripcion)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_productos_precio ON productos(precio)')
+
+
+def _migracion_indice_nombre_clientes(conn):
+    """Búsqueda de clientes por prefijo del nombre (LIKE 'ana%' sin distinguir mayúsculas) desde el índice."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clientes_nombre ON clientes(nombre COLLATE NOCASE)')
+
+
+# Letras que los triggers de clientes normalizan en SQL (un trigger no puede llamar a sin_acentos).
+# Son las del castellano: cada una es un replace() anidado y el parser de SQLite no admite muchos más.
+# Las demás letras con acento o mayúscula fuera de ASCII (Ö, Ç, Å...) quedan como están, en la
+# columna y en lo que se busca: lower() de SQLite solo pasa a minúscula A-Z.
+_LETRAS_CON_ACENTO = 'áéíóúüñÁÉÍÓÚÜÑ'
+_LETRAS_SIN_ACENTO = 'aeiouunaeiouun'
+_TABLA_BUSQUEDA = str.maketrans(_LETRAS_CON_ACENTO + 'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+                                _LETRAS_SIN_ACENTO + 'abcdefghijklmnopqrstuvwxyz')
+_SEPARADORES_DIGITOS = ' -()+./'
+
+
+def normalizar_busqueda(texto):
+    """Clave de búsqueda de un nombre: lo mismo que calcula _sql_nombre_busqueda() en los triggers."""
+    return re.sub(' +', ' ', (texto or '').translate(_TABLA_BUSQUEDA)).strip(' ')
+
+
+def _sql_nombre_busqueda(columna):
+    """Expresión SQL equivalente a normalizar_busqueda(): sin acentos, en minúscula y con un solo espacio entre palabras."""
+    expr = columna
+    for letra, reemplazo in zip(_LETRAS_CON_ACENTO, _LETRAS_SIN_ACENTO):
+        expr = f"replace({expr}, '{letra}', '{reemplazo}')"
+    # Varios espacios seguidos quedan en uno: ' ' -> ' \x01', se borra '\x01 ' y después el '\x01' suelto
+    expr = f"replace(replace(replace({expr}, ' ', ' ' || char(1)), char(1) || ' ', ''), char(1), '')"
+    return f"lower(trim({expr}))"
+
+
+def _sql_solo_digitos(columna):
+    """Expresión SQL que deja solo los dígitos de un teléfono o CUIT (como solo_digitos())."""
+    expr = f"IFNULL({columna}, '')"
+    for separador in _SEPARADORES_DIGITOS:
+        expr = f"replace({expr}, '{separador}', '')"
+    return expr
+
+
+def _migracion_directorio_clientes(conn):
+    """Directorio de clientes: claves de búsqueda indexadas y acumulados de compras.
+
+    nombre_busqueda (sin acentos ni mayúsculas) y telefono_busqueda (solo dígitos) los
+    mantienen triggers, así cualquier INSERT/UPDATE queda bien sin pasar por la app.
+    cantidad_compras, total_compras y ultima_compra los suma registrar_venta().
+    """
+    _agregar_columna_si_falta(conn, 'clientes', 'nombre_busqueda', "TEXT NOT NULL DEFAULT ''")
+    _agregar_columna_si_falta(conn, 'clientes', 'telefono_busqueda', "TEXT NOT NULL DEFAULT ''")
+    _agregar_columna_si_falta(conn, 'clientes', 'cantidad_compras', 'INTEGER NOT NULL DEFAULT 0')
+    _agregar_columna_si_falta(conn, 'clientes', 'total_compras', 'REAL NOT NULL DEFAULT 0')
+    _agregar_columna_si_falta(conn, 'clientes', 'ultima_compra', 'TEXT')
+    _claves_busqueda_clientes(conn)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clientes_nombre_busqueda ON clientes(nombre_busqueda)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clientes_telefono_busqueda ON clientes(telefono_busqueda)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clientes_email_busqueda ON clientes(lower(email))')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clientes_total_compras ON clientes(total_compras)')
+    # La búsqueda por nombre pasa a nombre_busqueda; el índice NOCASE de la versión 11 queda sin uso
+    conn.execute('DROP INDEX IF EXISTS idx_clientes_nombre')
+    _reconstruir_compras_clientes(conn)
+
+
+def _claves_busqueda_clientes(conn):
+    """Triggers que mantienen nombre_busqueda y telefono_busqueda, y el recálculo de las existentes."""
+    actualizar_claves = f'''
+            UPDATE clientes
+            SET nombre_busqueda = {_sql_nombre_busqueda('new.nombre')},
+                telefono_busqueda = {_sql_solo_digitos('new.telefono')}
+            WHERE id_cliente = new.id_cliente;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS clientes_busqueda_ai AFTER INSERT ON clientes BEGIN
+            {actualizar_claves}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS clientes_busqueda_au AFTER UPDATE OF nombre, telefono ON clientes BEGIN
+            {actualizar_claves}
+        END
+    ''')
+    conn.execute(f'''
+        UPDATE clientes
+        SET nombre_busqueda = {_sql_nombre_busqueda('nombre')},
+            telefono_busqueda = {_sql_solo_digitos('telefono')}
+    ''')
+
+
+def _reconstruir_compras_clientes(conn):
+    conn.execute('''
+        UPDATE clientes
+        SET (cantidad_compras, total_compras, ultima_compra) =
+            (SELECT COUNT(*), IFNULL(SUM(f.total), 0), MAX(f.fecha)
+             FROM facturas f WHERE f.id_cliente = clientes.id_cliente)
+    ''')
+
+
+def _migracion_directorio_proveedores(conn):
+    """Directorio de proveedores: claves de búsqueda indexadas y acumulados de sus facturas.
+
+    Las claves (razón social y nombre comercial sin acentos, CUIT solo dígitos) las
+    mantienen triggers, como en clientes. cantidad_facturas y monto_adeudado los
+    ajustan los handlers que escriben facturas_proveedores (ver _acumular_factura_proveedor).
+    """
+    _agregar_columna_si_falta(conn, 'proveedores', 'razon_social_busqueda', "TEXT NOT NULL DEFAULT ''")
+    _agregar_columna_si_falta(conn, 'proveedores', 'nombre_comercial_busqueda', "TEXT NOT NULL DEFAULT ''")
+    _agregar_columna_si_falta(conn, 'proveedores', 'cuit_busqueda', "TEXT NOT NULL DEFAULT ''")
+    _agregar_columna_si_falta(conn, 'proveedores', 'cantidad_facturas', 'INTEGER NOT NULL DEFAULT 0')
+    _agregar_columna_si_falta(conn, 'proveedores', 'monto_adeudado', 'REAL NOT NULL DEFAULT 0')
+    _claves_busqueda_proveedores(conn)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_proveedores_razon_social_busqueda ON proveedores(razon_social_busqueda)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_proveedores_nombre_comercial_busqueda ON proveedores(nombre_comercial_busqueda)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_proveedores_cuit_busqueda ON proveedores(cuit_busqueda)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_proveedores_monto_adeudado ON proveedores(monto_adeudado)')
+    _reconstruir_saldos_proveedores(conn)
+
+
+def _claves_busqueda_proveedores(conn):
+    """Triggers que mantienen las claves de búsqueda de proveedores, y el recálculo de las existentes."""
+    actualizar_claves = f'''
+            UPDATE proveedores
+            SET razon_social_busqueda = {_sql_nombre_busqueda('new.razon_social')},
+                nombre_comercial_busqueda = {_sql_nombre_busqueda("IFNULL(new.nombre_comercial, '')")},
+                cuit_busqueda = {_sql_solo_digitos('new.cuit')}
+            WHERE id = new.id;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS proveedores_busqueda_ai AFTER INSERT ON proveedores BEGIN
+            {actualizar_claves}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS proveedores_busqueda_au AFTER UPDATE OF razon_social, nombre_comercial, cuit ON proveedores BEGIN
+            {actualizar_claves}
+        END
+    ''')
+    conn.execute(f'''
+        UPDATE proveedores
+        SET razon_social_busqueda = {_sql_nombre_busqueda('razon_social')},
+            nombre_comercial_busqueda = {_sql_nombre_busqueda("IFNULL(nombre_comercial, '')")},
+            cuit_busqueda = {_sql_solo_digitos('cuit')}
+    ''')
+
+
+def _reconstruir_saldos_proveedores(conn):
+    conn.execute('''
+        UPDATE proveedores
+        SET (cantidad_facturas, monto_adeudado) =
+            (SELECT COUNT(*), IFNULL(SUM(fp.monto), 0)
+             FROM facturas_proveedores fp WHERE fp.id_proveedor = proveedores.id)
+    ''')
+
+
+def _migracion_ventas_offline(conn):
+    """Clave de idempotencia de las ventas que llegan por lote desde cajas sin conexión.
+
+    Es única: reenviar un lote ya registrado no duplica facturas. Las ventas hechas en
+    línea no la usan (NULL no choca con el índice único).
+    """
+    _agregar_columna_si_falta(conn, 'facturas', 'clave_idempotencia', 'TEXT')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_facturas_clave_idempotencia ON facturas(clave_idempotencia)')
+
+
+def _migracion_claves_busqueda_espacios(conn):
+    """Las claves de búsqueda de nombres pasan a tener un solo espacio entre palabras.
+
+    Igual que normalizar_busqueda() sobre lo que se tipea: 'Ana  María' se encuentra
+    buscando 'ana maría'. Se rehacen los triggers y se recalculan las claves.
+    """
+    for trigger in ('clientes_busqueda_ai', 'clientes_busqueda_au', 'proveedores_busqueda_ai', 'proveedores_busqueda_au'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    _claves_busqueda_clientes(conn)
+    _claves_busqueda_proveedores(conn)
+
+
+def _migracion_facturas_sin_cliente(conn):
+    """facturas.id_cliente pasa a aceptar NULL: la venta rápida (y la de una caja sin
+    conexión) no tiene cliente y el esquema base lo declaraba NOT NULL.
+
+    SQLite no puede sacar un NOT NULL con ALTER TABLE: se copia la tabla con la
+    definición corregida y se recrean sus índices. Se conserva el contador de
+    AUTOINCREMENT para no reutilizar números de factura borrados.
+    """
+    definicion = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'facturas'").fetchone()[0]
+    if 'id_cliente INTEGER NOT NULL' not in definicion:
+        return
+    indices = [r[0] for r in conn.execute("""SELECT sql FROM sqlite_master
+                                             WHERE type = 'index' AND tbl_name = 'facturas' AND sql IS NOT NULL""")]
+    secuencia = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'facturas'").fetchone()
+    conn.execute(definicion.replace('CREATE TABLE facturas', 'CREATE TABLE facturas_nueva', 1)
+                           .replace('id_cliente INTEGER NOT NULL', 'id_cliente INTEGER', 1))
+    conn.execute('INSERT INTO facturas_nueva SELECT * FROM facturas')
+    conn.execute('DROP TABLE facturas')
+    conn.execute('ALTER TABLE facturas_nueva RENAME TO facturas')
+    for indice in indices:
+        conn.execute(indice)
+    if secuencia:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'facturas'", (secuencia[0],))
+
+
+# El orden importa: la migración N lleva el esquema a la versión N
+MIGRACIONES = [
+    _migracion_esquema_base,
+    _migracion_indices_consultas,
+    _migracion_indice_listado_facturas,
+    _migracion_ganancia_precalculada,
+    _migracion_busqueda_fts,
+    _migracion_ventas_diarias,
+    _migracion_categoria_proveedor_producto,
+    _migracion_cola_tareas,
+    _migracion_conciliacion_cajas,
+    _migracion_indices_grilla_productos,
+    _migracion_indice_nombre_clientes,
+    _migracion_directorio_clientes,
+    _migracion_directorio_proveedores,
+    _migracion_ventas_offline,
+    _migracion_claves_busqueda_espacios,
+    _migracion_facturas_sin_cliente,
+]
+SCHEMA_VERSION = len(MIGRACIONES)
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrar_base(db_path=None):
+    """Aplica las migraciones pendientes. Devuelve (version_anterior, version_actual)."""
+    conn = sqlite3.connect(db_path or app.config['DATABASE'], isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        version_inicial = get_schema_version(conn)
+        for numero, migracion in enumerate(MIGRACIONES, start=1):
+            if numero <= version_inicial:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                migracion(conn)
+                conn.execute(f'PRAGMA user_version = {numero}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return version_inicial, get_schema_version(conn)
     finally:
         conn.close()
 
-# Asegurarse de que la tabla exista al iniciar
-ensure_cajas_table()
 
+def backfill_ganancias(conn):
+    """Completa costo por línea, ganancia y método de pago en facturas anteriores a la migración 4.
 
-def ensure_facturas_proveedores_table():
-    """Crea la tabla 'facturas_proveedores' si no existe."""
-    conn = get_db_connection()
+    Para las líneas viejas se usa el precio_costo actual del producto, que es lo
+    único que hay. Devuelve la cantidad de facturas actualizadas.
+    """
+    conn.execute('BEGIN IMMEDIATE')
     try:
         conn.execute('''
-            CREATE TABLE IF NOT EXISTS facturas_proveedores (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_proveedor INTEGER NOT NULL,
-                numero TEXT,
-                fecha TEXT,
-                monto REAL,
-                descripcion TEXT,
-                archivo TEXT,
-                creado_en TEXT
-            )
+            UPDATE detalle_factura
+            SET precio_costo = (SELECT p.precio_costo FROM productos p WHERE p.id_producto = detalle_factura.id_producto)
+            WHERE precio_costo IS NULL
         ''')
+        cursor = conn.execute('''
+            UPDATE facturas
+            SET ganancia = (SELECT IFNULL(SUM(d.cantidad * (d.precio_unitario - d.precio_costo)), 0)
+                            FROM detalle_factura d WHERE d.id_factura = facturas.id_factura),
+                metodo_pago = IFNULL(metodo_pago, (SELECT metodo_pago FROM detalle_factura d
+                                                   WHERE d.id_factura = facturas.id_factura LIMIT 1))
+            WHERE ganancia IS NULL
+        ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cursor.rowcount
+
+
+def _reconstruir_ventas_diarias(conn):
+    conn.execute('DELETE FROM ventas_diarias')
+    conn.execute('''
+        INSERT INTO ventas_diarias (fecha, metodo_pago, cantidad_ventas, total, ganancia, items)
+        SELECT substr(f.fecha, 1, 10),
+               IFNULL(IFNULL(f.metodo_pago, (SELECT metodo_pago FROM detalle_factura d
+                                             WHERE d.id_factura = f.id_factura LIMIT 1)), ''),
+               COUNT(*),
+               IFNULL(SUM(f.total), 0),
+               IFNULL(SUM(f.ganancia), 0),
+               IFNULL(SUM((SELECT SUM(d.cantidad) FROM detalle_factura d WHERE d.id_factura = f.id_factura)), 0)
+        FROM facturas f
+        GROUP BY 1, 2
+    ''')
+
+
+def reconstruir_ventas_diarias(conn):
+    """Recalcula ventas_diarias desde cero a partir de facturas."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _reconstruir_ventas_diarias(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute('SELECT COUNT(*) FROM ventas_diarias').fetchone()[0]
+
+
+@app.cli.command('rebuild-ventas-diarias')
+def rebuild_ventas_diarias_command():
+    """Reconstruye el acumulado diario de ventas (conviene correrlo después de backfill-ganancias)."""
+    with app.app_context():
+        filas = reconstruir_ventas_diarias(get_db_connection())
+    print(f"ventas_diarias reconstruida: {filas} filas.")
+
+
+@app.cli.command('backfill-ganancias')
+def backfill_ganancias_command():
+    """Calcula ganancia y método de pago de las facturas que no los tienen."""
+    with app.app_context():
+        actualizadas = backfill_ganancias(get_db_connection())
+    print(f"Facturas actualizadas: {actualizadas}")
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Actualiza el esquema de la base de datos a la última versión."""
+    anterior, actual = migrar_base()
+    if anterior == actual:
+        print(f"La base ya está en la versión {actual}.")
+    else:
+        print(f"Base migrada de la versión {anterior} a la {actual}.")
+
+
+def rango_dia(dia):
+    """Devuelve (inicio, fin) para filtrar `fecha >= inicio AND fecha < fin` usando el índice.
+
+    `dia` es un date/datetime o un string 'YYYY-MM-DD'. Reemplaza a `DATE(fecha) = ?`,
+    que obliga a recorrer toda la tabla.
+    """
+    if isinstance(dia, str):
+        dia = datetime.strptime(dia[:10], "%Y-%m-%d")
+    inicio = dia.strftime("%Y-%m-%d")
+    fin = (dia + timedelta(days=1)).strftime("%Y-%m-%d")
+    return inicio, fin
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+#----------------------------------------------------- Cola de tareas ------------------------------------------------------
+# Trabajo lento que no tiene que demorar la respuesta (archivos, impresión, recálculos).
+# Las tareas se guardan en la tabla `tareas`, así que sobreviven a un reinicio y se pueden
+# encolar dentro de la misma transacción que las origina. Cada proceso levanta unos pocos
+# hilos que las reclaman de a una; si fallan se reintentan con espera creciente.
+
+TAREAS = {}
+TAREAS_PERIODICAS = {}              # tipo -> clave de app.config con los segundos entre ejecuciones
+TAREAS_ESPERA_SEGUNDOS = 2          # cada cuánto se revisa la tabla si nadie avisa
+TAREAS_EN_CURSO_VENCIDAS = 600      # una tarea 'en_curso' más vieja quedó de un proceso que murió
+
+
+def tarea(tipo, cada=None):
+    """Registra la función que ejecuta las tareas de ese tipo. Recibe el dict `datos`.
+
+    Con `cada` (clave de app.config en segundos) la tarea es periódica: al terminar,
+    bien o agotando los reintentos, se vuelve a encolar para dentro de ese intervalo.
+    """
+    def registrar(funcion):
+        TAREAS[tipo] = funcion
+        if cada:
+            TAREAS_PERIODICAS[tipo] = cada
+        return funcion
+    return registrar
+
+
+def _ahora(desfase=0):
+    return (datetime.now() + timedelta(seconds=desfase)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+_aviso_tareas = threading.Event()
+_hilos_tareas = []
+_hilos_tareas_lock = threading.Lock()
+
+
+def encolar_tarea(conn, tipo, datos=None, max_intentos=3, demora=0):
+    """Agrega una tarea y devuelve su id.
+
+    Si `conn` ya está en una transacción, la tarea queda dentro de ella (se encola
+    solo si el commit del llamador prospera); si no, se hace commit acá.
+    """
+    if tipo not in TAREAS:
+        raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+    en_transaccion = conn.in_transaction
+    ahora = _ahora()
+    cursor = conn.execute('''INSERT INTO tareas (tipo, datos, max_intentos, ejecutar_desde, creada_en, actualizada_en)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          (tipo, json.dumps(datos or {}), max_intentos, _ahora(demora), ahora, ahora))
+    if not en_transaccion:
+        conn.commit()
+    _iniciar_hilos_tareas()
+    _aviso_tareas.set()
+    return cursor.lastrowid
+
+
+def _reclamar_tarea(conn):
+    """Marca como 'en_curso' la próxima tarea vencida y la devuelve (o None)."""
+    # Con la cola vacía alcanza con una lectura: no se toma el lock de escritura en cada vuelta
+    hay_vencida = conn.execute("SELECT 1 FROM tareas WHERE estado = 'pendiente' AND ejecutar_desde <= ? LIMIT 1",
+                               (_ahora(),)).fetchone()
+    if hay_vencida is None:
+        return None
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        fila = conn.execute('''SELECT * FROM tareas WHERE estado = 'pendiente' AND ejecutar_desde <= ?
+                               ORDER BY ejecutar_desde, id_tarea LIMIT 1''', (_ahora(),)).fetchone()
+        if fila:
+            conn.execute("UPDATE tareas SET estado = 'en_curso', intentos = intentos + 1, actualizada_en = ? WHERE id_tarea = ?",
+                         (_ahora(), fila['id_tarea']))
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return fila
+
+
+def _ejecutar_tarea(conn, fila):
+    terminada = True
+    try:
+        TAREAS[fila['tipo']](json.loads(fila['datos']))
     except Exception as e:
-        print(f"Error creando tabla facturas_proveedores: {e}")
-    finally:
-        conn.close()
+        if conn.in_transaction:
+            conn.rollback()
+        intentos = fila['intentos'] + 1
+        if intentos >= fila['max_intentos']:
+            conn.execute("UPDATE tareas SET estado = 'fallida', error = ?, actualizada_en = ? WHERE id_tarea = ?",
+                         (repr(e), _ahora(), fila['id_tarea']))
+        else:
+            terminada = False
+            # 2, 4, 8... segundos entre intentos
+            conn.execute("UPDATE tareas SET estado = 'pendiente', error = ?, ejecutar_desde = ?, actualizada_en = ? WHERE id_tarea = ?",
+                         (repr(e), _ahora(2 ** intentos), _ahora(), fila['id_tarea']))
+        log_evento(logging.ERROR, 'tarea_fallida', id_tarea=fila['id_tarea'], tipo=fila['tipo'],
+                   intento=intentos, error=repr(e))
+    else:
+        conn.execute("UPDATE tareas SET estado = 'hecha', error = NULL, actualizada_en = ? WHERE id_tarea = ?",
+                     (_ahora(), fila['id_tarea']))
+    if terminada and fila['tipo'] in TAREAS_PERIODICAS:
+        # Misma transacción que el cierre: la próxima queda encolada si y solo si esta terminó
+        encolar_tarea(conn, fila['tipo'], demora=app.config[TAREAS_PERIODICAS[fila['tipo']]])
+    conn.commit()
+
+
+def programar_tareas_periodicas(conn):
+    """Encola ya las tareas periódicas que no tienen una ejecución pendiente ni en curso."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for tipo in TAREAS_PERIODICAS:
+            activa = conn.execute("SELECT 1 FROM tareas WHERE tipo = ? AND estado IN ('pendiente', 'en_curso') LIMIT 1",
+                                  (tipo,)).fetchone()
+            if activa is None:
+                encolar_tarea(conn, tipo)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
 
-# Asegurarse de que la tabla exista al iniciar
-ensure_facturas_proveedores_table()
+def ejecutar_tareas_pendientes(limite=None):
+    """Corre en este hilo las tareas vencidas hasta vaciar la cola. Devuelve cuántas ejecutó."""
+    ejecutadas = 0
+    with app.app_context():
+        conn = get_db_connection()
+        while limite is None or ejecutadas < limite:
+            fila = _reclamar_tarea(conn)
+            if fila is None:
+                break
+            _ejecutar_tarea(conn, fila)
+            ejecutadas += 1
+    return ejecutadas
+
+
+def recuperar_tareas_colgadas(conn):
+    """Devuelve a 'pendiente' las tareas que quedaron 'en_curso' de un proceso que se cortó."""
+    cursor = conn.execute("UPDATE tareas SET estado = 'pendiente', actualizada_en = ? WHERE estado = 'en_curso' AND actualizada_en < ?",
+                          (_ahora(), _ahora(-TAREAS_EN_CURSO_VENCIDAS)))
+    conn.commit()
+    return cursor.rowcount
 
 
-def ensure_detalle_factura_metodo_column():
-    """Asegura que la columna metodo_pago exista en detalle_factura."""
-    conn = get_db_connection()
+def _bucle_tareas():
     try:
-        # Intentamos seleccionar la columna; si falla, alteramos la tabla
-        try:
-            conn.execute('SELECT metodo_pago FROM detalle_factura LIMIT 1').fetchall()
-        except Exception:
-            conn.execute('ALTER TABLE detalle_factura ADD COLUMN metodo_pago TEXT')
-            conn.commit()
+        with app.app_context():
+            programar_tareas_periodicas(get_db_connection())
     except Exception as e:
-        print(f"Error asegurando columna metodo_pago: {e}")
+        log_evento(logging.ERROR, 'error_hilo_tareas', error=repr(e))
+    while True:
+        _aviso_tareas.wait(TAREAS_ESPERA_SEGUNDOS)
+        _aviso_tareas.clear()
+        try:
+            while ejecutar_tareas_pendientes(limite=10):
+                pass
+        except Exception as e:
+            log_evento(logging.ERROR, 'error_hilo_tareas', error=repr(e))
+
+
+def _iniciar_hilos_tareas():
+    if not app.config['TAREAS_EN_SEGUNDO_PLANO']:
+        return
+    with _hilos_tareas_lock:
+        if _hilos_tareas:
+            return
+        for numero in range(app.config['TAREAS_HILOS']):
+            hilo = threading.Thread(target=_bucle_tareas, name=f'tareas-{numero}', daemon=True)
+            hilo.start()
+            _hilos_tareas.append(hilo)
+
+
+@app.cli.command('worker')
+@click.option('--una-vez', is_flag=True, help='Procesa lo pendiente y termina.')
+def worker_command(una_vez):
+    """Procesa la cola de tareas en primer plano."""
+    with app.app_context():
+        conn = get_db_connection()
+        recuperadas = recuperar_tareas_colgadas(conn)
+        programar_tareas_periodicas(conn)
+    if recuperadas:
+        print(f"Tareas recuperadas: {recuperadas}")
+    while True:
+        ejecutadas = ejecutar_tareas_pendientes()
+        if una_vez:
+            print(f"Tareas ejecutadas: {ejecutadas}")
+            return
+        _aviso_tareas.wait(TAREAS_ESPERA_SEGUNDOS)
+
+
+@app.route('/api/tareas', methods=['GET'])
+def api_tareas():
+    """Cantidad de tareas por tipo y estado, y las últimas fallidas."""
+    conn = get_db_connection()
+    try:
+        resumen = conn.execute('SELECT tipo, estado, COUNT(*) as cantidad FROM tareas GROUP BY tipo, estado').fetchall()
+        fallidas = conn.execute('''SELECT id_tarea, tipo, intentos, error, actualizada_en FROM tareas
+                                   WHERE estado = 'fallida' ORDER BY id_tarea DESC LIMIT 20''').fetchall()
     finally:
         conn.close()
+    return jsonify({'resumen': [dict(r) for r in resumen], 'fallidas': [dict(r) for r in fallidas]})
 
 
-# Aseguramos la columna al iniciar
-ensure_detalle_factura_metodo_column()
-
-
-def ensure_producto_codigo_column():
-    """Asegura que la columna codigo_barras exista en la tabla productos."""
+@app.route('/api/tareas/<int:id_tarea>', methods=['GET'])
+def api_tarea(id_tarea):
     conn = get_db_connection()
     try:
-        try:
-            conn.execute('SELECT codigo_barras FROM productos LIMIT 1').fetchall()
-        except Exception:
-            conn.execute('ALTER TABLE productos ADD COLUMN codigo_barras TEXT')
-            conn.commit()
-    except Exception as e:
-        print(f"Error asegurando columna codigo_barras: {e}")
+        fila = conn.execute('''SELECT id_tarea, tipo, estado, intentos, max_intentos, error, creada_en, actualizada_en
+                               FROM tareas WHERE id_tarea = ?''', (id_tarea,)).fetchone()
     finally:
         conn.close()
+    if not fila:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(dict(fila))
 
 
-# Aseguramos la columna al iniciar
-ensure_producto_codigo_column()
+#----------------------------------------------------- Archivos de proveedores ------------------------------------------------------
+# Los PDFs se guardan por contenido: el nombre es el SHA-256 (<hash>.pdf) dentro de una
+# subcarpeta con los dos primeros caracteres. Dos facturas con el mismo PDF comparten el
+# archivo, así que borrar una factura no puede borrar el archivo directamente: eso lo hace
+# una tarea en segundo plano después de verificar que nadie más lo referencia.
 
+BLOQUE_ARCHIVO = 64 * 1024
+_NOMBRE_CONTENIDO = re.compile(r'^[0-9a-f]{64}\.pdf$')
 
-def ensure_codigo_barras_unique_index():
-    """Crea un índice único sobre codigo_barras para prevenir duplicados (permite NULLs)."""
-    conn = get_db_connection()
+
+class ArchivoError(Exception):
+    """Archivo subido inválido (demasiado grande, vacío...)."""
+
+
+@app.errorhandler(413)
+def _request_demasiado_grande(e):
+    """Request por encima de MAX_CONTENT_LENGTH: se rechaza sin haber leído el cuerpo."""
+    mensaje = f"El envío supera el máximo de {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB."
+    if request.path.startswith('/api/'):
+        return jsonify({'error': mensaje}), 413
+    flash(mensaje, 'danger')
+    return redirect(request.referrer or url_for('dashboard'))
+
+
+def ruta_archivo(archivo, carpeta=None):
+    """Ruta en disco de un valor de la columna `archivo` (direccionado por contenido o nombre viejo)."""
+    carpeta = carpeta or app.config['UPLOAD_FOLDER']
+    if _NOMBRE_CONTENIDO.match(archivo):
+        return os.path.join(carpeta, archivo[:2], archivo)
+    # Archivos subidos antes de guardar por hash: prov_<id>_<timestamp>.pdf en la raíz
+    return os.path.join(carpeta, os.path.basename(archivo))
+
+
+def guardar_pdf(file):
+    """Guarda el archivo subido leyéndolo de a bloques y devuelve su nombre '<sha256>.pdf'."""
+    carpeta = app.config['UPLOAD_FOLDER']
+    limite = app.config['PDF_MAX_BYTES']
+    sha = hashlib.sha256()
+    tamano = 0
+    fd, temporal = tempfile.mkstemp(dir=carpeta, suffix='.part')
     try:
-        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_codigo_barras ON productos(codigo_barras)')
-        conn.commit()
-    except Exception as e:
-        print(f"Error creando índice único codigo_barras: {e}")
+        with os.fdopen(fd, 'wb') as destino:
+            while True:
+                bloque = file.stream.read(BLOQUE_ARCHIVO)
+                if not bloque:
+                    break
+                tamano += len(bloque)
+                if tamano > limite:
+                    raise ArchivoError(f'El archivo supera el máximo de {limite // (1024 * 1024)} MB.')
+                sha.update(bloque)
+                destino.write(bloque)
+        if tamano == 0:
+            raise ArchivoError('El archivo está vacío.')
+
+        archivo = sha.hexdigest() + '.pdf'
+        final = ruta_archivo(archivo, carpeta)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        if os.path.exists(final):
+            # Mismo contenido ya guardado: se descarta la copia y se "toca" el existente
+            # para que el limpiador no lo borre mientras se registra la nueva referencia
+            os.utime(final)
+        else:
+            os.replace(temporal, final)
+        return archivo
     finally:
-        conn.close()
+        if os.path.exists(temporal):
+            os.remove(temporal)
 
 
-# Aseguramos el índice al iniciar
-ensure_codigo_barras_unique_index()
+def _archivo_referenciado(conn, archivo):
+    return conn.execute('SELECT 1 FROM facturas_proveedores WHERE archivo = ? LIMIT 1', (archivo,)).fetchone() is not None
 
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def _borrar_si_huerfano(conn, carpeta, archivo, gracia):
+    path = ruta_archivo(archivo, carpeta)
+    try:
+        if time.time() - os.path.getmtime(path) < gracia:
+            return False
+    except FileNotFoundError:
+        return False
+    if _archivo_referenciado(conn, archivo):
+        return False
+    os.remove(path)
+    return True
+
+
+@tarea('borrar_archivo')
+def _tarea_borrar_archivo(datos):
+    conn = get_db_connection()
+    _borrar_si_huerfano(conn, datos['carpeta'], datos['archivo'], datos['gracia'])
+
+
+def programar_borrado_archivo(conn, archivo):
+    """Encola el borrado del archivo si queda sin referencias (no bloquea el request)."""
+    if not archivo:
+        return
+    # Un nombre viejo es único por factura: se puede borrar sin esperar
+    gracia = app.config['ARCHIVOS_GRACIA_SEGUNDOS'] if _NOMBRE_CONTENIDO.match(archivo) else 0
+    encolar_tarea(conn, 'borrar_archivo', {'carpeta': app.config['UPLOAD_FOLDER'], 'archivo': archivo, 'gracia': gracia})
+
+
+def limpiar_archivos_huerfanos(conn, carpeta=None, gracia=None):
+    """Borra los PDFs que ninguna factura referencia (y restos .part de subidas cortadas)."""
+    carpeta = carpeta or app.config['UPLOAD_FOLDER']
+    gracia = app.config['ARCHIVOS_GRACIA_SEGUNDOS'] if gracia is None else gracia
+    borrados = 0
+    for raiz, _, nombres in os.walk(carpeta):
+        for nombre in nombres:
+            path = os.path.join(raiz, nombre)
+            if nombre.endswith('.part'):
+                if time.time() - os.path.getmtime(path) >= gracia:
+                    os.remove(path)
+                    borrados += 1
+            elif nombre.endswith('.pdf') and _borrar_si_huerfano(conn, carpeta, nombre, gracia):
+                borrados += 1
+    return borrados
+
+
+@tarea('limpiar_huerfanos', cada='ARCHIVOS_LIMPIEZA_SEGUNDOS')
+def _tarea_limpiar_huerfanos(datos):
+    borrados = limpiar_archivos_huerfanos(get_db_connection())
+    if borrados:
+        log_evento(logging.INFO, 'archivos_huerfanos_borrados', cantidad=borrados)
+
+
+@app.cli.command('limpiar-archivos')
+def limpiar_archivos_command():
+    """Borra los PDFs de proveedores que no referencia ninguna factura."""
+    with app.app_context():
+        borrados = limpiar_archivos_huerfanos(get_db_connection())
+    print(f"Archivos borrados: {borrados}")
+
+
+#----------------------------------------------------- Catálogo en memoria ------------------------------------------------------
+
+def sin_acentos(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _tokens(texto):
+    return re.findall(r'\w+', sin_acentos(texto).lower())
+
+
+class CatalogoCache:
+    """Copia en memoria de los productos para lecturas de código de barras y búsqueda
+    (la búsqueda solo se usa si la base no tiene productos_fts).
+
+    - `por_codigo`: dict codigo_barras -> id_producto
+    - `por_token`: dict palabra -> ids, más la lista ordenada de palabras para buscar por prefijo
+
+    Se carga completo la primera vez y se mantiene con refrescar()/quitar() cuando
+    cambia un producto o se vende. Como cada proceso tiene su propia copia, además
+    se recarga entera cuando pasa CATALOGO_CACHE_TTL.
+    """
+
+    COLUMNAS = 'id_producto, descripcion, precio, stock, codigo_barras'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self._limpiar()
+
+    def _limpiar(self):
+        self.productos = {}
+        self.por_codigo = {}
+        self.por_token = {}
+        self._tokens_ordenados = []
+        self.db_path = None
+        self.cargado_en = None
+
+    def _vigente(self, db_path):
+        if self.cargado_en is None or self.db_path != db_path:
+            return False
+        return time.monotonic() - self.cargado_en < app.config['CATALOGO_CACHE_TTL']
+
+    def _agregar(self, producto):
+        id_producto = producto['id_producto']
+        self.productos[id_producto] = producto
+        if producto['codigo_barras']:
+            self.por_codigo[producto['codigo_barras']] = id_producto
+        for token in set(_tokens(producto['descripcion'])):
+            ids = self.por_token.get(token)
+            if ids is None:
+                ids = self.por_token[token] = set()
+                bisect.insort(self._tokens_ordenados, token)
+            ids.add(id_producto)
+
+    def _sacar(self, id_producto):
+        producto = self.productos.pop(id_producto, None)
+        if producto is None:
+            return
+        if producto['codigo_barras'] and self.por_codigo.get(producto['codigo_barras']) == id_producto:
+            del self.por_codigo[producto['codigo_barras']]
+        for token in set(_tokens(producto['descripcion'])):
+            ids = self.por_token.get(token)
+            if ids is None:
+                continue
+            ids.discard(id_producto)
+            if not ids:
+                del self.por_token[token]
+                pos = bisect.bisect_left(self._tokens_ordenados, token)
+                del self._tokens_ordenados[pos]
+
+    def _asegurar_cargado(self, conn):
+        db_path = app.config['DATABASE']
+        if self._vigente(db_path):
+            return True
+        self._limpiar()
+        for row in conn.execute(f'SELECT {self.COLUMNAS} FROM productos'):
+            self._agregar(dict(row))
+        self.db_path = db_path
+        self.cargado_en = time.monotonic()
+        return False
+
+    def por_codigo_barras(self, conn, codigo):
+        """Producto (dict) con ese código o None."""
+        with self._lock:
+            vigente = self._asegurar_cargado(conn)
+            id_producto = self.por_codigo.get(codigo)
+            if id_producto is not None and vigente:
+                self.hits += 1
+                return dict(self.productos[id_producto])
+            self.misses += 1
+            if id_producto is not None:
+                return dict(self.productos[id_producto])
+            # Puede haberlo dado de alta otro proceso: confirmamos contra la base
+            row = conn.execute(f'SELECT {self.COLUMNAS} FROM productos WHERE codigo_barras = ?', (codigo,)).fetchone()
+            if row is None:
+                return None
+            self._sacar(row['id_producto'])
+            self._agregar(dict(row))
+            return dict(row)
+
+    def buscar(self, conn, q, limite=20):
+        """Productos con stock cuyas palabras empiezan con cada palabra de `q`."""
+        with self._lock:
+            if self._asegurar_cargado(conn):
+                self.hits += 1
+            else:
+                self.misses += 1
+            candidatos = None
+            for token in _tokens(q):
+                encontrados = set()
+                pos = bisect.bisect_left(self._tokens_ordenados, token)
+                while pos < len(self._tokens_ordenados) and self._tokens_ordenados[pos].startswith(token):
+                    encontrados |= self.por_token[self._tokens_ordenados[pos]]
+                    pos += 1
+                candidatos = encontrados if candidatos is None else candidatos & encontrados
+                if not candidatos:
+                    return []
+            ids = self.productos.keys() if candidatos is None else candidatos
+            resultado = []
+            for id_producto in sorted(ids):
+                producto = self.productos[id_producto]
+                if producto['stock'] > 0:
+                    resultado.append(dict(producto))
+                    if len(resultado) == limite:
+                        break
+            return resultado
+
+    def refrescar(self, conn, ids):
+        """Vuelve a leer esos productos de la base (alta, edición o cambio de stock)."""
+        ids = list(ids)
+        with self._lock:
+            if not ids or not self._vigente(app.config['DATABASE']):
+                return
+            marcas = ','.join('?' * len(ids))
+            rows = conn.execute(f'SELECT {self.COLUMNAS} FROM productos WHERE id_producto IN ({marcas})', ids).fetchall()
+            for id_producto in ids:
+                self._sacar(id_producto)
+            for row in rows:
+                self._agregar(dict(row))
+
+    def quitar(self, id_producto):
+        with self._lock:
+            self._sacar(id_producto)
+
+    def invalidar(self):
+        with self._lock:
+            self._limpiar()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'productos': len(self.productos),
+                'codigos': len(self.por_codigo),
+                'tokens': len(self.por_token),
+                'cargado': self.cargado_en is not None,
+            }
+
+
+catalogo_cache = CatalogoCache()
+
+
+_tablas_fts = {}
+
+
+def tiene_busqueda_fts(conn):
+    """Si la base tiene productos_fts (depende de que SQLite traiga FTS5 al migrar)."""
+    db_path = app.config['DATABASE']
+    if db_path not in _tablas_fts:
+        _tablas_fts[db_path] = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'productos_fts'").fetchone() is not None
+    return _tablas_fts[db_path]
+
+
+def buscar_productos_fts(conn, q, limite=20):
+    """Productos con stock que tienen palabras que empiezan con cada palabra de `q`, los más relevantes primero."""
+    # Cada palabra como prefijo entre comillas: "azu"* "lim"* (AND implícito)
+    consulta = ' '.join(f'"{token}"*' for token in _tokens(q))
+    if not consulta:
+        return []
+    rows = conn.execute('''
+        SELECT p.id_producto, p.descripcion, p.precio, p.stock, p.codigo_barras
+        FROM productos_fts
+        JOIN productos p ON p.id_producto = productos_fts.rowid
+        WHERE productos_fts MATCH ? AND p.stock > 0
+        ORDER BY productos_fts.rank
+        LIMIT ?
+    ''', (consulta, limite)).fetchall()
+    return [dict(r) for r in rows]
+
+
+# Los buscadores de la pantalla de ventas devuelven pocas filas y se pueden cachear
+# unos segundos en el navegador: tipear, borrar y volver a tipear no vuelve a pedir.
+BUSQUEDA_LIMITE = 20
+BUSQUEDA_LIMITE_MAX = 50
+CACHE_BUSQUEDA_PRODUCTOS = 10   # segundos; muestran stock, así que poco
+CACHE_BUSQUEDA_CLIENTES = 60
+
+
+def _limite_busqueda():
+    try:
+        return max(1, min(int(request.args.get('limite', BUSQUEDA_LIMITE)), BUSQUEDA_LIMITE_MAX))
+    except ValueError:
+        return BUSQUEDA_LIMITE
+
+
+def _respuesta_cacheable(datos, segundos):
+    response = jsonify(datos)
+    response.cache_control.private = True
+    response.cache_control.max_age = segundos
+    return response
 
 
 @app.route('/api/productos/search', methods=['GET'])
 def api_productos_search():
     q = request.args.get('q', '').strip()
+    limite = _limite_busqueda()
     conn = get_db_connection()
     try:
-        if q:
-            rows = conn.execute("SELECT id_producto, descripcion, precio, stock, codigo_barras FROM productos WHERE descripcion LIKE ? AND stock > 0 LIMIT 20", ('%'+q+'%',)).fetchall()
+        if _tokens(q) and tiene_busqueda_fts(conn):
+            productos = buscar_productos_fts(conn, q, limite)
         else:
-            rows = conn.execute("SELECT id_producto, descripcion, precio, stock, codigo_barras FROM productos WHERE stock > 0 LIMIT 20").fetchall()
-        productos = [dict(r) for r in rows]
+            productos = catalogo_cache.buscar(conn, q, limite)
     except Exception as e:
-        productos = []
-        print(f"Error en api_productos_search: {e}")
+        log_evento(logging.ERROR, 'error', endpoint='api_productos_search', error=repr(e))
+        return jsonify([])
     finally:
         conn.close()
 
-    return jsonify(productos)
+    return _respuesta_cacheable(productos, CACHE_BUSQUEDA_PRODUCTOS)
 
 
 @app.route('/api/productos/by_codigo/<codigo>', methods=['GET'])
@@ -156,23 +1516,62 @@ def api_productos_by_codigo(codigo):
     codigo = codigo.strip()
     conn = get_db_connection()
     try:
-        row = conn.execute("SELECT id_producto, descripcion, precio, stock, codigo_barras FROM productos WHERE codigo_barras = ?", (codigo,)).fetchone()
-        if not row:
+        producto = catalogo_cache.por_codigo_barras(conn, codigo)
+        if not producto:
             return jsonify({'error': 'not found'}), 404
-        producto = dict(row)
     except Exception as e:
-        print(f"Error en api_productos_by_codigo: {e}")
+        log_evento(logging.ERROR, 'error', endpoint='api_productos_by_codigo', error=repr(e))
         return jsonify({'error': 'server error'}), 500
     finally:
         conn.close()
 
-    return jsonify(producto)
+    return _respuesta_cacheable(producto, CACHE_BUSQUEDA_PRODUCTOS)
+
+
+@app.route('/api/productos/cache', methods=['GET'])
+def api_productos_cache():
+    """Contadores de aciertos/fallos del catálogo en memoria de este proceso."""
+    return jsonify(catalogo_cache.estadisticas())
 
 #----------------------------------------------------- Funciones dashboard ------------------------------------------------------
+
+class CacheTTL:
+    """Diccionario en memoria cuyas entradas vencen a los segundos de app.config[`clave_ttl`]."""
+
+    def __init__(self, clave_ttl):
+        self.clave_ttl = clave_ttl
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or time.monotonic() - entrada[0] >= app.config[self.clave_ttl]:
+                return None
+            return entrada[1]
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic(), valor)
+
+    def invalidar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+# Varios usuarios refrescando el dashboard comparten el mismo resultado por unos segundos.
+# Se invalida al registrar una venta; el resto de los cambios aparece al vencer.
+dashboard_cache = CacheTTL('DASHBOARD_CACHE_TTL')
+
+
 def get_dashboard_data():
     """Obtiene datos reales para el dashboard"""
-    conn = get_db_connection()
-    
+    inicio, fin = rango_dia(datetime.now())
+    clave = ('stats', app.config['DATABASE'], inicio)
+    stats = dashboard_cache.get(clave)
+    if stats is not None:
+        return dict(stats)
+
     stats = {
         'ventas_hoy': 0,
         'total_dia': 0,
@@ -180,40 +1579,37 @@ def get_dashboard_data():
         'stock_bajo': 0,
         'total_clientes': 0
     }
-    
+
+    conn = get_db_connection()
     try:
-        # Contar clientes totales
-        stats['total_clientes'] = conn.execute('SELECT COUNT(*) as count FROM clientes').fetchone()['count']
-        
-        # Productos con stock
-        try:
-            stats['productos_stock'] = conn.execute('SELECT COUNT(*) as count FROM productos WHERE stock > 0').fetchone()['count']
-            stats['stock_bajo'] = conn.execute('SELECT COUNT(*) as count FROM productos WHERE stock <= 5 AND stock > 0').fetchone()['count']
-        except:
-            stats['productos_stock'] = 0
-            stats['stock_bajo'] = 0
-        
-        # Ventas del día
-        hoy = datetime.now().strftime("%Y-%m-%d")
-        stats['ventas_hoy'] = conn.execute('SELECT COUNT(*) as count FROM facturas WHERE DATE(fecha) = ?', (hoy,)).fetchone()['count']
-        stats['total_dia'] = conn.execute('SELECT SUM(total) as total FROM facturas WHERE DATE(fecha) = ?', (hoy,)).fetchone()['total']
-        if stats['total_dia'] is None:
-            stats['total_dia'] = 0
-        else:
-            stats['total_dia'] = round(stats['total_dia'], 2)
-            
+        # Una sola consulta; cada subconsulta resuelve con un índice (ventas del día desde ventas_diarias)
+        row = conn.execute('''
+            SELECT (SELECT COUNT(*) FROM clientes) as total_clientes,
+                   (SELECT COUNT(*) FROM productos WHERE stock > 0) as productos_stock,
+                   (SELECT COUNT(*) FROM productos WHERE stock <= 5 AND stock > 0) as stock_bajo,
+                   (SELECT IFNULL(SUM(cantidad_ventas), 0) FROM ventas_diarias WHERE fecha = ?) as ventas_hoy,
+                   (SELECT SUM(total) FROM ventas_diarias WHERE fecha = ?) as total_dia
+        ''', (inicio, inicio)).fetchone()
+        stats.update(dict(row))
+        stats['total_dia'] = round(stats['total_dia'] or 0, 2)
+        dashboard_cache.set(clave, dict(stats))
     except Exception as e:
-        print(f"Error obteniendo estadísticas: {e}")
+        log_evento(logging.ERROR, 'error', funcion='get_dashboard_data', error=repr(e))
     finally:
         conn.close()
-    
+
     return stats
 
 def get_productos_stock_bajo():
     """Obtiene productos con stock bajo"""
+    clave = ('stock_bajo', app.config['DATABASE'])
+    productos = dashboard_cache.get(clave)
+    if productos is not None:
+        return productos
+
     conn = get_db_connection()
     productos = []
-    
+
     try:
         query = '''
         SELECT descripcion, stock, 5 as stock_minimo,
@@ -227,9 +1623,10 @@ def get_productos_stock_bajo():
         ORDER BY stock ASC
         LIMIT 10
         '''
-        productos = conn.execute(query).fetchall()
+        productos = [dict(r) for r in conn.execute(query).fetchall()]
+        dashboard_cache.set(clave, productos)
     except Exception as e:
-        print(f"Error obteniendo productos con stock bajo: {e}")
+        log_evento(logging.ERROR, 'error', funcion='get_productos_stock_bajo', error=repr(e))
         productos = []
     finally:
         conn.close()
@@ -238,6 +1635,55 @@ def get_productos_stock_bajo():
 
 
 
+def ventas_por_dia(conn, desde, hasta):
+    """Totales por día entre `desde` y `hasta` (inclusive, 'YYYY-MM-DD'), sumando los métodos de pago."""
+    rows = conn.execute('''
+        SELECT fecha,
+               SUM(cantidad_ventas) as cantidad_ventas,
+               SUM(total) as total,
+               SUM(ganancia) as ganancia,
+               SUM(items) as items
+        FROM ventas_diarias
+        WHERE fecha >= ? AND fecha <= ?
+        GROUP BY fecha
+        ORDER BY fecha
+    ''', (desde, hasta)).fetchall()
+    return [dict(r) for r in rows]
+
+
+VENTAS_DIARIAS_DIAS_MAX = 366
+
+
+@app.route('/api/reportes/ventas_diarias', methods=['GET'])
+def api_ventas_diarias():
+    """Serie diaria de ventas; por defecto los últimos 7 días. Los días sin ventas vienen en cero."""
+    hoy = datetime.now()
+    try:
+        hasta = datetime.strptime(request.args.get('hasta') or hoy.strftime('%Y-%m-%d'), '%Y-%m-%d')
+        desde = datetime.strptime(request.args.get('desde') or (hasta - timedelta(days=6)).strftime('%Y-%m-%d'), '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'fecha inválida'}), 400
+    if desde > hasta:
+        return jsonify({'error': 'desde es posterior a hasta'}), 400
+    # La serie se arma día por día en memoria: un rango sin tope sería una respuesta sin tope
+    if (hasta - desde).days >= VENTAS_DIARIAS_DIAS_MAX:
+        return jsonify({'error': f'el rango no puede superar {VENTAS_DIARIAS_DIAS_MAX} días'}), 400
+
+    conn = get_db_connection()
+    try:
+        por_fecha = {r['fecha']: r for r in ventas_por_dia(conn, desde.strftime('%Y-%m-%d'), hasta.strftime('%Y-%m-%d'))}
+    finally:
+        conn.close()
+
+    serie = []
+    dia = desde
+    while dia <= hasta:
+        fecha = dia.strftime('%Y-%m-%d')
+        serie.append(por_fecha.get(fecha, {'fecha': fecha, 'cantidad_ventas': 0, 'total': 0, 'ganancia': 0, 'items': 0}))
+        dia += timedelta(days=1)
+    return jsonify(serie)
+
+
 #----------------------------------------------------- Autenticacion ------------------------------------------------------
 
 @app.route("/")
@@ -303,7 +1749,85 @@ def dashboard():
         flash("Debes iniciar sesión para acceder al dashboard.", "warning")
         return redirect(url_for("login"))
 #----------------------------------------------------- Proveedores ------------------------------------------------------
-# ...existing code...
+# cantidad_facturas y monto_adeudado de cada proveedor se ajustan en la misma transacción
+# que escribe facturas_proveedores, así el directorio no agrega facturas por proveedor.
+
+PROVEEDORES_POR_PAGINA = 50
+PROVEEDORES_POR_PAGINA_MAX = 500
+# orden pedido -> columna indexada (todas NOT NULL, la paginación compara (columna, id))
+ORDENES_PROVEEDORES = {'razon_social': 'razon_social_busqueda', 'monto_adeudado': 'monto_adeudado', 'id': 'id'}
+COLUMNAS_PROVEEDORES = ('id', 'razon_social', 'nombre_comercial', 'cuit', 'telefono', 'email', 'direccion_fiscal',
+                        'calle_numero', 'ciudad', 'provincia', 'codigo_postal', 'pais', 'contacto', 'condicion_pago',
+                        'estado', 'cantidad_facturas', 'monto_adeudado')
+
+
+def _acumular_factura_proveedor(conn, id_factura, signo):
+    """Suma (signo=1) o descuenta (signo=-1) la factura, tal como está guardada, de los acumulados de su proveedor.
+
+    Editar una factura es descontarla antes del UPDATE y sumarla después. Va dentro de
+    la transacción del handler: se lee la fila con el lock de escritura ya tomado.
+    """
+    conn.execute('''UPDATE proveedores
+                    SET cantidad_facturas = cantidad_facturas + ?,
+                        monto_adeudado = monto_adeudado + ? * (SELECT IFNULL(monto, 0) FROM facturas_proveedores WHERE id = ?)
+                    WHERE id = (SELECT id_proveedor FROM facturas_proveedores WHERE id = ?)''',
+                 (signo, signo, id_factura, id_factura))
+
+
+def _filtro_busqueda_proveedores(q):
+    """(condición, parámetros): por prefijo del CUIT si son solo dígitos y separadores,
+    si no por prefijo de la razón social o del nombre comercial (sin acentos ni mayúsculas)."""
+    digitos = solo_digitos(q)
+    if digitos and all(c.isdigit() or c in _SEPARADORES_DIGITOS for c in q):
+        return 'cuit_busqueda >= ? AND cuit_busqueda < ?', [digitos, _siguiente_prefijo(digitos)]
+    prefijo = normalizar_busqueda(q)
+    if not prefijo:
+        return None, []
+    hasta = _siguiente_prefijo(prefijo)
+    return ('((razon_social_busqueda >= ? AND razon_social_busqueda < ?)'
+            ' OR (nombre_comercial_busqueda >= ? AND nombre_comercial_busqueda < ?))'), [prefijo, hasta, prefijo, hasta]
+
+
+def buscar_proveedores(conn, texto=None, orden='razon_social', descendente=False, cursor=None,
+                       limite=PROVEEDORES_POR_PAGINA):
+    """Página del directorio de proveedores, con paginación por clave sobre (orden, id).
+
+    Devuelve (proveedores, cursor_siguiente); cursor_siguiente es None en la última página.
+    """
+    if orden not in ORDENES_PROVEEDORES:
+        raise ValueError(f'No se puede ordenar por {orden}')
+    condicion, params = _filtro_busqueda_proveedores(texto) if texto else (None, [])
+    return _pagina_por_clave(conn, 'proveedores', COLUMNAS_PROVEEDORES, ORDENES_PROVEEDORES[orden], 'id',
+                             [condicion] if condicion else [], params, cursor, descendente, limite)
+
+
+def reconstruir_saldos_proveedores(conn):
+    """Recalcula cantidad_facturas y monto_adeudado de todos los proveedores desde facturas_proveedores."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _reconstruir_saldos_proveedores(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute('SELECT COUNT(*) FROM proveedores').fetchone()[0]
+
+
+@app.cli.command('rebuild-saldos-proveedores')
+def rebuild_saldos_proveedores_command():
+    """Reconstruye la cantidad de facturas y el monto adeudado de cada proveedor."""
+    with app.app_context():
+        filas = reconstruir_saldos_proveedores(get_db_connection())
+    print(f"Saldos reconstruidos: {filas} proveedores.")
+
+
+@app.route('/api/proveedores', methods=['GET'])
+def api_proveedores():
+    """Directorio de proveedores: q (razón social, nombre comercial o CUIT), orden (con '-' descendente), limite y cursor."""
+    return _respuesta_directorio(buscar_proveedores, 'proveedores', 'razon_social',
+                                 PROVEEDORES_POR_PAGINA, PROVEEDORES_POR_PAGINA_MAX)
+
+
 @app.route('/dashboard/proveedores', methods=['GET', 'POST'])
 def gestion_proveedores():
     if "user" not in session:
@@ -311,9 +1835,6 @@ def gestion_proveedores():
         return redirect(url_for("login"))
 
     conn = get_db_connection()
-    # traer como lista de dict para que |tojson funcione en la plantilla
-    proveedores_rows = conn.execute('SELECT * FROM proveedores ORDER BY razon_social').fetchall()
-    proveedores = [dict(p) for p in proveedores_rows]
 
     if request.method == 'POST':
         # Campos del formulario / de la base de datos
@@ -367,11 +1888,13 @@ def gestion_proveedores():
             conn.rollback()
             flash(f'Error al guardar proveedor: {e}', 'danger')
         finally:
-            proveedores_rows = conn.execute('SELECT * FROM proveedores ORDER BY razon_social').fetchall()
-            proveedores = [dict(p) for p in proveedores_rows]
+            conn.close()
+        return redirect(url_for('gestion_proveedores'))
 
+    # Solo la primera página va embebida; la búsqueda y las siguientes las pide la página a /api/proveedores
+    proveedores, siguiente = buscar_proveedores(conn)
     conn.close()
-    return render_template('gestion_proveedores.html', proveedores=proveedores)
+    return render_template('gestion_proveedores.html', inicial={'proveedores': proveedores, 'siguiente': siguiente})
 
 
 @app.route('/dashboard/proveedores/<int:id>/facturas', methods=['GET', 'POST'])
@@ -400,12 +1923,12 @@ def proveedor_facturas(id):
         if 'archivo' in request.files:
             file = request.files['archivo']
             if file and file.filename != '' and allowed_file(file.filename):
-                # Generar nombre seguro único
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                filename = f"prov_{id}_{timestamp}.pdf"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                archivo = filename
+                try:
+                    archivo = guardar_pdf(file)
+                except ArchivoError as e:
+                    flash(str(e), 'danger')
+                    conn.close()
+                    return redirect(url_for('proveedor_facturas', id=id))
             elif file and file.filename != '':
                 flash('Formato de archivo no permitido. Solo PDF.', 'danger')
                 conn.close()
@@ -420,9 +1943,10 @@ def proveedor_facturas(id):
         creado_en = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         try:
-            conn.execute('''INSERT INTO facturas_proveedores (id_proveedor, numero, fecha, monto, descripcion, archivo, creado_en)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                         (id, numero if numero else None, fecha if fecha else None, monto_val, descripcion if descripcion else None, archivo, creado_en))
+            cursor = conn.execute('''INSERT INTO facturas_proveedores (id_proveedor, numero, fecha, monto, descripcion, archivo, creado_en)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                  (id, numero if numero else None, fecha if fecha else None, monto_val, descripcion if descripcion else None, archivo, creado_en))
+            _acumular_factura_proveedor(conn, cursor.lastrowid, 1)
             conn.commit()
             flash('Factura registrada correctamente.', 'success')
         except Exception as e:
@@ -444,13 +1968,18 @@ def descargar_factura(id):
         return redirect(url_for("login"))
 
     conn = get_db_connection()
-    f = conn.execute('SELECT archivo FROM facturas_proveedores WHERE id = ?', (id,)).fetchone()
+    f = conn.execute('SELECT archivo, numero FROM facturas_proveedores WHERE id = ?', (id,)).fetchone()
     conn.close()
-    if not f or not f['archivo']:
+    path = ruta_archivo(f['archivo']) if f and f['archivo'] else None
+    if not path or not os.path.exists(path):
         flash('Archivo no disponible', 'danger')
         return redirect(request.referrer or url_for('gestion_proveedores'))
 
-    return redirect(url_for('static', filename=f"uploads/proveedor_facturas/{f['archivo']}"))
+    # conditional=True responde 304 a If-None-Match y 206 a Range; con USE_X_SENDFILE lo manda el servidor web.
+    # Para archivos por contenido el hash es un ETag fuerte natural.
+    etag = f['archivo'][:64] if _NOMBRE_CONTENIDO.match(f['archivo']) else True
+    return send_file(path, mimetype='application/pdf', conditional=True, etag=etag, max_age=86400,
+                     download_name=f"factura_{f['numero'] or id}.pdf")
 
 
 @app.route('/dashboard/proveedores/facturas/eliminar/<int:id>', methods=['POST'])
@@ -467,13 +1996,10 @@ def eliminar_factura_proveedor(id):
         return redirect(url_for('gestion_proveedores'))
 
     try:
-        # borrar archivo si existe
-        if f['archivo']:
-            path = os.path.join(app.config['UPLOAD_FOLDER'], f['archivo'])
-            if os.path.exists(path):
-                os.remove(path)
-
+        _acumular_factura_proveedor(conn, id, -1)
         conn.execute('DELETE FROM facturas_proveedores WHERE id = ?', (id,))
+        # el archivo se borra en segundo plano si ninguna otra factura lo usa
+        programar_borrado_archivo(conn, f['archivo'])
         conn.commit()
         flash('Factura eliminada correctamente', 'success')
     except Exception as e:
@@ -509,16 +2035,12 @@ def editar_factura_proveedor(id):
     if 'archivo' in request.files:
         file = request.files['archivo']
         if file and file.filename != '' and allowed_file(file.filename):
-            # eliminar archivo viejo si existe
-            if archivo:
-                old_path = os.path.join(app.config['UPLOAD_FOLDER'], archivo)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"prov_{f['id_proveedor']}_{timestamp}.pdf"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            archivo = filename
+            try:
+                archivo = guardar_pdf(file)
+            except ArchivoError as e:
+                flash(str(e), 'danger')
+                conn.close()
+                return redirect(url_for('proveedor_facturas', id=f['id_proveedor']))
         elif file and file.filename != '':
             flash('Formato de archivo no permitido. Solo PDF.', 'danger')
             conn.close()
@@ -530,8 +2052,12 @@ def editar_factura_proveedor(id):
         monto_val = None
 
     try:
+        _acumular_factura_proveedor(conn, id, -1)
         conn.execute('''UPDATE facturas_proveedores SET numero = ?, fecha = ?, monto = ?, descripcion = ?, archivo = ? WHERE id = ?''',
                      (numero if numero else None, fecha if fecha else None, monto_val, descripcion if descripcion else None, archivo, id))
+        _acumular_factura_proveedor(conn, id, 1)
+        if f['archivo'] and f['archivo'] != archivo:
+            programar_borrado_archivo(conn, f['archivo'])
         conn.commit()
         flash('Factura actualizada correctamente', 'success')
     except Exception as e:
@@ -570,18 +2096,123 @@ def eliminar_proveedor(id):
 
 #----------------------------------------------------- Clientes ------------------------------------------------------
 
-@app.route('/dashboard/clientes', methods=['GET'])
-def gestion_clientes():
-    conn = get_db_connection()
-    clientes = conn.execute('SELECT * FROM clientes').fetchall()
-    conn.close()
-    return render_template('gestion_clientes.html', clientes=clientes)
+CLIENTES_POR_PAGINA = 50
+CLIENTES_POR_PAGINA_MAX = 500
+# orden pedido -> columna indexada (todas NOT NULL, la paginación compara (columna, id_cliente))
+ORDENES_CLIENTES = {'nombre': 'nombre_busqueda', 'total_compras': 'total_compras', 'id_cliente': 'id_cliente'}
+COLUMNAS_CLIENTES = ('id_cliente', 'nombre', 'email', 'telefono', 'direccion',
+                     'cantidad_compras', 'total_compras', 'ultima_compra')
 
-@app.route('/dashboard/clientes/agregar_clientes', methods=['GET', 'POST'])
-def agregar_clientes():
-    if request.method == 'POST':
-        nombre = request.form['nombre']
-        email = request.form['email']
+
+def solo_digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+
+def _filtro_busqueda_clientes(q):
+    """(condición, parámetros) para buscar clientes por prefijo, cada forma de `q` con su índice.
+
+    Con '@' busca por email; si son solo dígitos y separadores, por teléfono (y por id
+    si es un número); si no, por nombre, sin distinguir mayúsculas ni acentos.
+    """
+    if '@' in q:
+        prefijo = q.lower()
+        return 'lower(email) >= ? AND lower(email) < ?', [prefijo, _siguiente_prefijo(prefijo)]
+    digitos = solo_digitos(q)
+    if digitos and all(c.isdigit() or c in _SEPARADORES_DIGITOS for c in q):
+        condicion = '(telefono_busqueda >= ? AND telefono_busqueda < ?)'
+        params = [digitos, _siguiente_prefijo(digitos)]
+        if q.isdigit():
+            try:
+                params.insert(0, _entero_sqlite(q))
+                condicion = f'(id_cliente = ? OR {condicion})'
+            except ValueError:
+                pass  # no entra en un INTEGER: no puede ser un id, queda solo el teléfono
+        return condicion, params
+    prefijo = normalizar_busqueda(q)
+    if not prefijo:
+        return None, []
+    return 'nombre_busqueda >= ? AND nombre_busqueda < ?', [prefijo, _siguiente_prefijo(prefijo)]
+
+
+def buscar_clientes(conn, q, limite=BUSQUEDA_LIMITE):
+    """Clientes cuyo nombre, teléfono o email empieza con `q`, o el de ese id si `q` es un número."""
+    condicion, params = _filtro_busqueda_clientes(q)
+    if not condicion:
+        return []
+    rows = conn.execute(f"""SELECT id_cliente, nombre, email, telefono FROM clientes
+                            WHERE {condicion}
+                            ORDER BY nombre_busqueda, id_cliente
+                            LIMIT ?""", params + [limite]).fetchall()
+    return [dict(r) for r in rows]
+
+
+def buscar_clientes_directorio(conn, texto=None, orden='nombre', descendente=False, cursor=None,
+                               limite=CLIENTES_POR_PAGINA):
+    """Página del directorio de clientes, con paginación por clave sobre (orden, id_cliente).
+
+    `texto` filtra como buscar_clientes(). Los acumulados de compras vienen de la propia
+    fila (los mantiene registrar_venta), sin tocar facturas. Devuelve (clientes, cursor_siguiente).
+    """
+    if orden not in ORDENES_CLIENTES:
+        raise ValueError(f'No se puede ordenar por {orden}')
+    condicion, params = _filtro_busqueda_clientes(texto) if texto else (None, [])
+    return _pagina_por_clave(conn, 'clientes', COLUMNAS_CLIENTES, ORDENES_CLIENTES[orden], 'id_cliente',
+                             [condicion] if condicion else [], params, cursor, descendente, limite)
+
+
+def reconstruir_compras_clientes(conn):
+    """Recalcula cantidad_compras, total_compras y ultima_compra de todos los clientes desde facturas."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _reconstruir_compras_clientes(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute('SELECT COUNT(*) FROM clientes').fetchone()[0]
+
+
+@app.cli.command('rebuild-compras-clientes')
+def rebuild_compras_clientes_command():
+    """Reconstruye los acumulados de compras de cada cliente."""
+    with app.app_context():
+        filas = reconstruir_compras_clientes(get_db_connection())
+    print(f"Acumulados de compras reconstruidos: {filas} clientes.")
+
+
+@app.route('/api/clientes/buscar', methods=['GET'])
+def api_clientes_buscar():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify([])
+    conn = get_db_connection()
+    try:
+        clientes = buscar_clientes(conn, q, _limite_busqueda())
+    finally:
+        conn.close()
+    return _respuesta_cacheable(clientes, CACHE_BUSQUEDA_CLIENTES)
+
+
+@app.route('/api/clientes', methods=['GET'])
+def api_clientes():
+    """Directorio de clientes: q (nombre, teléfono o email), orden (con '-' descendente), limite y cursor."""
+    return _respuesta_directorio(buscar_clientes_directorio, 'clientes', 'nombre',
+                                 CLIENTES_POR_PAGINA, CLIENTES_POR_PAGINA_MAX)
+
+
+@app.route('/dashboard/clientes', methods=['GET'])
+def gestion_clientes():
+    # Solo la primera página va embebida; la búsqueda y las siguientes las pide la página a /api/clientes
+    conn = get_db_connection()
+    clientes, siguiente = buscar_clientes_directorio(conn)
+    conn.close()
+    return render_template('gestion_clientes.html', inicial={'clientes': clientes, 'siguiente': siguiente})
+
+@app.route('/dashboard/clientes/agregar_clientes', methods=['GET', 'POST'])
+def agregar_clientes():
+    if request.method == 'POST':
+        nombre = request.form['nombre']
+        email = request.form['email']
         telefono = request.form['telefono']
         direccion = request.form['direccion']
 
@@ -631,158 +2262,1085 @@ def eliminar_cliente(id):
 #---------------------------------------------------------------------------------------------------------------------- 
 #--------------------------------------------------Ventas--------------------------------------------------------------------
 
-@app.route('/dashboard/ventas', methods=['GET', 'POST'])
-def ventas():
-    if request.method == 'POST':
-        id_cliente = request.form.get('id_cliente')  # Puede ser None o vacío
-        productos = request.form.getlist('producto[]')
-        cantidades = request.form.getlist('cantidad[]')
-        metodo_pago = request.form.get('metodo_pago')
+class VentaError(Exception):
+    """Error de validación de una venta (producto inexistente, stock insuficiente...)."""
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
 
-        try:
-            # Crear factura (si no hay cliente, guardamos NULL)
-            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            if id_cliente == "" or id_cliente is None:
-                cursor.execute("INSERT INTO facturas (id_cliente, fecha, total) VALUES (NULL, ?, ?)", (fecha, 0))
-            else:
-                cursor.execute("INSERT INTO facturas (id_cliente, fecha, total) VALUES (?, ?, ?)", (id_cliente, fecha, 0))
-            id_factura = cursor.lastrowid
+ENTERO_SQLITE_MAX = 2 ** 63 - 1
 
-            total_factura = 0
 
-            # Procesar productos
-            for i in range(len(productos)):
-                id_producto = int(productos[i])
-                cantidad = int(cantidades[i])
+def _entero_sqlite(valor):
+    """int(valor), exigiendo que entre en un INTEGER de SQLite (si no, sqlite3 lanza OverflowError)."""
+    numero = int(valor)
+    if not -ENTERO_SQLITE_MAX - 1 <= numero <= ENTERO_SQLITE_MAX:
+        raise ValueError(f'{numero} no entra en un entero de 64 bits')
+    return numero
 
-                producto = cursor.execute("SELECT precio, stock FROM productos WHERE id_producto = ?", (id_producto,)).fetchone()
 
-                if not producto:
-                    conn.rollback()
-                    flash("Producto no encontrado.", "danger")
-                    return redirect(url_for('ventas'))
+def agrupar_items(productos, cantidades):
+    """Convierte las listas del formulario en [(id_producto, cantidad)], sumando productos repetidos."""
+    items = {}
+    for id_producto, cantidad in zip(productos, cantidades):
+        id_producto = _entero_sqlite(id_producto)
+        cantidad = _entero_sqlite(cantidad)
+        if cantidad <= 0:
+            raise VentaError(f"Cantidad inválida para el producto ID {id_producto}.")
+        items[id_producto] = items.get(id_producto, 0) + cantidad
+        if items[id_producto] > ENTERO_SQLITE_MAX:
+            raise VentaError(f"Cantidad inválida para el producto ID {id_producto}.")
+    return list(items.items())
 
-                if producto['stock'] < cantidad:
-                    conn.rollback()
-                    flash(f"Stock insuficiente para el producto ID {id_producto}.", "danger")
-                    return redirect(url_for('ventas'))
 
-                precio_unitario = producto['precio']
-                subtotal = precio_unitario * cantidad
-                total_factura += subtotal
-                # Insertar en detalle (incluye metodo_pago)
-                cursor.execute("""INSERT INTO detalle_factura 
-                                  (id_factura, id_producto, cantidad, precio_unitario, subtotal, metodo_pago)
-                                  VALUES (?, ?, ?, ?, ?, ?)""",
-                               (id_factura, id_producto, cantidad, precio_unitario, subtotal, metodo_pago))
+def _insertar_venta(conn, id_cliente, items, metodo_pago, fecha, id_caja=None, clave_idempotencia=None,
+                    controlar_stock=True):
+    """Escribe la venta dentro de la transacción ya abierta y devuelve (id_factura, total).
 
-                # Descontar stock
-                cursor.execute("UPDATE productos SET stock = stock - ? WHERE id_producto = ?", (cantidad, id_producto))
+    Son cinco sentencias sin importar el tamaño del carrito: un SELECT con IN (...),
+    el INSERT de la factura, un executemany para el detalle, un UPDATE de stock
+    condicionado a que alcance y el upsert en ventas_diarias; con `id_caja` se suma
+    el upsert en cajas_totales y con `id_cliente` el UPDATE de sus acumulados de
+    compras (un cliente inexistente rechaza la venta). Lanza VentaError sin deshacer nada: eso le toca a quien abrió la transacción.
 
-            # Actualizar total de factura
-            cursor.execute("UPDATE facturas SET total = ? WHERE id_factura = ?", (total_factura, id_factura))
+    Con controlar_stock=False (una venta que ya se entregó sin conexión) no se rechaza
+    por falta de stock: el stock baja hasta cero y la diferencia queda para el recuento.
+    """
+    ids = [id_producto for id_producto, _ in items]
+    marcas = ",".join("?" * len(ids))
+    rows = conn.execute(f"SELECT id_producto, precio, precio_costo, stock FROM productos WHERE id_producto IN ({marcas})", ids).fetchall()
+    productos = {r['id_producto']: r for r in rows}
+
+    lineas = []
+    total_factura = 0
+    ganancia = 0
+    for id_producto, cantidad in items:
+        producto = productos.get(id_producto)
+        if not producto:
+            raise VentaError("Producto no encontrado.")
+        if controlar_stock and producto['stock'] < cantidad:
+            raise VentaError(f"Stock insuficiente para el producto ID {id_producto}.")
+        precio_unitario = producto['precio']
+        # El costo se congela en la línea: editar el producto después no cambia la ganancia histórica
+        precio_costo = producto['precio_costo']
+        subtotal = precio_unitario * cantidad
+        total_factura += subtotal
+        if precio_costo is not None:
+            ganancia += cantidad * (precio_unitario - precio_costo)
+        lineas.append((id_producto, cantidad, precio_unitario, precio_costo, subtotal))
+
+    # Crear factura (si no hay cliente, guardamos NULL) ya con total, ganancia y método
+    cursor = conn.execute("""INSERT INTO facturas (id_cliente, fecha, total, ganancia, metodo_pago, id_caja, clave_idempotencia)
+                             VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                          (id_cliente or None, fecha, total_factura, ganancia, metodo_pago, id_caja, clave_idempotencia))
+    id_factura = cursor.lastrowid
+
+    conn.executemany("""INSERT INTO detalle_factura
+                        (id_factura, id_producto, cantidad, precio_unitario, precio_costo, subtotal, metodo_pago)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                     [(id_factura, id_producto, cantidad, precio_unitario, precio_costo, subtotal, metodo_pago)
+                      for id_producto, cantidad, precio_unitario, precio_costo, subtotal in lineas])
+
+    # Descontar stock de todo el carrito; la condición stock >= cantidad evita sobreventa
+    valores = ",".join(["(?, ?)"] * len(items))
+    parametros = [v for item in items for v in item]
+    # (rowcount no se informa para sentencias que empiezan con WITH, usamos total_changes)
+    cambios_previos = conn.total_changes
+    if controlar_stock:
+        conn.execute(f"""
+            WITH venta(id_producto, cantidad) AS (VALUES {valores})
+            UPDATE productos
+            SET stock = stock - (SELECT cantidad FROM venta WHERE venta.id_producto = productos.id_producto)
+            WHERE id_producto IN (SELECT id_producto FROM venta)
+              AND stock >= (SELECT cantidad FROM venta WHERE venta.id_producto = productos.id_producto)
+        """, parametros)
+    else:
+        conn.execute(f"""
+            WITH venta(id_producto, cantidad) AS (VALUES {valores})
+            UPDATE productos
+            SET stock = MAX(stock - (SELECT cantidad FROM venta WHERE venta.id_producto = productos.id_producto), 0)
+            WHERE id_producto IN (SELECT id_producto FROM venta)
+        """, parametros)
+    if conn.total_changes - cambios_previos != len(items):
+        raise VentaError("Stock insuficiente para completar la venta.")
+
+    # Acumulado del día, en la misma transacción que la factura
+    conn.execute("""INSERT INTO ventas_diarias (fecha, metodo_pago, cantidad_ventas, total, ganancia, items)
+                    VALUES (?, ?, 1, ?, ?, ?)
+                    ON CONFLICT (fecha, metodo_pago) DO UPDATE SET
+                        cantidad_ventas = cantidad_ventas + 1,
+                        total = total + excluded.total,
+                        ganancia = ganancia + excluded.ganancia,
+                        items = items + excluded.items""",
+                 (fecha[:10], metodo_pago or '', total_factura, ganancia, sum(c for _, c in items)))
+
+    if id_cliente:
+        # El UPDATE de los acumulados también confirma que el cliente existe
+        cursor = conn.execute("""UPDATE clientes
+                                 SET cantidad_compras = cantidad_compras + 1,
+                                     total_compras = total_compras + ?,
+                                     ultima_compra = MAX(IFNULL(ultima_compra, ''), ?)
+                                 WHERE id_cliente = ?""",
+                              (total_factura, fecha, id_cliente))
+        if cursor.rowcount != 1:
+            raise VentaError("Cliente no encontrado.")
+
+    if id_caja is not None:
+        # Solo suma si la caja sigue abierta: si la cerraron mientras tanto la venta no entra
+        cambios_previos = conn.total_changes
+        conn.execute("""INSERT INTO cajas_totales (id_caja, metodo_pago, cantidad_ventas, total)
+                        SELECT ?, ?, 1, ? WHERE EXISTS (SELECT 1 FROM cajas WHERE id_caja = ? AND estado = 'abierta')
+                        ON CONFLICT (id_caja, metodo_pago) DO UPDATE SET
+                            cantidad_ventas = cantidad_ventas + 1,
+                            total = total + excluded.total""",
+                     (id_caja, metodo_pago or '', total_factura, id_caja))
+        if conn.total_changes == cambios_previos:
+            raise VentaError("La caja está cerrada. Abrí una caja para seguir vendiendo.")
+
+    return id_factura, total_factura
+
+
+def registrar_venta(conn, id_cliente, items, metodo_pago, fecha=None, id_caja=None):
+    """Registra una venta completa en una sola transacción y devuelve el id de la factura.
+
+    `items` es una lista de (id_producto, cantidad) sin repetidos (ver agrupar_items).
+    Si algo falla se hace rollback y se lanza VentaError.
+    """
+    if not items:
+        raise VentaError("La venta no tiene productos.")
+    fecha = fecha or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            conn.commit()
+    # BEGIN IMMEDIATE toma el lock de escritura antes de leer el stock: dos cajas
+    # vendiendo el mismo producto no pueden leer el mismo stock a la vez
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        id_factura, _ = _insertar_venta(conn, id_cliente, items, metodo_pago, fecha, id_caja)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    catalogo_cache.refrescar(conn, [id_producto for id_producto, _ in items])
+    dashboard_cache.invalidar()
+    return id_factura
+
+
+VENTAS_LOTE_MAX = 200
+# Diferencia tolerada entre el reloj de la caja y el del servidor
+VENTAS_LOTE_DESFASE_RELOJ = timedelta(minutes=10)
+_CLAVE_IDEMPOTENCIA = re.compile(r'[A-Za-z0-9_-]{8,64}')
+
+
+def _venta_de_lote(venta):
+    """Valida una venta de un lote y devuelve (id_cliente, items, metodo_pago, fecha, forzar_stock); lanza VentaError.
+
+    El endpoint es idempotente: la venta se registra tal como la mandó la caja o se
+    rechaza, nunca se corrige. Por eso productos y cantidades tienen que ser enteros de
+    JSON (1.7 o true no se redondean) y la fecha no puede ser posterior a ahora más
+    VENTAS_LOTE_DESFASE_RELOJ. forzar_stock lo manda la caja al registrar igual una venta
+    rechazada por stock.
+    """
+    try:
+        if not all(type(i['id_producto']) is int and type(i['cantidad']) is int for i in venta['items']):
+            raise VentaError("Productos y cantidades tienen que ser números enteros.")
+        items = agrupar_items([i['id_producto'] for i in venta['items']], [i['cantidad'] for i in venta['items']])
+        id_cliente = _entero_sqlite(venta['id_cliente']) if venta.get('id_cliente') else None
+        fecha = datetime.strptime(venta['fecha'], "%Y-%m-%d %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        raise VentaError("Venta con datos inválidos.")
+    if fecha > datetime.now() + VENTAS_LOTE_DESFASE_RELOJ:
+        raise VentaError("La fecha de la venta es posterior a la actual; revisá el reloj de la caja.")
+    fecha = fecha.strftime("%Y-%m-%d %H:%M:%S")
+    if not items:
+        raise VentaError("La venta no tiene productos.")
+    metodo_pago = venta.get('metodo_pago')
+    if metodo_pago is not None and not isinstance(metodo_pago, str):
+        raise VentaError("Método de pago inválido.")
+    return id_cliente, items, metodo_pago, fecha, venta.get('forzar_stock') is True
+
+
+def registrar_ventas_lote(conn, ventas, id_caja=None):
+    """Registra en una sola transacción las ventas que una caja acumuló sin conexión.
+
+    Cada venta trae una `clave` generada en el navegador. Si esa clave ya tiene factura
+    (reenvío del mismo lote, o repetida dentro de él) la venta se informa 'duplicada' con
+    su factura y no se vuelve a escribir. Cada venta corre en su SAVEPOINT: si una no entra
+    (stock, producto borrado, caja cerrada, o un error de la base con sus datos) queda
+    'rechazada' y el resto sigue; una venta mal armada nunca hace fallar el lote entero, que
+    la caja reenviaría para siempre. Los precios son los del servidor al sincronizar.
+
+    `id_caja` es la caja abierta al sincronizar: solo se le asignan las ventas hechas
+    después de su apertura. Las anteriores se cobraron en otra caja (quizás ya cerrada y
+    conciliada) y quedan sin caja. Devuelve un resultado por venta, en el mismo orden.
+    """
+    claves = [v.get('clave') if isinstance(v, dict) else None for v in ventas]
+    validas = [c for c in claves if isinstance(c, str) and _CLAVE_IDEMPOTENCIA.fullmatch(c)]
+    resultados = []
+    productos = set()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        apertura = None
+        if id_caja is not None:
+            fila = conn.execute("SELECT fecha_apertura FROM cajas WHERE id_caja = ?", (id_caja,)).fetchone()
+            apertura = fila['fecha_apertura'] if fila else None
+        registradas = {}
+        if validas:
+            marcas = ",".join("?" * len(validas))
+            registradas = dict(conn.execute(f"""SELECT clave_idempotencia, id_factura FROM facturas
+                                                WHERE clave_idempotencia IN ({marcas})""", validas).fetchall())
+        for venta, clave in zip(ventas, claves):
+            if clave not in validas:
+                resultados.append({'clave': clave, 'estado': 'rechazada', 'error': 'Clave de idempotencia inválida.'})
+                continue
+            if clave in registradas:
+                resultados.append({'clave': clave, 'estado': 'duplicada', 'id_factura': registradas[clave]})
+                continue
+            conn.execute("SAVEPOINT venta_lote")
+            try:
+                id_cliente, items, metodo_pago, fecha, forzar_stock = _venta_de_lote(venta)
+                caja = id_caja if apertura is not None and fecha >= apertura else None
+                id_factura, total = _insertar_venta(conn, id_cliente, items, metodo_pago, fecha, caja, clave,
+                                                    controlar_stock=not forzar_stock)
+            except (VentaError, sqlite3.Error, OverflowError) as e:
+                conn.execute("ROLLBACK TO venta_lote")
+                conn.execute("RELEASE venta_lote")
+                if not isinstance(e, VentaError):
+                    log_evento(logging.WARNING, 'venta_lote_rechazada', clave=clave, error=repr(e))
+                    e = f"No se pudo registrar la venta: {e}"
+                resultados.append({'clave': clave, 'estado': 'rechazada', 'error': str(e)})
+                continue
+            conn.execute("RELEASE venta_lote")
+            # La tarea entra en el mismo commit que la factura (el ticket no: el cliente ya se fue)
+            encolar_tarea(conn, 'renderizar_impresiones', {'id_factura': id_factura})
+            registradas[clave] = id_factura
+            productos.update(id_producto for id_producto, _ in items)
+            resultados.append({'clave': clave, 'estado': 'registrada', 'id_factura': id_factura, 'total': total})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if productos:
+        catalogo_cache.refrescar(conn, list(productos))
+        dashboard_cache.invalidar()
+    return resultados
+
+
+@app.route('/dashboard/ventas', methods=['GET', 'POST'])
+def ventas():
+    if request.method == 'POST':
+        id_cliente = request.form.get('id_cliente')  # Puede ser None o vacío
+        productos = request.form.getlist('producto[]')
+        cantidades = request.form.getlist('cantidad[]')
+        metodo_pago = request.form.get('metodo_pago')
+
+        conn = get_db_connection()
+        try:
+            try:
+                id_cliente = _entero_sqlite(id_cliente) if id_cliente else None
+            except ValueError:
+                raise VentaError("Cliente inválido.")
+            items = agrupar_items(productos, cantidades)
+            id_factura = registrar_venta(conn, id_cliente, items, metodo_pago,
+                                         id_caja=caja_abierta(conn, session.get('user')))
+            # Los comprobantes se renderizan ya, así la primera impresión no espera
+            encolar_tarea(conn, 'renderizar_impresiones', {'id_factura': id_factura})
+            if app.config['IMPRESORA_TERMICA']:
+                # Si la impresora no responde, la tarea reintenta sola
+                encolar_tarea(conn, 'imprimir_ticket', {'id_factura': id_factura})
             flash("Venta registrada correctamente.", "success")
+        except VentaError as e:
+            flash(str(e), "danger")
+            return redirect(url_for('ventas'))
         except Exception as e:
-            conn.rollback()
             flash(f"Error al registrar la venta: {e}", "danger")
         finally:
             conn.close()
 
         return redirect(url_for('listado_facturas'))
 
-    # Si es GET, cargamos clientes y productos para mostrar en el formulario
-    conn = get_db_connection()
-    clientes = conn.execute("SELECT * FROM clientes").fetchall()
-    productos = conn.execute("SELECT * FROM productos WHERE stock > 0").fetchall()
-    conn.close()
-    return render_template('ventas.html', clientes=clientes, productos=productos)
+    # Clientes y productos se buscan a pedido desde la página (/api/clientes/buscar, /api/productos/...)
+    return render_template('ventas.html')
 
 
-@app.route('/dashboard/listado_facturas', methods=['GET'])
-def listado_facturas():
+@app.route('/api/ventas/lote', methods=['POST'])
+def api_ventas_lote():
+    """JSON: {ventas: [{clave, fecha, id_cliente, metodo_pago, forzar_stock, items: [{id_producto, cantidad}]}]}.
+
+    Lo usa la pantalla de ventas en modo sin conexión para sincronizar su cola local.
+    """
+    if "user" not in session:
+        return jsonify({'error': 'no autenticado'}), 401
+    datos = request.get_json(silent=True)
+    ventas = datos.get('ventas') if isinstance(datos, dict) else None
+    if not isinstance(ventas, list) or not ventas:
+        return jsonify({'error': 'se esperaba una lista de ventas'}), 400
+    if len(ventas) > VENTAS_LOTE_MAX:
+        return jsonify({'error': f'como máximo {VENTAS_LOTE_MAX} ventas por lote'}), 400
     conn = get_db_connection()
-    # Calculamos la ganancia por factura: sum(cantidad * (precio_unitario - precio_costo))
-    facturas = conn.execute("""
+    try:
+        resultados = registrar_ventas_lote(conn, ventas, id_caja=caja_abierta(conn, session.get('user')))
+    finally:
+        conn.close()
+    return jsonify({'resultados': resultados})
+
+
+FACTURAS_POR_PAGINA = 50
+FACTURAS_POR_PAGINA_MAX = 200
+
+
+def _leer_cursor_facturas(cursor):
+    """El cursor es 'fecha|id_factura' de la última fila de la página anterior."""
+    if not cursor:
+        return None
+    try:
+        fecha, id_factura = cursor.rsplit('|', 1)
+        return fecha, int(id_factura)
+    except ValueError:
+        return None
+
+
+def buscar_facturas(conn, desde=None, hasta=None, cliente=None, cursor=None, limite=FACTURAS_POR_PAGINA):
+    """Página de facturas ordenada por (fecha, id_factura) descendente.
+
+    Usa paginación por clave (keyset): en vez de OFFSET se sigue desde la última
+    fila vista, así cada página cuesta lo mismo sin importar cuántas haya antes.
+    Devuelve (facturas, cursor_siguiente); cursor_siguiente es None en la última página.
+    """
+    filtros = []
+    params = []
+    if desde:
+        filtros.append('f.fecha >= ?')
+        params.append(rango_dia(desde)[0])
+    if hasta:
+        filtros.append('f.fecha < ?')
+        params.append(rango_dia(hasta)[1])
+    if cliente:
+        filtros.append('c.nombre LIKE ?')
+        params.append('%' + cliente + '%')
+    posicion = _leer_cursor_facturas(cursor)
+    if posicion:
+        # el primer término acota el rango del índice; el segundo desempata por id
+        filtros.append('f.fecha <= ? AND (f.fecha < ? OR f.id_factura < ?)')
+        params.extend([posicion[0], posicion[0], posicion[1]])
+    where = ('WHERE ' + ' AND '.join(filtros)) if filtros else ''
+
+    # ganancia y metodo_pago quedan guardados en la factura al momento de la venta
+    rows = conn.execute(f"""
         SELECT f.id_factura,
                f.fecha,
                f.total,
-               (SELECT metodo_pago FROM detalle_factura WHERE id_factura = f.id_factura LIMIT 1) as metodo_pago,
+               f.metodo_pago,
                c.nombre as cliente,
-               IFNULL(SUM(d.cantidad * (d.precio_unitario - p.precio_costo)), 0) as ganancia
+               f.ganancia
         FROM facturas f
         LEFT JOIN clientes c ON f.id_cliente = c.id_cliente
-        LEFT JOIN detalle_factura d ON d.id_factura = f.id_factura
-        LEFT JOIN productos p ON d.id_producto = p.id_producto
-        GROUP BY f.id_factura
-        ORDER BY f.fecha DESC
-    """).fetchall()
+        {where}
+        ORDER BY f.fecha DESC, f.id_factura DESC
+        LIMIT ?
+    """, params + [limite + 1]).fetchall()
+
+    siguiente = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        siguiente = f"{rows[-1]['fecha']}|{rows[-1]['id_factura']}"
+    return rows, siguiente
+
+
+def _filtros_facturas_desde_request():
+    try:
+        limite = int(request.args.get('limite', FACTURAS_POR_PAGINA))
+    except ValueError:
+        limite = FACTURAS_POR_PAGINA
+    return {
+        'desde': request.args.get('desde', '').strip() or None,
+        'hasta': request.args.get('hasta', '').strip() or None,
+        'cliente': request.args.get('cliente', '').strip() or None,
+        'cursor': request.args.get('cursor', '').strip() or None,
+        'limite': max(1, min(limite, FACTURAS_POR_PAGINA_MAX)),
+    }
+
+
+@app.route('/dashboard/listado_facturas', methods=['GET'])
+def listado_facturas():
+    filtros = _filtros_facturas_desde_request()
+    conn = get_db_connection()
+    try:
+        facturas, siguiente = buscar_facturas(conn, **filtros)
+    except ValueError:
+        flash('Fecha inválida en el filtro.', 'danger')
+        facturas, siguiente = [], None
     conn.close()
-    return render_template('listado_facturas.html', facturas=facturas)
+    return render_template('listado_facturas.html', facturas=facturas, siguiente=siguiente, filtros=filtros)
 
 
-@app.route('/dashboard/factura/<int:id>')
-def detalle_factura(id):
+@app.route('/api/facturas', methods=['GET'])
+def api_facturas():
+    """Misma consulta que el listado, en JSON, para ir pidiendo páginas con `cursor`."""
+    filtros = _filtros_facturas_desde_request()
     conn = get_db_connection()
-    factura = conn.execute("""SELECT f.id_factura, f.fecha, f.total, c.nombre
+    try:
+        facturas, siguiente = buscar_facturas(conn, **filtros)
+    except ValueError:
+        return jsonify({'error': 'fecha inválida'}), 400
+    finally:
+        conn.close()
+    return jsonify({'facturas': [dict(f) for f in facturas], 'siguiente': siguiente})
+
+
+#----------------------------------------------------- Exportaciones ------------------------------------------------------
+# Cada exportación es (encabezados, consulta); la consulta recibe (inicio, fin) del rango de fechas.
+
+EXPORTACIONES = {
+    'facturas': (
+        ['id_factura', 'fecha', 'cliente', 'metodo_pago', 'total', 'ganancia'],
+        '''
+        SELECT f.id_factura, f.fecha, c.nombre, f.metodo_pago, f.total, f.ganancia
+        FROM facturas f
+        LEFT JOIN clientes c ON f.id_cliente = c.id_cliente
+        WHERE f.fecha >= ? AND f.fecha < ?
+        ORDER BY f.fecha, f.id_factura
+        ''',
+    ),
+    'detalle_factura': (
+        ['id_detalle', 'id_factura', 'fecha', 'id_producto', 'descripcion', 'cantidad',
+         'precio_unitario', 'precio_costo', 'subtotal', 'metodo_pago'],
+        '''
+        SELECT d.id_detalle, d.id_factura, f.fecha, d.id_producto, p.descripcion, d.cantidad,
+               d.precio_unitario, d.precio_costo, d.subtotal, d.metodo_pago
+        FROM facturas f
+        JOIN detalle_factura d ON d.id_factura = f.id_factura
+        LEFT JOIN productos p ON p.id_producto = d.id_producto
+        WHERE f.fecha >= ? AND f.fecha < ?
+        ORDER BY f.fecha, f.id_factura, d.id_detalle
+        ''',
+    ),
+    # La fecha de la factura es opcional al cargarla; sin ella vale el día en que se cargó
+    'facturas_proveedores': (
+        ['id', 'id_proveedor', 'proveedor', 'cuit', 'numero', 'fecha', 'monto', 'descripcion', 'creado_en'],
+        '''
+        SELECT fp.id, fp.id_proveedor, pr.razon_social, pr.cuit, fp.numero, fp.fecha, fp.monto,
+               fp.descripcion, fp.creado_en
+        FROM facturas_proveedores fp
+        LEFT JOIN proveedores pr ON pr.id = fp.id_proveedor
+        WHERE IFNULL(fp.fecha, substr(fp.creado_en, 1, 10)) >= ?
+          AND IFNULL(fp.fecha, substr(fp.creado_en, 1, 10)) < ?
+        ORDER BY IFNULL(fp.fecha, substr(fp.creado_en, 1, 10)), fp.id
+        ''',
+    ),
+}
+FILAS_POR_BLOQUE = 500
+
+
+def generar_csv(db_path, encabezados, consulta, params, delimitador=',', bom=False):
+    """Genera el CSV de a bloques, leyendo el cursor de a FILAS_POR_BLOQUE filas.
+
+    Usa una conexión propia (no la del pool) porque el generador sigue corriendo
+    después de que termina el request, y una transacción de lectura para que todo
+    el archivo salga de la misma foto de la base.
+    """
+    conn = _open_db_connection(db_path)
+    try:
+        conn.execute('BEGIN')
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=delimitador)
+        if bom:
+            buffer.write('\ufeff')
+        writer.writerow(encabezados)
+        cursor = conn.execute(consulta, params)
+        while True:
+            filas = cursor.fetchmany(FILAS_POR_BLOQUE)
+            if not filas:
+                break
+            writer.writerows(filas)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        conn.rollback()
+        conn.close_real()
+
+
+@app.route('/dashboard/exportar/<tabla>', methods=['GET'])
+def exportar(tabla):
+    """Descarga CSV de facturas, detalle_factura o facturas_proveedores.
+
+    Parámetros: desde/hasta ('YYYY-MM-DD', inclusive) y formato=csv|excel. El
+    formato excel es CSV con BOM y ';', que es lo que Excel en español abre
+    directamente con acentos y columnas bien separadas.
+    """
+    if "user" not in session:
+        flash("Debes iniciar sesión para acceder.", "warning")
+        return redirect(url_for("login"))
+    if tabla not in EXPORTACIONES:
+        flash('Exportación desconocida', 'danger')
+        return redirect(url_for('listado_facturas'))
+
+    try:
+        inicio = rango_dia(request.args['desde'])[0] if request.args.get('desde') else '0000-00-00'
+        fin = rango_dia(request.args['hasta'])[1] if request.args.get('hasta') else '9999-99-99'
+    except ValueError:
+        flash('Fecha inválida en el filtro.', 'danger')
+        return redirect(url_for('listado_facturas'))
+
+    excel = request.args.get('formato') == 'excel'
+    encabezados, consulta = EXPORTACIONES[tabla]
+    contenido = generar_csv(app.config['DATABASE'], encabezados, consulta, (inicio, fin),
+                            delimitador=';' if excel else ',', bom=excel)
+    nombre = f"{tabla}_{request.args.get('desde') or 'inicio'}_{request.args.get('hasta') or 'hoy'}.csv"
+    # Sin Content-Length: el servidor lo manda con Transfer-Encoding: chunked
+    return Response(contenido, mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
+
+
+def obtener_factura(conn, id_factura):
+    """Encabezado y líneas de una factura; (None, []) si no existe."""
+    factura = conn.execute("""SELECT f.id_factura, f.fecha, f.total, c.nombre AS cliente
                               FROM facturas f
                               LEFT JOIN clientes c ON f.id_cliente = c.id_cliente
-                              WHERE f.id_factura = ?""", (id,)).fetchone()
+                              WHERE f.id_factura = ?""", (id_factura,)).fetchone()
+    if factura is None:
+        return None, []
     detalles = conn.execute("""SELECT d.cantidad, d.precio_unitario, d.subtotal, p.descripcion, d.metodo_pago
                                FROM detalle_factura d
                                JOIN productos p ON d.id_producto = p.id_producto
-                               WHERE d.id_factura = ?""", (id,)).fetchall()
+                               WHERE d.id_factura = ?""", (id_factura,)).fetchall()
+    return factura, detalles
+
+
+@app.route('/dashboard/factura/<int:id>')
+def detalle_factura(id):
+    conn = get_db_connection()
+    factura, detalles = obtener_factura(conn, id)
     conn.close()
+    if not factura:
+        flash('Factura no encontrada', 'danger')
+        return redirect(url_for('listado_facturas'))
     return render_template('detalle_factura.html', factura=factura, detalles=detalles)
 
 
+#----------------------------------------------------- Impresiones ------------------------------------------------------
+# Una factura registrada no cambia, así que su comprobante se renderiza una sola vez y queda
+# en disco como <id>-<tipo>-<versión>.html. La versión es un hash de la plantilla: si se edita
+# print_factura.html los comprobantes viejos dejan de usarse solos. El mismo nombre sirve de ETag.
+
+TIPOS_IMPRESION = ('invoice', 'receipt')
+PLANTILLA_IMPRESION = 'print_factura.html'
+_version_impresion = None
+
+
+def version_plantilla_impresion():
+    global _version_impresion
+    if _version_impresion is None:
+        fuente = app.jinja_env.loader.get_source(app.jinja_env, PLANTILLA_IMPRESION)[0]
+        _version_impresion = hashlib.sha256(fuente.encode('utf-8')).hexdigest()[:12]
+    return _version_impresion
+
+
+def ruta_impresion(id_factura, tipo):
+    """Nombre (usado como ETag) y ruta del comprobante renderizado."""
+    nombre = f'{id_factura}-{tipo}-{version_plantilla_impresion()}'
+    return nombre, os.path.join(app.config['IMPRESIONES_FOLDER'], nombre + '.html')
+
+
+def renderizar_impresion(conn, id_factura, tipo):
+    """Devuelve (nombre, ruta) del comprobante, renderizándolo si todavía no existe.
+
+    Devuelve None si la factura no existe.
+    """
+    nombre, ruta = ruta_impresion(id_factura, tipo)
+    if os.path.exists(ruta):
+        return nombre, ruta
+    factura, detalles = obtener_factura(conn, id_factura)
+    if factura is None:
+        return None
+    html = render_template(PLANTILLA_IMPRESION, factura=factura, detalles=detalles, tipo=tipo)
+    carpeta = os.path.dirname(ruta)
+    os.makedirs(carpeta, exist_ok=True)
+    # Se escribe aparte y se renombra: dos workers pueden renderizar la misma factura a la vez
+    fd, temporal = tempfile.mkstemp(dir=carpeta, suffix='.part')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as destino:
+            destino.write(html)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return nombre, ruta
+
+
+@tarea('renderizar_impresiones')
+def _tarea_renderizar_impresiones(datos):
+    conn = get_db_connection()
+    for tipo in TIPOS_IMPRESION:
+        renderizar_impresion(conn, datos['id_factura'], tipo)
+
+
 @app.route('/dashboard/factura/<int:id>/print')
 def print_factura(id):
     """Vista imprimible de la factura. Parámetros query:
        - type: 'invoice' (formato factura) o 'receipt' (recibo térmico)
-       - copies: número de copias (int) para la impresión automática
+       - copies: número de copias para la impresión automática (lo lee la página)
     """
-    tipo = request.args.get('type', 'invoice')
-    try:
-        copies = int(request.args.get('copies', 1))
-    except:
-        copies = 1
+    tipo = 'invoice' if request.args.get('type', 'invoice') == 'invoice' else 'receipt'
 
     conn = get_db_connection()
-    factura = conn.execute("""SELECT f.id_factura, f.fecha, f.total, c.nombre
-                              FROM facturas f
-                              LEFT JOIN clientes c ON f.id_cliente = c.id_cliente
-                              WHERE f.id_factura = ?""", (id,)).fetchone()
-    detalles = conn.execute("""SELECT d.cantidad, d.precio_unitario, d.subtotal, p.descripcion, d.metodo_pago
-                               FROM detalle_factura d
-                               JOIN productos p ON d.id_producto = p.id_producto
-                               WHERE d.id_factura = ?""", (id,)).fetchall()
-    conn.close()
+    try:
+        impresion = renderizar_impresion(conn, id, tipo)
+    finally:
+        conn.close()
 
-    if not factura:
+    if not impresion:
         flash('Factura no encontrada', 'danger')
         return redirect(url_for('listado_facturas'))
 
-    return render_template('print_factura.html', factura=factura, detalles=detalles, tipo=tipo, copies=copies)
+    nombre, ruta = impresion
+    return send_file(ruta, mimetype='text/html', conditional=True, etag=nombre, max_age=86400)
+
+
+#----------------------------------------------------- Tickets ESC/POS ------------------------------------------------------
+# El recibo se manda directo a la impresora térmica como bytes ESC/POS, sin pasar por el
+# diálogo de impresión del navegador. TicketEscPos arma el flujo; la salida (socket, archivo
+# de dispositivo o impresora falsa para pruebas) se elige con IMPRESORA_TERMICA.
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+
+class TicketEscPos:
+    """Arma un ticket ESC/POS línea por línea. El texto se codifica en la página 850 (acentos y ñ)."""
+
+    CODIFICACION = 'cp850'
+
+    def __init__(self, columnas=42):
+        self.columnas = columnas
+        self._doble = False
+        self._partes = [ESC + b'@', ESC + b't\x02']  # inicializar, página de códigos PC850
+
+    @property
+    def ancho(self):
+        """Caracteres por línea con el tamaño actual: en doble ancho entra la mitad."""
+        return self.columnas // 2 if self._doble else self.columnas
+
+    def _texto(self, texto):
+        return texto.encode(self.CODIFICACION, errors='replace')
+
+    def alinear(self, alineacion):
+        self._partes.append(ESC + b'a' + bytes([{'izquierda': 0, 'centro': 1, 'derecha': 2}[alineacion]]))
+        return self
+
+    def negrita(self, activa=True):
+        self._partes.append(ESC + b'E' + (b'\x01' if activa else b'\x00'))
+        return self
+
+    def doble(self, activo=True):
+        self._doble = activo
+        self._partes.append(GS + b'!' + (b'\x11' if activo else b'\x00'))
+        return self
+
+    def linea(self, texto=''):
+        self._partes.append(self._texto(texto[:self.ancho]) + b'\n')
+        return self
+
+    def separador(self, caracter='-'):
+        return self.linea(caracter * self.ancho)
+
+    def columnas_texto(self, izquierda, derecha):
+        """Texto a la izquierda y a la derecha en la misma línea.
+
+        Lo que no entra se corta: primero la izquierda y, si la derecha sola ya ocupa
+        la línea, también el final de la derecha.
+        """
+        derecha = derecha[:self.ancho]
+        espacio = self.ancho - len(derecha) - 1
+        if espacio < 1:
+            return self.linea(derecha.rjust(self.ancho))
+        return self.linea(izquierda[:espacio].ljust(espacio) + ' ' + derecha)
+
+    def codigo_barras(self, datos, alto=60):
+        """CODE128 con el texto impreso debajo."""
+        contenido = b'{B' + datos.encode('ascii')
+        self._partes += [GS + b'H\x02', GS + b'h' + bytes([alto]), GS + b'w\x02',
+                         GS + b'kI' + bytes([len(contenido)]) + contenido, b'\n']
+        return self
+
+    def cortar(self, lineas_avance=3):
+        # GS V 66 n: avanza n líneas y hace corte parcial
+        self._partes.append(GS + b'VB' + bytes([lineas_avance]))
+        return self
+
+    def datos(self):
+        return b''.join(self._partes)
+
+
+def _importe(valor):
+    return f'${valor:.2f}'
+
+
+def renderizar_ticket(factura, detalles, columnas=None):
+    """Recibo térmico de la factura como bytes ESC/POS (mismos datos que print_factura.html)."""
+    t = TicketEscPos(columnas or app.config['IMPRESORA_COLUMNAS'])
+    t.alinear('centro').doble().linea('Mi Kiosco').doble(False)
+    t.linea(str(factura['fecha'])).linea(f"Factura: {factura['id_factura']}")
+    t.linea(f"Cliente: {factura['cliente'] or 'Venta rápida'}")
+    t.alinear('izquierda').separador()
+    for d in detalles:
+        t.linea(d['descripcion'])
+        t.columnas_texto(f"  {d['cantidad']} x {_importe(d['precio_unitario'])}", _importe(d['subtotal']))
+    t.separador()
+    t.negrita().doble().columnas_texto('TOTAL', _importe(factura['total'])).doble(False).negrita(False)
+    pagos = sorted({d['metodo_pago'] for d in detalles if d['metodo_pago']})
+    if pagos:
+        t.columnas_texto('Pago', ', '.join(pagos))
+    t.alinear('centro').linea().codigo_barras(f"F{factura['id_factura']}")
+    t.linea('Gracias por su compra').linea('Software desarrollado por Devtech')
+    return t.cortar().datos()
+
+
+class SalidaTcp:
+    """Impresora de red (puerto RAW, normalmente 9100)."""
+
+    def __init__(self, host, puerto=9100, timeout=5):
+        self.host, self.puerto, self.timeout = host, puerto, timeout
+
+    def enviar(self, datos):
+        with socket.create_connection((self.host, self.puerto), timeout=self.timeout) as s:
+            s.sendall(datos)
+
+
+class SalidaArchivo:
+    """Dispositivo local (/dev/usb/lp0) o un archivo común."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def enviar(self, datos):
+        with open(self.ruta, 'ab') as f:
+            f.write(datos)
+
+
+class ImpresoraFalsa:
+    """Guarda los tickets en memoria; para pruebas y para usar la caja sin impresora."""
+
+    def __init__(self):
+        self.tickets = []
+
+    def enviar(self, datos):
+        self.tickets.append(datos)
+
+
+impresora_falsa = ImpresoraFalsa()
+
+
+def salida_impresora(destino=None):
+    """Construye la salida a partir de IMPRESORA_TERMICA. None si no hay impresora configurada."""
+    destino = app.config['IMPRESORA_TERMICA'] if destino is None else destino
+    if not destino:
+        return None
+    if destino == 'falsa':
+        return impresora_falsa
+    partes = urlsplit(destino)
+    if partes.scheme == 'tcp':
+        return SalidaTcp(partes.hostname, partes.port or 9100)
+    if partes.scheme == 'archivo':
+        return SalidaArchivo(partes.path)
+    raise ValueError(f'Impresora térmica inválida: {destino}')
+
+
+def imprimir_ticket(conn, id_factura, copias=1):
+    """Manda el recibo a la impresora configurada. Devuelve False si la factura no existe."""
+    salida = salida_impresora()
+    if salida is None:
+        raise RuntimeError('No hay impresora térmica configurada.')
+    factura, detalles = obtener_factura(conn, id_factura)
+    if factura is None:
+        return False
+    salida.enviar(renderizar_ticket(factura, detalles) * copias)
+    return True
+
+
+@tarea('imprimir_ticket')
+def _tarea_imprimir_ticket(datos):
+    imprimir_ticket(get_db_connection(), datos['id_factura'], datos.get('copias', 1))
+
+
+@app.route('/dashboard/factura/<int:id>/ticket', methods=['POST'])
+def ticket_factura(id):
+    """Imprime el recibo en la impresora térmica."""
+    try:
+        copias = max(1, min(int(request.form.get('copias', 1)), 5))
+    except ValueError:
+        copias = 1
+    conn = get_db_connection()
+    try:
+        if imprimir_ticket(conn, id, copias):
+            flash('Ticket enviado a la impresora.', 'success')
+        else:
+            flash('Factura no encontrada', 'danger')
+            return redirect(url_for('listado_facturas'))
+    except (OSError, RuntimeError, ValueError) as e:
+        flash(f'No se pudo imprimir el ticket: {e}', 'danger')
+    finally:
+        conn.close()
+    return redirect(url_for('detalle_factura', id=id))
 
 
 #------------------------------------------Productos---------------------------------------------------------------------------- 
 
 
+PRODUCTOS_POR_PAGINA = 50
+PRODUCTOS_POR_PAGINA_MAX = 500
+# Columnas que la grilla puede pedir y las que se pueden usar para ordenar (todas NOT NULL e indexadas)
+COLUMNAS_GRILLA = ('id_producto', 'descripcion', 'precio', 'precio_costo', 'margen_ganancia', 'stock',
+                   'codigo_barras', 'categoria', 'id_proveedor')
+ORDENES_GRILLA = ('descripcion', 'precio', 'stock', 'id_producto')
+
+
+def _siguiente_prefijo(prefijo):
+    """Menor texto mayor que todos los que empiezan con `prefijo` (para filtrar por rango con el índice)."""
+    return prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+
+def _pagina_por_clave(conn, tabla, columnas, columna_orden, columna_id, filtros, params, cursor,
+                      descendente, limite):
+    """Una página de `tabla` ordenada por (columna_orden, columna_id), con paginación por clave.
+
+    `filtros` son condiciones SQL (se unen con AND) y `params` sus valores. El cursor es
+    el JSON [valor, id] de la última fila de la página anterior: la página siguiente sale
+    del índice sin OFFSET. Devuelve (filas con `columnas`, cursor_siguiente o None).
+    """
+    filtros = list(filtros)
+    params = list(params)
+    if cursor:
+        try:
+            valor, id_fila = json.loads(cursor)
+        except (ValueError, TypeError):
+            raise ValueError('cursor inválido')
+        filtros.append(f"({columna_orden}, {columna_id}) {'<' if descendente else '>'} (?, ?)")
+        params.extend([valor, id_fila])
+    where = ('WHERE ' + ' AND '.join(filtros)) if filtros else ''
+    sentido = 'DESC' if descendente else 'ASC'
+    # La columna de orden y el id hacen falta para armar el cursor aunque no se devuelvan
+    seleccion = dict.fromkeys([columna_id, columna_orden, *columnas])
+
+    rows = conn.execute(f"""
+        SELECT {', '.join(seleccion)}
+        FROM {tabla}
+        {where}
+        ORDER BY {columna_orden} {sentido}, {columna_id} {sentido}
+        LIMIT ?
+    """, params + [limite + 1]).fetchall()
+
+    siguiente = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        siguiente = json.dumps([rows[-1][columna_orden], rows[-1][columna_id]])
+    return [{c: r[c] for c in columnas} for r in rows], siguiente
+
+
+def _respuesta_directorio(buscar, clave, orden_por_defecto, por_pagina, por_pagina_max):
+    """JSON de un directorio paginado: q, orden (con '-' descendente), limite y cursor del request.
+
+    `buscar(conn, texto=, orden=, descendente=, cursor=, limite=)` devuelve (filas, siguiente);
+    las filas van bajo `clave`. Parámetros inválidos -> 400 con {'error': ...}.
+    """
+    orden = request.args.get('orden', orden_por_defecto).strip()
+    try:
+        limite = _entero_o_none(request.args.get('limite')) or por_pagina
+    except ValueError:
+        return jsonify({'error': 'parámetro inválido'}), 400
+    conn = get_db_connection()
+    try:
+        filas, siguiente = buscar(
+            conn, texto=request.args.get('q', '').strip() or None, orden=orden.lstrip('-'),
+            descendente=orden.startswith('-'), cursor=request.args.get('cursor', '').strip() or None,
+            limite=max(1, min(limite, por_pagina_max)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify({clave: filas, 'siguiente': siguiente})
+
+
+def buscar_productos_grilla(conn, texto=None, stock_min=None, stock_max=None, codigo_barras=None,
+                            orden='descripcion', descendente=False, columnas=None, cursor=None,
+                            limite=PRODUCTOS_POR_PAGINA):
+    """Página de la grilla de productos, con paginación por clave sobre (orden, id_producto).
+
+    `texto` busca palabras por prefijo (FTS5 si está, si no LIKE), `codigo_barras` filtra por
+    prefijo del código. `cursor` es el que devolvió la página anterior. Devuelve
+    (productos, cursor_siguiente); cursor_siguiente es None en la última página.
+    """
+    if orden not in ORDENES_GRILLA:
+        raise ValueError(f'No se puede ordenar por {orden}')
+    columnas = [c for c in (columnas or COLUMNAS_GRILLA) if c in COLUMNAS_GRILLA]
+
+    filtros = []
+    params = []
+    if texto and _tokens(texto):
+        if tiene_busqueda_fts(conn):
+            filtros.append('id_producto IN (SELECT rowid FROM productos_fts WHERE productos_fts MATCH ?)')
+            params.append(' '.join(f'"{token}"*' for token in _tokens(texto)))
+        else:
+            filtros.append('descripcion LIKE ?')
+            params.append('%' + texto + '%')
+    if stock_min is not None:
+        filtros.append('stock >= ?')
+        params.append(stock_min)
+    if stock_max is not None:
+        filtros.append('stock <= ?')
+        params.append(stock_max)
+    if codigo_barras:
+        filtros.append('codigo_barras >= ? AND codigo_barras < ?')
+        params.extend([codigo_barras, _siguiente_prefijo(codigo_barras)])
+    return _pagina_por_clave(conn, 'productos', columnas, orden, 'id_producto', filtros, params, cursor,
+                             descendente, limite)
+
+
+def _entero_o_none(valor):
+    """Entero de un parámetro del request o None si viene vacío; ValueError si no entra en un INTEGER."""
+    valor = (valor or '').strip()
+    return _entero_sqlite(valor) if valor else None
+
+
+def _filtros_grilla_desde_request():
+    """Parámetros de /api/productos/grilla; lanza ValueError si alguno no es válido."""
+    orden = request.args.get('orden', 'descripcion').strip()
+    columnas = request.args.get('columnas', '').strip()
+    limite = _entero_o_none(request.args.get('limite')) or PRODUCTOS_POR_PAGINA
+    return {
+        'texto': request.args.get('q', '').strip() or None,
+        'stock_min': _entero_o_none(request.args.get('stock_min')),
+        'stock_max': _entero_o_none(request.args.get('stock_max')),
+        'codigo_barras': request.args.get('codigo_barras', '').strip() or None,
+        'orden': orden.lstrip('-'),
+        'descendente': orden.startswith('-'),
+        'columnas': columnas.split(',') if columnas else None,
+        'cursor': request.args.get('cursor', '').strip() or None,
+        'limite': max(1, min(limite, PRODUCTOS_POR_PAGINA_MAX)),
+    }
+
+
+@app.route('/api/productos/grilla', methods=['GET'])
+def api_productos_grilla():
+    """Grilla de productos: q, stock_min, stock_max, codigo_barras, orden (con '-' descendente),
+    columnas (separadas por coma), limite y cursor."""
+    try:
+        filtros = _filtros_grilla_desde_request()
+    except ValueError:
+        return jsonify({'error': 'parámetro inválido'}), 400
+    conn = get_db_connection()
+    try:
+        productos, siguiente = buscar_productos_grilla(conn, **filtros)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify({'productos': productos, 'siguiente': siguiente})
+
+
 @app.route('/dashboard/gestion_productos', methods=['GET'])
 def gestion_productos():
     if "user" not in session:
         flash("Debes iniciar sesión para acceder.", "warning")
         return redirect(url_for("login"))
-    
+
+    # Solo la primera página va embebida; el resto lo pide la grilla a /api/productos/grilla
     conn = get_db_connection()
-    productos = conn.execute('SELECT * FROM productos ORDER BY descripcion').fetchall()
+    productos, siguiente = buscar_productos_grilla(conn)
     conn.close()
-    return render_template('gestion_productos.html', productos=productos)
+    return render_template('gestion_productos.html', inicial={'productos': productos, 'siguiente': siguiente})
+
+
+#----------------------------------------------------- Cajas ------------------------------------------------------
+# Cada venta se asocia a la caja abierta y registrar_venta() suma su total en cajas_totales
+# (por caja y método de pago). Cerrar la caja compara lo declarado con esos acumulados,
+# sin recorrer las facturas del turno.
+
+METODO_EFECTIVO = 'efectivo'
+
+
+def caja_abierta(conn, usuario=None):
+    """Id de la caja abierta del usuario o, si no tiene, de la última abierta. None si no hay ninguna."""
+    fila = conn.execute("""SELECT id_caja FROM cajas WHERE estado = 'abierta'
+                           ORDER BY usuario IS NOT ?, fecha_apertura DESC LIMIT 1""", (usuario,)).fetchone()
+    return fila['id_caja'] if fila else None
+
+
+def conciliar_caja(conn, id_caja, monto_declarado=None):
+    """Esperado contra declarado de una caja, con los totales por método de pago.
+
+    El efectivo esperado es el monto de apertura más las ventas en efectivo; los demás
+    métodos no pasan por el cajón y se informan aparte. Devuelve None si la caja no existe.
+    """
+    caja = conn.execute('SELECT * FROM cajas WHERE id_caja = ?', (id_caja,)).fetchone()
+    if caja is None:
+        return None
+    por_metodo = [dict(r) for r in conn.execute(
+        'SELECT metodo_pago, cantidad_ventas, total FROM cajas_totales WHERE id_caja = ? ORDER BY metodo_pago',
+        (id_caja,))]
+    efectivo = sum(m['total'] for m in por_metodo if m['metodo_pago'] == METODO_EFECTIVO)
+    esperado = round(caja['monto_apertura'] + efectivo, 2)
+    if monto_declarado is None:
+        monto_declarado = caja['monto_cierre']
+    return {
+        'id_caja': caja['id_caja'],
+        'estado': caja['estado'],
+        'usuario': caja['usuario'],
+        'fecha_apertura': caja['fecha_apertura'],
+        'fecha_cierre': caja['fecha_cierre'],
+        'monto_apertura': caja['monto_apertura'],
+        'por_metodo': por_metodo,
+        'cantidad_ventas': sum(m['cantidad_ventas'] for m in por_metodo),
+        'total_ventas': round(sum(m['total'] for m in por_metodo), 2),
+        'efectivo_esperado': esperado,
+        'efectivo_declarado': monto_declarado,
+        'diferencia': None if monto_declarado is None else round(monto_declarado - esperado, 2),
+    }
+
+
+def cerrar_y_conciliar_caja(conn, id_caja, monto_declarado):
+    """Cierra la caja guardando esperado y diferencia; devuelve la conciliación.
+
+    Con BEGIN IMMEDIATE ninguna venta puede sumarse entre la lectura de los totales y el cierre.
+    Lanza ValueError si la caja no existe o ya estaba cerrada.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conciliacion = conciliar_caja(conn, id_caja, monto_declarado)
+        if conciliacion is None:
+            raise ValueError('Caja no encontrada.')
+        if conciliacion['estado'] != 'abierta':
+            raise ValueError('La caja ya está cerrada.')
+        fecha_cierre = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.execute("""UPDATE cajas SET monto_cierre = ?, fecha_cierre = ?, estado = 'cerrada',
+                               monto_esperado = ?, diferencia = ?
+                        WHERE id_caja = ?""",
+                     (monto_declarado, fecha_cierre, conciliacion['efectivo_esperado'], conciliacion['diferencia'], id_caja))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conciliacion.update(estado='cerrada', fecha_cierre=fecha_cierre)
+    return conciliacion
+
+
+def reconstruir_cajas_totales(conn):
+    """Recalcula cajas_totales desde cero a partir de facturas."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _reconstruir_cajas_totales(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute('SELECT COUNT(*) FROM cajas_totales').fetchone()[0]
+
+
+@app.cli.command('rebuild-cajas-totales')
+def rebuild_cajas_totales_command():
+    """Reconstruye los acumulados por caja y método de pago."""
+    with app.app_context():
+        filas = reconstruir_cajas_totales(get_db_connection())
+    print(f"cajas_totales reconstruida: {filas} filas.")
 
 
 @app.route('/dashboard/cajas', methods=['GET'])
@@ -806,9 +3364,10 @@ def abrir_caja():
     usuario = session.get('user')
     monto_apertura = request.form.get('monto_apertura')
     try:
-        monto_apertura = float(monto_apertura) if monto_apertura else 0.0
-    except:
-        monto_apertura = 0.0
+        monto_apertura = _decimal_finito(monto_apertura) if monto_apertura else 0.0
+    except ValueError:
+        flash('El monto de apertura no es un número válido.', 'danger')
+        return redirect(url_for('gestion_cajas'))
 
     fecha_apertura = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
@@ -832,26 +3391,62 @@ def cerrar_caja(id):
         flash("Debes iniciar sesión para acceder.", "warning")
         return redirect(url_for("login"))
 
-    monto_cierre = request.form.get('monto_cierre')
+    # Un monto no finito (nan, inf) cerraría la caja para siempre con la diferencia en NULL
     try:
-        monto_cierre = float(monto_cierre) if monto_cierre else None
-    except:
-        monto_cierre = None
-
-    fecha_cierre = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        monto_cierre = _decimal_finito(request.form.get('monto_cierre'))
+    except (TypeError, ValueError):
+        flash('Ingresá el monto contado en la caja.', 'danger')
+        return redirect(url_for('gestion_cajas'))
 
     conn = get_db_connection()
     try:
-        conn.execute('UPDATE cajas SET monto_cierre = ?, fecha_cierre = ?, estado = ? WHERE id_caja = ?',
-                     (monto_cierre, fecha_cierre, 'cerrada', id))
-        conn.commit()
-        flash('Caja cerrada correctamente', 'success')
+        conciliacion = cerrar_y_conciliar_caja(conn, id, monto_cierre)
+        diferencia = conciliacion['diferencia']
+        if diferencia == 0:
+            flash('Caja cerrada correctamente. El efectivo coincide con lo esperado.', 'success')
+        else:
+            flash(f"Caja cerrada. Esperado ${conciliacion['efectivo_esperado']:.2f}, "
+                  f"declarado ${monto_cierre:.2f}: {'sobrante' if diferencia > 0 else 'faltante'} de ${abs(diferencia):.2f}.",
+                  'warning')
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('gestion_cajas'))
     except Exception as e:
         flash(f'Error al cerrar caja: {e}', 'danger')
+        return redirect(url_for('gestion_cajas'))
     finally:
         conn.close()
 
-    return redirect(url_for('gestion_cajas'))
+    return redirect(url_for('detalle_caja', id=id))
+
+
+@app.route('/dashboard/cajas/<int:id>', methods=['GET'])
+def detalle_caja(id):
+    if "user" not in session:
+        flash("Debes iniciar sesión para acceder.", "warning")
+        return redirect(url_for("login"))
+
+    conn = get_db_connection()
+    conciliacion = conciliar_caja(conn, id)
+    conn.close()
+    if conciliacion is None:
+        flash('Caja no encontrada.', 'danger')
+        return redirect(url_for('gestion_cajas'))
+    return render_template('detalle_caja.html', c=conciliacion)
+
+
+@app.route('/api/cajas/<int:id>/conciliacion', methods=['GET'])
+def api_conciliacion_caja(id):
+    """Esperado contra declarado; mientras la caja está abierta sirve como arqueo parcial."""
+    conn = get_db_connection()
+    try:
+        conciliacion = conciliar_caja(conn, id)
+    finally:
+        conn.close()
+    if conciliacion is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(conciliacion)
+
 
 @app.route('/productos/agregar', methods=['POST'])
 def agregar_producto():
@@ -890,11 +3485,12 @@ def agregar_producto():
                 flash('El código de barras ya está registrado en otro producto.', 'danger')
                 conn.close()
                 return redirect(url_for('gestion_productos'))
-        conn.execute(
+        cursor = conn.execute(
             'INSERT INTO productos (descripcion, precio, stock, precio_costo, margen_ganancia, codigo_barras) VALUES (?, ?, ?, ?, ?, ?)',
             (descripcion, precio, stock, precio_costo, margen_ganancia, codigo_barras)
         )
         conn.commit()
+        catalogo_cache.refrescar(conn, [cursor.lastrowid])
         flash('Producto agregado exitosamente', 'success')
     except Exception as e:
         conn.rollback()
@@ -942,6 +3538,7 @@ def editar_producto(id):
         conn.execute('UPDATE productos SET descripcion = ?, precio = ?, stock = ?, precio_costo = ?, margen_ganancia = ?, codigo_barras = ? WHERE id_producto = ?',
                      (descripcion, precio, stock, precio_costo, margen_ganancia, codigo_barras, id))
         conn.commit()
+        catalogo_cache.refrescar(conn, [id])
         flash('Producto actualizado exitosamente', 'success')
     except Exception as e:
         flash(f'Error al actualizar producto: {str(e)}', 'danger')
@@ -960,6 +3557,7 @@ def eliminar_producto(id):
     try:
         conn.execute("DELETE FROM productos WHERE id_producto = ?", (id,))
         conn.commit()
+        catalogo_cache.quitar(id)
         flash("Producto eliminado correctamente", "success")
     except Exception as e:
         flash(f"Error al eliminar producto: {str(e)}", "danger")
@@ -968,6 +3566,303 @@ def eliminar_producto(id):
     
     return redirect(url_for('gestion_productos'))
 
+#----------------------------------------------------- Importación de productos ------------------------------------------------------
+
+IMPORTACION_BLOQUE = 1000
+
+
+def _numero(valor):
+    """'1234.5', '1234,5' o '' -> float o None. Lanza ValueError si no es un número finito."""
+    valor = (valor or '').strip()
+    if not valor:
+        return None
+    if ',' in valor and '.' not in valor:
+        valor = valor.replace(',', '.')
+    numero = float(valor)
+    # float() acepta 'inf' y 'nan': el stock no se podría pasar a entero y un NaN se guardaría como 0
+    if not math.isfinite(numero):
+        raise ValueError(valor)
+    return numero
+
+
+def _validar_fila_importacion(fila):
+    """Devuelve la tupla para el upsert o lanza ValueError con el motivo."""
+    codigo_barras = (fila.get('codigo_barras') or '').strip()
+    descripcion = (fila.get('descripcion') or '').strip()
+    if not codigo_barras:
+        raise ValueError('falta codigo_barras')
+    if not descripcion:
+        raise ValueError('falta descripcion')
+    try:
+        precio = _numero(fila.get('precio'))
+        precio_costo = _numero(fila.get('precio_costo'))
+        margen_ganancia = _numero(fila.get('margen_ganancia'))
+        stock = _numero(fila.get('stock'))
+    except ValueError:
+        raise ValueError('valor numérico inválido')
+    if stock is not None:
+        if stock != int(stock):
+            raise ValueError('stock debe ser entero')
+        if stock >= 2 ** 63:
+            raise ValueError('stock fuera de rango')
+        stock = int(stock)
+    if any(v is not None and v < 0 for v in (precio, precio_costo, margen_ganancia, stock)):
+        raise ValueError('valores negativos')
+    categoria = (fila.get('categoria') or '').strip() or None
+    try:
+        id_proveedor = int(fila['id_proveedor']) if (fila.get('id_proveedor') or '').strip() else None
+    except ValueError:
+        raise ValueError('id_proveedor inválido')
+    # Precio para el alta; si el producto ya existe el upsert lo recalcula con costo/margen combinados
+    if precio_costo is not None and margen_ganancia is not None:
+        precio = round(precio_costo * (1 + (margen_ganancia / 100)), 2)
+    return (descripcion, precio, stock, precio_costo, margen_ganancia, codigo_barras, categoria, id_proveedor)
+
+
+# Un solo upsert para altas y actualizaciones. Las columnas que no vienen (NULL)
+# conservan el valor actual, y el precio se recalcula en SQL con el costo y el margen
+# resultantes: una lista de costos del proveedor reprecia con el margen ya cargado.
+UPSERT_PRODUCTO = '''
+    INSERT INTO productos (descripcion, precio, stock, precio_costo, margen_ganancia, codigo_barras, categoria, id_proveedor)
+    VALUES (:descripcion, IFNULL(:precio, 0), IFNULL(:stock, 0), :precio_costo, :margen_ganancia, :codigo_barras,
+            :categoria, :id_proveedor)
+    ON CONFLICT (codigo_barras) DO UPDATE SET
+        descripcion = excluded.descripcion,
+        categoria = IFNULL(:categoria, productos.categoria),
+        id_proveedor = IFNULL(:id_proveedor, productos.id_proveedor),
+        stock = IFNULL(:stock, productos.stock),
+        precio_costo = IFNULL(:precio_costo, productos.precio_costo),
+        margen_ganancia = IFNULL(:margen_ganancia, productos.margen_ganancia),
+        precio = CASE
+            WHEN IFNULL(:precio_costo, productos.precio_costo) IS NOT NULL
+                 AND IFNULL(:margen_ganancia, productos.margen_ganancia) IS NOT NULL
+                 AND (:precio_costo IS NOT NULL OR :margen_ganancia IS NOT NULL)
+            THEN ROUND(IFNULL(:precio_costo, productos.precio_costo)
+                       * (1 + IFNULL(:margen_ganancia, productos.margen_ganancia) / 100.0), 2)
+            ELSE IFNULL(:precio, productos.precio)
+        END
+'''
+COLUMNAS_UPSERT = ('descripcion', 'precio', 'stock', 'precio_costo', 'margen_ganancia', 'codigo_barras',
+                   'categoria', 'id_proveedor')
+
+
+def importar_productos(conn, lineas, tamano_bloque=IMPORTACION_BLOQUE):
+    """Importa productos desde un CSV (iterable de líneas de texto) en una sola transacción.
+
+    Columnas: codigo_barras y descripcion obligatorias; precio, precio_costo,
+    margen_ganancia, stock, categoria e id_proveedor opcionales. Separador ',' o ';'. Las filas se validan
+    y se mandan en bloques con executemany; las que no validan no frenan el resto
+    y se informan en `errores` como (número de línea, motivo). Un producto nuevo
+    sin precio ni costo+margen queda con precio 0.
+    """
+    lineas = iter(lineas)
+    encabezado = next(lineas, '')
+    delimitador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+    reader = csv.DictReader(lineas, fieldnames=[c.strip().lower() for c in next(csv.reader([encabezado], delimiter=delimitador), [])],
+                            delimiter=delimitador)
+    faltantes = {'codigo_barras', 'descripcion'} - set(reader.fieldnames or [])
+    if faltantes:
+        raise ValueError(f"Faltan columnas: {', '.join(sorted(faltantes))}")
+
+    resultado = {'importados': 0, 'errores': []}
+    bloque = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for fila in reader:
+            try:
+                bloque.append(dict(zip(COLUMNAS_UPSERT, _validar_fila_importacion(fila))))
+            except ValueError as e:
+                # +1 por el encabezado, que se leyó aparte: el número coincide con la línea del archivo
+                resultado['errores'].append((reader.line_num + 1, str(e)))
+                continue
+            if len(bloque) >= tamano_bloque:
+                conn.executemany(UPSERT_PRODUCTO, bloque)
+                resultado['importados'] += len(bloque)
+                bloque = []
+        if bloque:
+            conn.executemany(UPSERT_PRODUCTO, bloque)
+            resultado['importados'] += len(bloque)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    catalogo_cache.invalidar()
+    dashboard_cache.invalidar()
+    return resultado
+
+
+@app.route('/productos/importar', methods=['POST'])
+def importar_productos_csv():
+    if "user" not in session:
+        flash("Debes iniciar sesión para acceder.", "warning")
+        return redirect(url_for("login"))
+
+    archivo = request.files.get('archivo')
+    if not archivo or archivo.filename == '':
+        flash('Seleccioná un archivo CSV.', 'danger')
+        return redirect(url_for('gestion_productos'))
+
+    conn = get_db_connection()
+    try:
+        # Se lee el archivo subido de a líneas, sin cargarlo entero en memoria
+        resultado = importar_productos(conn, io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline=''))
+        flash(f"Importación terminada: {resultado['importados']} productos, {len(resultado['errores'])} filas con errores.",
+              'success' if not resultado['errores'] else 'warning')
+        for linea, motivo in resultado['errores'][:20]:
+            flash(f"Línea {linea}: {motivo}", 'danger')
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        flash(f'No se pudo importar el archivo: {e}', 'danger')
+    finally:
+        conn.close()
+
+    return redirect(url_for('gestion_productos'))
+
+
+@app.cli.command('importar-productos')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+def importar_productos_command(archivo):
+    """Importa o actualiza productos desde un CSV (upsert por codigo_barras)."""
+    with app.app_context(), open(archivo, encoding='utf-8-sig', newline='') as f:
+        resultado = importar_productos(get_db_connection(), f)
+    print(f"Importados: {resultado['importados']}")
+    for linea, motivo in resultado['errores']:
+        print(f"Línea {linea}: {motivo}")
+
+
+#----------------------------------------------------- Repreciado masivo ------------------------------------------------------
+
+REPRECIO_VISTA_PREVIA = 100
+
+
+def _decimal_finito(valor):
+    """float(valor) para los números del JSON; 'nan' e 'inf' también son ValueError."""
+    numero = float(valor)
+    if not math.isfinite(numero):
+        raise ValueError(f'valor numérico inválido: {valor}')
+    return numero
+
+
+def _filtro_repreciado(filtros):
+    """WHERE y parámetros para elegir los productos a repreciar.
+
+    Filtros admitidos: categoria, id_proveedor, margen_desde/margen_hasta (margen
+    actual, en %) y texto (contenido en la descripción).
+    """
+    if not isinstance(filtros, dict):
+        raise ValueError('filtros debe ser un objeto')
+    condiciones = []
+    params = []
+    if filtros.get('categoria'):
+        condiciones.append('categoria = ?')
+        params.append(filtros['categoria'])
+    if filtros.get('id_proveedor') not in (None, ''):
+        condiciones.append('id_proveedor = ?')
+        params.append(_entero_sqlite(filtros['id_proveedor']))
+    if filtros.get('margen_desde') not in (None, ''):
+        condiciones.append('margen_ganancia >= ?')
+        params.append(_decimal_finito(filtros['margen_desde']))
+    if filtros.get('margen_hasta') not in (None, ''):
+        condiciones.append('margen_ganancia <= ?')
+        params.append(_decimal_finito(filtros['margen_hasta']))
+    if filtros.get('texto'):
+        condiciones.append('descripcion LIKE ?')
+        params.append('%' + filtros['texto'] + '%')
+    return ('WHERE ' + ' AND '.join(condiciones)) if condiciones else '', params
+
+
+def _expresiones_repreciado(porcentaje_costo, margen):
+    """Expresiones SQL (costo, margen, precio) nuevas, en función de la fila actual.
+
+    - porcentaje_costo: el costo sube/baja ese %, y el precio se recalcula con el margen
+      (si el producto no tiene costo, el mismo % se aplica directo al precio).
+    - margen: nuevo margen; el precio se recalcula con el costo (si no hay costo no cambia).
+    """
+    costo = 'precio_costo'
+    nuevo_margen = 'margen_ganancia'
+    params_costo, params_margen = [], []
+    if porcentaje_costo is not None:
+        costo = 'ROUND(precio_costo * (1 + ? / 100.0), 2)'
+        params_costo = [porcentaje_costo]
+    if margen is not None:
+        nuevo_margen = '?'
+        params_margen = [margen]
+    precio = (f'CASE WHEN precio_costo IS NOT NULL AND {nuevo_margen} IS NOT NULL '
+              f'THEN ROUND({costo} * (1 + {nuevo_margen} / 100.0), 2) ')
+    params_precio = params_margen + params_costo + params_margen
+    if porcentaje_costo is not None:
+        precio += 'ELSE ROUND(precio * (1 + ? / 100.0), 2) END'
+        params_precio.append(porcentaje_costo)
+    else:
+        precio += 'ELSE precio END'
+    return (costo, params_costo), (nuevo_margen, params_margen), (precio, params_precio)
+
+
+def repreciar_productos(conn, filtros, porcentaje_costo=None, margen=None, aplicar=False,
+                        limite_vista=REPRECIO_VISTA_PREVIA):
+    """Aplica un % de cambio de costo o un margen nuevo a los productos filtrados.
+
+    Con aplicar=False no modifica nada: devuelve cuántos productos se verían
+    afectados y una vista previa con precio viejo y nuevo. Con aplicar=True hace
+    un único UPDATE set-based para todos los productos del filtro.
+    """
+    if porcentaje_costo is None and margen is None:
+        raise ValueError('Indicá un porcentaje de cambio de costo o un margen nuevo.')
+    where, params = _filtro_repreciado(filtros)
+    (costo, p_costo), (nuevo_margen, p_margen), (precio, p_precio) = _expresiones_repreciado(porcentaje_costo, margen)
+
+    afectados = conn.execute(f'SELECT COUNT(*) FROM productos {where}', params).fetchone()[0]
+    vista = conn.execute(f'''
+        SELECT id_producto, descripcion, precio_costo, margen_ganancia, precio,
+               {costo} as precio_costo_nuevo, {nuevo_margen} as margen_nuevo, {precio} as precio_nuevo
+        FROM productos {where}
+        ORDER BY descripcion
+        LIMIT ?
+    ''', p_costo + p_margen + p_precio + params + [limite_vista]).fetchall()
+    resultado = {'afectados': afectados, 'vista': [dict(r) for r in vista], 'aplicado': False}
+
+    if aplicar and afectados:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # El precio se calcula con los valores viejos de la fila (SQLite evalúa el SET sobre la fila original)
+            cursor = conn.execute(f'''
+                UPDATE productos
+                SET precio = {precio}, precio_costo = {costo}, margen_ganancia = {nuevo_margen}
+                {where}
+            ''', p_precio + p_costo + p_margen + params)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        resultado['afectados'] = cursor.rowcount
+        resultado['aplicado'] = True
+        catalogo_cache.invalidar()
+    return resultado
+
+
+@app.route('/api/productos/repreciar', methods=['POST'])
+def api_repreciar_productos():
+    """JSON: {filtros: {...}, porcentaje_costo | margen, aplicar: bool}. Sin aplicar es una vista previa."""
+    if "user" not in session:
+        return jsonify({'error': 'no autenticado'}), 401
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return jsonify({'error': 'se esperaba un objeto JSON'}), 400
+    try:
+        porcentaje_costo = _decimal_finito(datos['porcentaje_costo']) if datos.get('porcentaje_costo') not in (None, '') else None
+        margen = _decimal_finito(datos['margen']) if datos.get('margen') not in (None, '') else None
+        conn = get_db_connection()
+        try:
+            resultado = repreciar_productos(conn, datos.get('filtros') or {}, porcentaje_costo, margen,
+                                            aplicar=bool(datos.get('aplicar')))
+        finally:
+            conn.close()
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({'error': f'No se pudo repreciar: {e}'}), 400
+    return jsonify(resultado)
+
+
 #----------------------------------------------------- Configuracion ------------------------------------------------------
 @app.route("/dashboard/configuracion", methods=["GET"])
 def ver_configuracion():
@@ -985,4 +3880,7 @@ def about():
 
 
 if __name__ == "__main__":
+    migrar_base()
+    with app.app_context():
+        recuperar_tareas_colgadas(get_db_connection())
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""Benchmark de la búsqueda de productos: LIKE '%q%' contra FTS5 y el índice en memoria.
+
+    python benchmarks/bench_busqueda.py [--productos 100000] [--repeticiones 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (app, migrar_base, get_db_connection, close_db_pool, catalogo_cache,  # noqa: E402
+                 buscar_productos_fts, tiene_busqueda_fts)
+
+MARCAS = ["La Serenísima", "Arcor", "Terrabusi", "Ledesma", "Cañuelas", "Marolio", "Bagley", "Taragüí"]
+PRODUCTOS = ["Azúcar", "Yerba mate", "Galletitas", "Fideos", "Arroz", "Leche", "Café", "Té", "Dulce de leche",
+             "Alfajor", "Caramelos", "Harina", "Aceite", "Gaseosa", "Jabón", "Limón", "Mermelada"]
+VARIANTES = ["común", "light", "sin TACC", "integral", "clásico", "premium", "familiar", "x 500g", "x 1kg", "x 2L"]
+CONSULTAS = ["azucar", "yerba", "dulce", "gal", "cafe", "limon", "terrab", "leche ser", "sin tacc", "jab"]
+
+
+def sembrar(conn, cantidad):
+    rnd = random.Random(7)
+    filas = [(f"{rnd.choice(PRODUCTOS)} {rnd.choice(MARCAS)} {rnd.choice(VARIANTES)} #{i}", 100.0, rnd.randint(0, 50))
+             for i in range(cantidad)]
+    conn.executemany("INSERT INTO productos (descripcion, precio, stock) VALUES (?, ?, ?)", filas)
+    conn.commit()
+
+
+def buscar_like(conn, q, limite=20):
+    return conn.execute("SELECT id_producto, descripcion, precio, stock, codigo_barras FROM productos "
+                        "WHERE descripcion LIKE ? AND stock > 0 LIMIT ?", ('%' + q + '%', limite)).fetchall()
+
+
+def medir(nombre, funcion, conn, repeticiones):
+    funcion(conn, CONSULTAS[0])  # calentar (carga el catálogo en memoria)
+    encontrados = 0
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for q in CONSULTAS:
+            encontrados += len(funcion(conn, q))
+    duracion = time.perf_counter() - inicio
+    consultas = repeticiones * len(CONSULTAS)
+    print(f"{nombre:<12} {duracion / consultas * 1000:>8.3f} ms/consulta "
+          f"{encontrados / consultas:>6.1f} resultados/consulta")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--productos", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, "bench.db")
+        migrar_base()
+        with app.app_context():
+            conn = get_db_connection()
+            sembrar(conn, args.productos)
+            print(f"{args.productos} productos, {len(CONSULTAS)} consultas x {args.repeticiones}")
+            medir("LIKE", buscar_like, conn, args.repeticiones)
+            if tiene_busqueda_fts(conn):
+                medir("FTS5", buscar_productos_fts, conn, args.repeticiones)
+            else:
+                print("FTS5       no disponible en este SQLite")
+            medir("memoria", catalogo_cache.buscar, conn, args.repeticiones)
+        close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark del checkout: sentencias por venta y ventas por segundo.
+
+Compara el loop original del POST de /dashboard/ventas (un SELECT, un INSERT
+y un UPDATE por línea) contra registrar_venta().
+
+    python benchmarks/bench_checkout.py [--ventas 300] [--items 40]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, migrar_base, get_db_connection, close_db_pool, registrar_venta  # noqa: E402
+
+
+def venta_original(conn, id_cliente, items, metodo_pago):
+    """Copia del algoritmo anterior, solo para comparar."""
+    fecha = time.strftime("%Y-%m-%d %H:%M:%S")
+    cursor = conn.execute("INSERT INTO facturas (id_cliente, fecha, total) VALUES (?, ?, ?)", (id_cliente, fecha, 0))
+    id_factura = cursor.lastrowid
+    total_factura = 0
+    for id_producto, cantidad in items:
+        producto = conn.execute("SELECT precio, stock FROM productos WHERE id_producto = ?", (id_producto,)).fetchone()
+        precio_unitario = producto['precio']
+        subtotal = precio_unitario * cantidad
+        total_factura += subtotal
+        conn.execute("""INSERT INTO detalle_factura
+                          (id_factura, id_producto, cantidad, precio_unitario, subtotal, metodo_pago)
+                          VALUES (?, ?, ?, ?, ?, ?)""",
+                       (id_factura, id_producto, cantidad, precio_unitario, subtotal, metodo_pago))
+        conn.execute("UPDATE productos SET stock = stock - ? WHERE id_producto = ?", (cantidad, id_producto))
+    conn.execute("UPDATE facturas SET total = ? WHERE id_factura = ?", (total_factura, id_factura))
+    conn.commit()
+
+
+def sembrar(conn, cantidad_productos):
+    conn.execute("INSERT INTO clientes (id_cliente, nombre) VALUES (1, 'Consumidor final')")
+    conn.executemany("INSERT INTO productos (descripcion, precio, stock, precio_costo) VALUES (?, ?, ?, ?)",
+                     [(f"Producto {i}", 100.0 + i, 10 ** 9, 60.0) for i in range(cantidad_productos)])
+    conn.commit()
+
+
+class ContadorSentencias:
+    """Envuelve la conexión y cuenta las llamadas a execute/executemany."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.llamadas = 0
+
+    def execute(self, *args):
+        self.llamadas += 1
+        return self._conn.execute(*args)
+
+    def executemany(self, *args):
+        self.llamadas += 1
+        return self._conn.executemany(*args)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+def medir(nombre, funcion, conn, carritos):
+    contador = ContadorSentencias(conn)
+    ejecuciones = []
+    conn.set_trace_callback(ejecuciones.append)
+    inicio = time.perf_counter()
+    for items in carritos:
+        funcion(contador, 1, items, "efectivo")
+    duracion = time.perf_counter() - inicio
+    conn.set_trace_callback(None)
+    print(f"{nombre:<18} {contador.llamadas / len(carritos):>7.1f} sentencias/venta "
+          f"{len(ejecuciones) / len(carritos):>7.1f} ejecuciones/venta "
+          f"{len(carritos) / duracion:>9.1f} ventas/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ventas", type=int, default=300)
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--productos", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, "bench.db")
+        migrar_base()
+        rnd = random.Random(42)
+        carritos = [[(i, rnd.randint(1, 3)) for i in rnd.sample(range(1, args.productos + 1), args.items)]
+                    for _ in range(args.ventas)]
+        with app.app_context():
+            conn = get_db_connection()
+            sembrar(conn, args.productos)
+            print(f"{args.ventas} ventas de {args.items} items")
+            medir("antes (por línea)", venta_original, conn, carritos)
+            medir("registrar_venta", registrar_venta, conn, carritos)
+        close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark de la importación masiva de productos, en filas por segundo.
+
+Importa una lista de precios sintética (todas altas) y después la misma lista
+con costos nuevos (todas actualizaciones por codigo_barras).
+
+    python benchmarks/bench_importacion.py [--filas 20000]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, migrar_base, get_db_connection, close_db_pool, importar_productos  # noqa: E402
+
+
+def lista_de_precios(filas, seed):
+    rnd = random.Random(seed)
+    salida = io.StringIO()
+    salida.write("codigo_barras;descripcion;precio_costo;margen_ganancia;stock\n")
+    for i in range(filas):
+        salida.write(f"779{i:010d};Producto {i};{rnd.uniform(10, 5000):.2f};{rnd.choice([25, 30, 40])};{rnd.randint(0, 100)}\n")
+    salida.seek(0)
+    return salida
+
+
+def medir(nombre, conn, archivo, filas):
+    inicio = time.perf_counter()
+    resultado = importar_productos(conn, archivo)
+    duracion = time.perf_counter() - inicio
+    assert resultado['importados'] == filas and not resultado['errores']
+    print(f"{nombre:<16} {duracion:>7.3f} s {filas / duracion:>10.0f} filas/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, "bench.db")
+        migrar_base()
+        with app.app_context():
+            conn = get_db_connection()
+            print(f"{args.filas} filas")
+            medir("altas", conn, lista_de_precios(args.filas, 1), args.filas)
+            medir("actualizaciones", conn, lista_de_precios(args.filas, 2), args.filas)
+        close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
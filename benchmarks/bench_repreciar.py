@@ -0,0 +1,45 @@
+"""Benchmark del repreciado masivo: vista previa y UPDATE sobre todo el catálogo.
+
+    python benchmarks/bench_repreciar.py [--productos 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, migrar_base, get_db_connection, close_db_pool, repreciar_productos  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--productos", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, "bench.db")
+        migrar_base()
+        rnd = random.Random(3)
+        with app.app_context():
+            conn = get_db_connection()
+            conn.executemany(
+                "INSERT INTO productos (descripcion, precio, stock, precio_costo, margen_ganancia, categoria) VALUES (?, ?, ?, ?, ?, ?)",
+                [(f"Producto {i}", 0, 10, rnd.uniform(10, 1000), rnd.choice([25, 30, 40]), rnd.choice(["almacen", "bebidas"]))
+                 for i in range(args.productos)])
+            conn.commit()
+            print(f"{args.productos} productos")
+            for nombre, filtros, aplicar in [("vista previa", {}, False),
+                                             ("aplicar todos", {}, True),
+                                             ("aplicar categoría", {"categoria": "bebidas"}, True)]:
+                inicio = time.perf_counter()
+                resultado = repreciar_productos(conn, filtros, porcentaje_costo=8.5, aplicar=aplicar)
+                duracion = time.perf_counter() - inicio
+                print(f"{nombre:<18} {resultado['afectados']:>7} productos {duracion * 1000:>8.1f} ms")
+        close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Prueba de carga: varias cajas vendiendo y consultando a la vez contra la app por HTTP.
+
+Cada caja es un hilo con su propia sesión que repite una mezcla de operaciones
+(lectura de código de barras, búsqueda, venta, listado de facturas, dashboard).
+Informa p50/p99 por operación y el throughput total, y agrega el resultado a
+benchmarks/resultados/carga.jsonl comparándolo con la corrida anterior de igual configuración.
+
+Sin --url levanta la app en un servidor local sobre una base generada con generar_datos.py:
+
+    python benchmarks/carga.py --escala 10k --cajas 8 --duracion 20
+    python benchmarks/carga.py --url http://127.0.0.1:5000 --cajas 4    # base ya sembrada
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generar_datos import ESCALAS, USUARIO_BENCH, codigo_barras, generar  # noqa: E402
+
+RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados', 'carga.jsonl')
+
+# operación -> peso en la mezcla (una caja escanea mucho más de lo que mira el dashboard)
+MEZCLA = {
+    'codigo_barras': 50,
+    'busqueda': 20,
+    'venta': 20,
+    'listado_facturas': 5,
+    'dashboard': 5,
+}
+BUSQUEDAS = ('alf', 'yerba', 'coca', 'galletitas bagley', 'sin azucar', 'chocolate milka', 'agua')
+
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Caja(threading.Thread):
+    """Una caja: sesión propia y una lista de (operación, segundos, ok)."""
+
+    def __init__(self, numero, url, productos, hasta):
+        super().__init__(name=f'caja-{numero}', daemon=True)
+        self.url, self.productos, self.hasta = url, productos, hasta
+        self.rnd = random.Random(numero)
+        self.mediciones = []
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  _SinRedirecciones())
+
+    def _pedir(self, ruta, datos=None):
+        cuerpo = urllib.parse.urlencode(datos, doseq=True).encode() if datos is not None else None
+        try:
+            with self.opener.open(self.url + ruta, data=cuerpo, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def iniciar_sesion(self):
+        self._pedir('/login', {'email': USUARIO_BENCH[1], 'password': USUARIO_BENCH[2]})
+
+    def operacion(self, nombre):
+        producto = self.rnd.randint(1, self.productos)
+        if nombre == 'codigo_barras':
+            return self._pedir(f'/api/productos/by_codigo/{codigo_barras(producto)}') == 200
+        if nombre == 'busqueda':
+            return self._pedir('/api/productos/search?' + urllib.parse.urlencode({'q': self.rnd.choice(BUSQUEDAS)})) == 200
+        if nombre == 'venta':
+            items = sorted({self.rnd.randint(1, self.productos) for _ in range(self.rnd.randint(1, 6))})
+            return self._pedir('/dashboard/ventas', {'id_cliente': '1', 'producto[]': items, 'cantidad[]': [1] * len(items),
+                                                     'metodo_pago': 'efectivo'}) == 302
+        if nombre == 'listado_facturas':
+            return self._pedir('/dashboard/listado_facturas') == 200
+        return self._pedir('/dashboard') == 200
+
+    def run(self):
+        self.iniciar_sesion()
+        nombres, pesos = zip(*MEZCLA.items())
+        while time.perf_counter() < self.hasta:
+            nombre = self.rnd.choices(nombres, pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                ok = self.operacion(nombre)
+            except OSError:
+                ok = False
+            self.mediciones.append((nombre, time.perf_counter() - inicio, ok))
+
+
+def percentil(valores, p):
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+def resumir(mediciones, duracion):
+    por_operacion = {}
+    for nombre, segundos, ok in mediciones:
+        por_operacion.setdefault(nombre, []).append((segundos, ok))
+    resumen = {}
+    for nombre, valores in sorted(por_operacion.items()):
+        tiempos = [s for s, _ in valores]
+        resumen[nombre] = {
+            'cantidad': len(valores),
+            'errores': sum(1 for _, ok in valores if not ok),
+            'p50_ms': round(percentil(tiempos, 50) * 1000, 2),
+            'p99_ms': round(percentil(tiempos, 99) * 1000, 2),
+        }
+    return {'operaciones': resumen, 'total': len(mediciones), 'por_segundo': round(len(mediciones) / duracion, 1)}
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def guardar_y_comparar(resultado):
+    """Agrega la corrida a carga.jsonl y devuelve la anterior con la misma configuración (o None)."""
+    anterior = None
+    if os.path.exists(RESULTADOS):
+        with open(RESULTADOS, encoding='utf-8') as f:
+            for linea in f:
+                previa = json.loads(linea)
+                if previa['config'] == resultado['config']:
+                    anterior = previa
+    os.makedirs(os.path.dirname(RESULTADOS), exist_ok=True)
+    with open(RESULTADOS, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+    return anterior
+
+
+def _variacion(actual, anterior):
+    if not anterior:
+        return ''
+    return f' ({(actual - anterior) / anterior:+.0%})'
+
+
+def imprimir(resultado, anterior):
+    previas = anterior['operaciones'] if anterior else {}
+    print(f"{'operación':<18}{'cantidad':>10}{'errores':>9}{'p50 ms':>16}{'p99 ms':>16}")
+    for nombre, r in resultado['operaciones'].items():
+        previa = previas.get(nombre, {})
+        print(f"{nombre:<18}{r['cantidad']:>10}{r['errores']:>9}"
+              f"{r['p50_ms']:>9}{_variacion(r['p50_ms'], previa.get('p50_ms')):>7}"
+              f"{r['p99_ms']:>9}{_variacion(r['p99_ms'], previa.get('p99_ms')):>7}")
+    print(f"throughput: {resultado['por_segundo']} op/s"
+          f"{_variacion(resultado['por_segundo'], anterior and anterior['por_segundo'])}")
+    if anterior:
+        print(f"comparado con {anterior['fecha']} ({anterior.get('commit') or 'sin commit'})")
+
+
+def servidor_local(db_path):
+    """Levanta la app en un hilo (servidor threaded de werkzeug) y devuelve su URL."""
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+
+    app.config['DATABASE'] = db_path
+    logging.getLogger('kiosco').setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='App ya levantada (sembrada con generar_datos.py)')
+    parser.add_argument('--escala', choices=sorted(ESCALAS), default='10k')
+    parser.add_argument('--db', help='Base generada a reutilizar (sin --url)')
+    parser.add_argument('--cajas', type=int, default=4)
+    parser.add_argument('--duracion', type=float, default=10, help='Segundos de carga')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url
+        if not url:
+            db_path = args.db or os.path.join(tmp, f'kiosco_{args.escala}.db')
+            if not os.path.exists(db_path):
+                generar(db_path, args.escala)
+            url = servidor_local(db_path)
+
+        hasta = time.perf_counter() + args.duracion
+        cajas = [Caja(numero, url.rstrip('/'), ESCALAS[args.escala]['productos'], hasta) for numero in range(args.cajas)]
+        inicio = time.perf_counter()
+        for caja in cajas:
+            caja.start()
+        for caja in cajas:
+            caja.join()
+        duracion = time.perf_counter() - inicio
+
+    resultado = resumir([m for caja in cajas for m in caja.mediciones], duracion)
+    resultado.update(fecha=datetime.now().isoformat(timespec='seconds'), commit=_commit_actual(),
+                     config={'escala': args.escala, 'cajas': args.cajas, 'duracion': args.duracion,
+                             'remoto': bool(args.url)})
+    imprimir(resultado, guardar_y_comparar(resultado))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Generador de datos sintéticos de un kiosco para benchmarks y pruebas de carga.
+
+Crea (o completa) una base migrada con productos, clientes, facturas y su detalle.
+La escala indica las líneas de detalle_factura, la tabla más grande; el resto se
+dimensiona en proporción. Los datos son deterministas para una misma --semilla.
+
+    python benchmarks/generar_datos.py --escala 10k --db /tmp/kiosco_10k.db
+    python benchmarks/generar_datos.py --escala 1m --db /tmp/kiosco_1m.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import migrar_base, _reconstruir_ventas_diarias, _reconstruir_cajas_totales, _reconstruir_compras_clientes  # noqa: E402
+
+# líneas de detalle -> cuántos productos, clientes y días de historia
+ESCALAS = {
+    '10k': {'lineas': 10_000, 'productos': 2_000, 'clientes': 500, 'dias': 60},
+    '1m': {'lineas': 1_000_000, 'productos': 50_000, 'clientes': 20_000, 'dias': 730},
+    '10m': {'lineas': 10_000_000, 'productos': 200_000, 'clientes': 100_000, 'dias': 1825},
+}
+
+USUARIO_BENCH = ('Bench', 'bench@kiosco', 'bench', 'admin')
+METODOS_PAGO = ('efectivo', 'efectivo', 'efectivo', 'tarjeta_debito', 'tarjeta_credito', 'transferencia')
+MARCAS = ('Arcor', 'Terrabusi', 'Coca-Cola', 'Manaos', 'Taragüí', 'Playadito', 'Bagley', 'Milka', 'Águila', 'Fantoche')
+TIPOS = ('Alfajor', 'Galletitas', 'Gaseosa', 'Yerba', 'Chocolate', 'Caramelos', 'Jugo', 'Agua', 'Cerveza', 'Café')
+VARIANTES = ('clásico', 'light', 'triple', 'sin azúcar', 'limón', 'naranja', 'dulce de leche', 'chico', 'grande', '500 g')
+BLOQUE = 50_000
+
+
+def codigo_barras(id_producto):
+    return f'779{id_producto:010d}'
+
+
+def _productos(cantidad, rnd):
+    for i in range(1, cantidad + 1):
+        costo = round(rnd.uniform(50, 3000), 2)
+        margen = rnd.choice((25, 30, 35, 40, 50))
+        descripcion = f'{rnd.choice(TIPOS)} {rnd.choice(MARCAS)} {rnd.choice(VARIANTES)} #{i}'
+        yield (i, descripcion, round(costo * (1 + margen / 100), 2), 10 ** 9, margen, costo,
+               codigo_barras(i), rnd.choice(TIPOS).lower())
+
+
+def _clientes(cantidad):
+    for i in range(1, cantidad + 1):
+        yield (i, f'Cliente {i}', f'Calle {i}', f'11-{i:08d}', f'cliente{i}@kiosco.test')
+
+
+def _ventas(escala, rnd, precios, costos):
+    """Genera (factura, [líneas]) hasta completar las líneas pedidas, repartidas en los días."""
+    inicio = datetime.now() - timedelta(days=escala['dias'])
+    segundos = escala['dias'] * 86400
+    lineas_restantes = escala['lineas']
+    # Se generan ordenadas por fecha, como llegan en la realidad
+    paso = segundos / max(1, escala['lineas'] // 3)
+    instante = 0.0
+    id_factura = 0
+    while lineas_restantes > 0:
+        id_factura += 1
+        instante += rnd.expovariate(1 / paso)
+        fecha = (inicio + timedelta(seconds=min(instante, segundos))).strftime('%Y-%m-%d %H:%M:%S')
+        metodo = rnd.choice(METODOS_PAGO)
+        cantidad_lineas = min(lineas_restantes, rnd.randint(1, 5))
+        lineas_restantes -= cantidad_lineas
+        total = ganancia = 0
+        lineas = []
+        for id_producto in rnd.sample(range(1, len(precios) + 1), cantidad_lineas):
+            cantidad = rnd.randint(1, 3)
+            precio, costo = precios[id_producto - 1], costos[id_producto - 1]
+            subtotal = round(precio * cantidad, 2)
+            total += subtotal
+            ganancia += cantidad * (precio - costo)
+            lineas.append((id_factura, id_producto, cantidad, precio, costo, subtotal, metodo))
+        id_cliente = rnd.randint(1, escala['clientes']) if rnd.random() < 0.3 else 1
+        yield (id_factura, id_cliente, fecha, round(total, 2), round(ganancia, 2), metodo), lineas
+
+
+def _en_bloques(iterable, tamano=BLOQUE):
+    bloque = []
+    for elemento in iterable:
+        bloque.append(elemento)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def generar(db_path, escala='10k', semilla=42, progreso=print):
+    """Migra la base y la llena con la escala pedida. Devuelve las filas por tabla."""
+    escala = ESCALAS[escala] if isinstance(escala, str) else escala
+    migrar_base(db_path)
+    rnd = random.Random(semilla)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Es una base descartable: sin fsync la carga es varias veces más rápida
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        if conn.execute('SELECT COUNT(*) FROM facturas').fetchone()[0]:
+            raise SystemExit(f'{db_path} ya tiene facturas; usá una base nueva.')
+
+        conn.execute('BEGIN')
+        conn.execute('INSERT OR IGNORE INTO usuarios (nombre, email, password, rol) VALUES (?, ?, ?, ?)', USUARIO_BENCH)
+        productos = list(_productos(escala['productos'], rnd))
+        conn.executemany('''INSERT INTO productos (id_producto, descripcion, precio, stock, margen_ganancia,
+                                                   precio_costo, codigo_barras, categoria)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', productos)
+        conn.executemany('INSERT INTO clientes (id_cliente, nombre, direccion, telefono, email) VALUES (?, ?, ?, ?, ?)',
+                         _clientes(escala['clientes']))
+        conn.execute('COMMIT')
+        progreso(f"productos: {len(productos)}, clientes: {escala['clientes']}")
+
+        precios = [p[2] for p in productos]
+        costos = [p[5] for p in productos]
+        del productos
+        lineas_cargadas = 0
+        inicio = time.perf_counter()
+        for bloque in _en_bloques(_ventas(escala, rnd, precios, costos), BLOQUE // 3):
+            conn.execute('BEGIN')
+            conn.executemany('INSERT INTO facturas (id_factura, id_cliente, fecha, total, ganancia, metodo_pago) VALUES (?, ?, ?, ?, ?, ?)',
+                             [factura for factura, _ in bloque])
+            lineas = [linea for _, lineas in bloque for linea in lineas]
+            conn.executemany('''INSERT INTO detalle_factura (id_factura, id_producto, cantidad, precio_unitario,
+                                                             precio_costo, subtotal, metodo_pago)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''', lineas)
+            conn.execute('COMMIT')
+            lineas_cargadas += len(lineas)
+            progreso(f'detalle_factura: {lineas_cargadas}/{escala["lineas"]} '
+                     f'({lineas_cargadas / (time.perf_counter() - inicio):,.0f} líneas/s)')
+
+        conn.execute('BEGIN')
+        _reconstruir_ventas_diarias(conn)
+        _reconstruir_cajas_totales(conn)
+        _reconstruir_compras_clientes(conn)
+        conn.execute('COMMIT')
+        conn.execute('ANALYZE')
+        return {tabla: conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+                for tabla in ('productos', 'clientes', 'facturas', 'detalle_factura')}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escala', choices=sorted(ESCALAS), default='10k')
+    parser.add_argument('--db', required=True, help='Ruta de la base a crear')
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+    inicio = time.perf_counter()
+    filas = generar(args.db, args.escala, args.semilla)
+    print(f'{filas} en {time.perf_counter() - inicio:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
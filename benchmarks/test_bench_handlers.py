@@ -0,0 +1,106 @@
+"""Microbenchmarks (pytest-benchmark) de los handlers calientes sobre datos sintéticos.
+
+La base se genera una vez por sesión con generar_datos.py (KIOSCO_BENCH_ESCALA, 10k por
+defecto). Para guardar cada corrida y compararla con la anterior:
+
+    pytest benchmarks/test_bench_handlers.py --benchmark-autosave \\
+        --benchmark-storage=benchmarks/resultados/pytest --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+import itertools
+import logging
+import os
+import random
+import sys
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, close_db_pool, dashboard_cache, get_dashboard_data  # noqa: E402
+from generar_datos import ESCALAS, codigo_barras, generar  # noqa: E402
+
+ESCALA = os.environ.get('KIOSCO_BENCH_ESCALA', '10k')
+
+
+@pytest.fixture(scope='session')
+def base_bench(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp('bench') / f'kiosco_{ESCALA}.db')
+    generar(db_path, ESCALA, progreso=lambda mensaje: None)
+    return db_path
+
+
+@pytest.fixture
+def client(base_bench):
+    original = {k: app.config[k] for k in ('DATABASE', 'TAREAS_EN_SEGUNDO_PLANO')}
+    app.config.update(DATABASE=base_bench, TAREAS_EN_SEGUNDO_PLANO=False)
+    # El log por request distorsiona los tiempos
+    nivel = logging.getLogger('kiosco').level
+    logging.getLogger('kiosco').setLevel(logging.WARNING)
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user'] = 'Bench'
+        yield client
+    logging.getLogger('kiosco').setLevel(nivel)
+    close_db_pool()
+    app.config.update(original)
+
+
+def _productos_al_azar():
+    rnd = random.Random(7)
+    total = ESCALAS[ESCALA]['productos']
+    return lambda: rnd.randint(1, total)
+
+
+def test_bench_codigo_barras(benchmark, client):
+    siguiente = _productos_al_azar()
+    response = benchmark(lambda: client.get(f'/api/productos/by_codigo/{codigo_barras(siguiente())}'))
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('texto', ['alf', 'yerba playadito', 'sin azucar'])
+def test_bench_busqueda(benchmark, client, texto):
+    response = benchmark(lambda: client.get('/api/productos/search', query_string={'q': texto}))
+    assert response.status_code == 200 and response.get_json()
+
+
+def test_bench_checkout(benchmark, client):
+    siguiente = _productos_al_azar()
+
+    def vender():
+        items = {siguiente() for _ in range(4)}
+        return client.post('/dashboard/ventas', data={'id_cliente': '1', 'producto[]': list(map(str, items)),
+                                                      'cantidad[]': ['1'] * len(items), 'metodo_pago': 'efectivo'})
+    assert benchmark(vender).status_code == 302
+
+
+def test_bench_lote_offline(benchmark, client):
+    """50 ventas de una caja sin conexión en un solo POST (comparar con 50 x test_bench_checkout)."""
+    siguiente = _productos_al_azar()
+    claves = itertools.count()
+
+    def sincronizar():
+        ventas = [{'clave': f'bench-{next(claves):08d}', 'fecha': '2026-01-01 10:00:00', 'id_cliente': 1,
+                   'metodo_pago': 'efectivo', 'items': [{'id_producto': i, 'cantidad': 1} for i in {siguiente() for _ in range(4)}]}
+                  for _ in range(50)]
+        return client.post('/api/ventas/lote', json={'ventas': ventas})
+    assert benchmark(sincronizar).status_code == 200
+
+
+def test_bench_listado_facturas(benchmark, client):
+    assert benchmark(lambda: client.get('/dashboard/listado_facturas')).status_code == 200
+
+
+def test_bench_api_facturas_filtrada(benchmark, client):
+    response = benchmark(lambda: client.get('/api/facturas', query_string={'cliente': 'Cliente 1', 'limite': 50}))
+    assert response.status_code == 200
+
+
+def test_bench_dashboard_sin_cache(benchmark, client):
+    with app.app_context():
+        benchmark.pedantic(get_dashboard_data, setup=dashboard_cache.invalidar, rounds=200)
+
+
+def test_bench_dashboard(benchmark, client):
+    assert benchmark(lambda: client.get('/dashboard')).status_code == 200
@@ -1,12 +1,13 @@
-// Gráfico de Ventas
-const ctx = document.getElementById('ventasChart').getContext('2d');
+// Gráfico de Ventas (últimos 7 días, desde /api/reportes/ventas_diarias)
+const ventasCanvas = document.getElementById('ventasChart');
+const ctx = ventasCanvas.getContext('2d');
 const ventasChart = new Chart(ctx, {
     type: 'line',
     data: {
-        labels: ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom'],
+        labels: [],
         datasets: [{
             label: 'Ventas ($)',
-            data: [8500, 12300, 9800, 15400, 11200, 18600, 12450],
+            data: [],
             borderColor: 'rgb(75, 192, 192)',
             backgroundColor: 'rgba(75, 192, 192, 0.1)',
             tension: 0.4,
@@ -32,6 +33,18 @@ const ventasChart = new Chart(ctx, {
     }
 });
 
+const DIAS_SEMANA = ['Dom', 'Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb'];
+
+fetch(ventasCanvas.dataset.api)
+    .then(resp => resp.json())
+    .then(serie => {
+        // 'YYYY-MM-DD' se interpreta como UTC; agregamos la hora para que quede en el día local
+        ventasChart.data.labels = serie.map(d => DIAS_SEMANA[new Date(d.fecha + 'T00:00:00').getDay()]);
+        ventasChart.data.datasets[0].data = serie.map(d => d.total);
+        ventasChart.update();
+    })
+    .catch(e => console.error('Error cargando ventas diarias', e));
+
 // Efectos hover para las cards
 $('.info-box').hover(
     function() {
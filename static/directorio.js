@@ -0,0 +1,79 @@
+/**
+ * Directorios paginados (productos, clientes, proveedores): búsqueda, orden y páginas los
+ * resuelve la API con cursor, y la primera página viene embebida en la página.
+ *
+ * Todos usan los mismos ids a partir de un nombre: #tabla_<nombre> (con data-api),
+ * #<nombre>_filtros, #<nombre>_cargar_mas, #<nombre>_vacio y #<nombre>_inicial. La API
+ * devuelve la lista bajo la clave <nombre> y el cursor de la página siguiente en `siguiente`.
+ */
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+}
+
+/**
+ * Arma el directorio. opciones: nombre, orden (el inicial), fila(item, tabla) que devuelve
+ * el <tr>, y alError(mensaje) si el directorio quiere mostrar los errores de la API.
+ */
+function directorioPaginado(opciones) {
+    const tabla = document.getElementById('tabla_' + opciones.nombre);
+    if (!tabla) return null;
+    const elemento = sufijo => document.getElementById(`${opciones.nombre}_${sufijo}`);
+    const filtros = elemento('filtros');
+    const estado = { orden: opciones.orden, descendente: false, siguiente: null, pedido: 0 };
+
+    function mostrar(data, agregar) {
+        const tbody = tabla.querySelector('tbody');
+        if (!agregar) tbody.innerHTML = '';
+        data[opciones.nombre].forEach(item => tbody.appendChild(opciones.fila(item, tabla)));
+        estado.siguiente = data.siguiente;
+        elemento('cargar_mas').style.display = data.siguiente ? '' : 'none';
+        elemento('vacio').style.display = tbody.children.length ? 'none' : '';
+    }
+
+    async function pedir(agregar) {
+        const url = new URL(tabla.dataset.api, window.location.origin);
+        new FormData(filtros).forEach((valor, nombre) => {
+            if (String(valor).trim()) url.searchParams.set(nombre, String(valor).trim());
+        });
+        url.searchParams.set('orden', (estado.descendente ? '-' : '') + estado.orden);
+        if (agregar && estado.siguiente) url.searchParams.set('cursor', estado.siguiente);
+        // Si el usuario sigue tipeando, solo se muestra la respuesta del último pedido
+        const pedido = ++estado.pedido;
+        try {
+            const resp = await fetch(url);
+            const data = await resp.json();
+            if (pedido !== estado.pedido) return;
+            if (data.error) {
+                if (opciones.alError) opciones.alError(data.error);
+                return;
+            }
+            mostrar(data, agregar);
+        } catch (e) {
+            console.error(`Error cargando ${opciones.nombre}`, e);
+        }
+    }
+
+    mostrar(JSON.parse(elemento('inicial').textContent), false);
+
+    let espera = null;
+    filtros.addEventListener('input', function() {
+        clearTimeout(espera);
+        espera = setTimeout(() => pedir(false), 250);
+    });
+    filtros.addEventListener('submit', e => e.preventDefault());
+
+    elemento('cargar_mas').addEventListener('click', () => pedir(true));
+
+    tabla.querySelectorAll('th[data-orden]').forEach(th => th.addEventListener('click', function() {
+        estado.descendente = estado.orden === th.dataset.orden ? !estado.descendente : false;
+        estado.orden = th.dataset.orden;
+        tabla.querySelectorAll('th[data-orden] i').forEach(i => i.remove());
+        th.insertAdjacentHTML('beforeend', ` <i class="fas fa-sort-${estado.descendente ? 'down' : 'up'}"></i>`);
+        pedir(false);
+    }));
+
+    return { recargar: () => pedir(false) };
+}
@@ -0,0 +1,31 @@
+/**
+ * Directorio de clientes sobre /api/clientes (ver directorio.js); acá solo se arma cada fila.
+ */
+function filaCliente(c, tabla) {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+        <td>${c.id_cliente}</td>
+        <td>${escaparHtml(c.nombre)}</td>
+        <td>${escaparHtml(c.email)}</td>
+        <td>${escaparHtml(c.telefono)}</td>
+        <td>${escaparHtml(c.direccion)}</td>
+        <td>${c.cantidad_compras}</td>
+        <td>$${Number(c.total_compras).toFixed(2)}</td>
+        <td>${c.ultima_compra ? escaparHtml(c.ultima_compra) : '-'}</td>
+        <td>
+            <a href="${tabla.dataset.editar.replace(/\/0$/, '/' + c.id_cliente)}" class="btn btn-sm btn-info">
+                <i class="fas fa-edit"></i> Editar
+            </a>
+            <form method="POST" action="${tabla.dataset.eliminar.replace(/\/0$/, '/' + c.id_cliente)}" style="display: inline;">
+                <button type="submit" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i> Eliminar</button>
+            </form>
+        </td>`;
+    tr.querySelector('form').addEventListener('submit', function(e) {
+        if (!confirm('¿Estás seguro de que quieres eliminar este cliente?')) e.preventDefault();
+    });
+    return tr;
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    directorioPaginado({ nombre: 'clientes', orden: 'nombre', fila: filaCliente });
+});
@@ -298,35 +298,6 @@ $(window).on('beforeunload', function() {
     }
 });
 
-// Función para buscar productos en la tabla (si se implementa búsqueda)
-function filtrarProductos(searchTerm) {
-    const rows = $('.table tbody tr');
-    
-    if (!searchTerm) {
-        rows.show();
-        return;
-    }
-    
-    rows.each(function() {
-        const text = $(this).text().toLowerCase();
-        if (text.includes(searchTerm.toLowerCase())) {
-            $(this).show();
-        } else {
-            $(this).hide();
-        }
-    });
-}
-
-// Filtrado por nombre (sólo)
-$('#productos_filter_name').on('input', function(){
-    const name = $(this).val().trim().toLowerCase();
-    $('.table tbody tr').each(function(){
-        const cols = $(this).find('td');
-        const descripcion = ($(cols[1]).text() || '').toLowerCase();
-        if(!name || descripcion.includes(name)) $(this).show(); else $(this).hide();
-    });
-});
-
 // --- NUEVAS FUNCIONES: CÁLCULO INVERSO Y MARGEN ---
 /**
  * Calcula el margen porcentual a partir de precio y precio de costo.
@@ -394,4 +365,111 @@ if (typeof window !== 'undefined') {
 // Asegurar que la función esté disponible en el scope global
 if (typeof window !== 'undefined') {
     window.editarProducto = editarProducto;
-}
\ No newline at end of file
+}
+/**
+ * Repreciado masivo: vista previa y aplicación contra /api/productos/repreciar
+ */
+function datosRepreciado(aplicar) {
+    const form = document.getElementById('formRepreciar');
+    const valor = nombre => form.elements[nombre].value.trim();
+    return {
+        filtros: {
+            texto: valor('texto'),
+            categoria: valor('categoria'),
+            id_proveedor: valor('id_proveedor'),
+            margen_desde: valor('margen_desde'),
+            margen_hasta: valor('margen_hasta')
+        },
+        porcentaje_costo: valor('porcentaje_costo'),
+        margen: valor('margen'),
+        aplicar: aplicar
+    };
+}
+
+function formatoPrecio(valor) {
+    return valor === null || valor === undefined ? '-' : '$' + Number(valor).toFixed(2);
+}
+
+function enviarRepreciado(aplicar) {
+    const form = document.getElementById('formRepreciar');
+    return fetch(form.dataset.api, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(datosRepreciado(aplicar))
+    }).then(resp => resp.json());
+}
+
+$('#formRepreciar').on('submit', function(e) {
+    e.preventDefault();
+    enviarRepreciado(false).then(data => {
+        if (data.error) {
+            showAlert(data.error, 'danger');
+            return;
+        }
+        const tbody = document.getElementById('rep_vista');
+        tbody.innerHTML = '';
+        data.vista.forEach(p => {
+            const tr = document.createElement('tr');
+            [p.descripcion, formatoPrecio(p.precio_costo), formatoPrecio(p.precio_costo_nuevo),
+             formatoPrecio(p.precio), formatoPrecio(p.precio_nuevo)].forEach(texto => {
+                const td = document.createElement('td');
+                td.textContent = texto;
+                tr.appendChild(td);
+            });
+            tbody.appendChild(tr);
+        });
+        document.getElementById('rep_resumen').textContent =
+            `${data.afectados} productos afectados` + (data.afectados > data.vista.length ? ` (se muestran ${data.vista.length})` : '');
+        $('#btnAplicarRepreciado').prop('disabled', data.afectados === 0);
+    });
+});
+
+$('#btnAplicarRepreciado').on('click', function() {
+    if (!confirm('¿Aplicar los nuevos precios a todos los productos del filtro?')) return;
+    enviarRepreciado(true).then(data => {
+        if (data.error) {
+            showAlert(data.error, 'danger');
+            return;
+        }
+        window.location.reload();
+    });
+});
+
+/**
+ * Grilla de productos sobre /api/productos/grilla (ver directorio.js): los filtros del
+ * formulario van tal cual como parámetros; acá solo se arma cada fila.
+ */
+function estadoStock(stock) {
+    if (stock === 0) return '<span class="badge badge-danger">Sin Stock</span>';
+    if (stock <= 5) return '<span class="badge badge-warning">Stock Bajo</span>';
+    return '<span class="badge badge-success">Disponible</span>';
+}
+
+function filaProducto(p, tabla) {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+        <td>${p.id_producto}</td>
+        <td>${escaparHtml(p.descripcion)}</td>
+        <td>$${Number(p.precio_costo || 0).toFixed(2)}</td>
+        <td>${Number(p.margen_ganancia || 0).toFixed(2)}%</td>
+        <td>$${Number(p.precio).toFixed(2)}</td>
+        <td>${p.stock}</td>
+        <td>${estadoStock(p.stock)}</td>
+        <td>
+            <button class="btn btn-sm btn-info btn-editar"><i class="fas fa-edit"></i> Editar</button>
+            <form method="POST" action="${tabla.dataset.eliminar.replace(/\/0$/, '/' + p.id_producto)}" style="display: inline;">
+                <button type="submit" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i> Eliminar</button>
+            </form>
+        </td>`;
+    tr.querySelector('.btn-editar').addEventListener('click', () => editarProducto(
+        p.id_producto, p.descripcion, p.precio, p.stock, p.precio_costo, p.margen_ganancia, p.codigo_barras));
+    tr.querySelector('form').addEventListener('submit', function(e) {
+        if (!confirm(`¿Estás seguro de que deseas eliminar el producto "${p.descripcion}"?`)) e.preventDefault();
+    });
+    return tr;
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    directorioPaginado({ nombre: 'productos', orden: 'descripcion', fila: filaProducto,
+                         alError: mensaje => showAlert(mensaje, 'danger') });
+});
\ No newline at end of file
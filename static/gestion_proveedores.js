@@ -0,0 +1,33 @@
+/**
+ * Directorio de proveedores sobre /api/proveedores (ver directorio.js); acá solo se arma
+ * cada fila. La cantidad de facturas y lo adeudado vienen ya acumulados del servidor.
+ */
+function filaProveedor(p, tabla) {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+        <td>${escaparHtml(p.razon_social)}</td>
+        <td>${escaparHtml(p.nombre_comercial)}</td>
+        <td>${escaparHtml(p.cuit)}</td>
+        <td>${escaparHtml(p.telefono)}</td>
+        <td>${escaparHtml(p.email)}</td>
+        <td>${escaparHtml(p.ciudad)}</td>
+        <td>${escaparHtml(p.estado)}</td>
+        <td>${p.cantidad_facturas}</td>
+        <td>$${Number(p.monto_adeudado).toFixed(2)}</td>
+        <td>
+            <button class="btn btn-sm btn-warning btn-editar" data-toggle="modal" data-target="#proveedorModal">Editar</button>
+            <a href="${tabla.dataset.facturas.replace(/\/0\/facturas$/, '/' + p.id + '/facturas')}" class="btn btn-sm btn-primary">Facturas</a>
+            <form method="post" action="${tabla.dataset.eliminar.replace(/\/0$/, '/' + p.id)}" style="display:inline;">
+                <button type="submit" class="btn btn-sm btn-danger">Eliminar</button>
+            </form>
+        </td>`;
+    tr.querySelector('.btn-editar').addEventListener('click', () => openProveedorModal(p));
+    tr.querySelector('form').addEventListener('submit', function(e) {
+        if (!confirm('¿Eliminar proveedor?')) e.preventDefault();
+    });
+    return tr;
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    directorioPaginado({ nombre: 'proveedores', orden: 'razon_social', fila: filaProveedor });
+});
@@ -0,0 +1,57 @@
+// Listado de facturas: pide las páginas siguientes a /api/facturas y las agrega a la tabla
+
+const METODOS_PAGO = {
+    efectivo: 'Efectivo',
+    tarjeta_credito: 'Tarjeta de crédito',
+    tarjeta_debito: 'Tarjeta de débito',
+    transferencia: 'Transferencia'
+};
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+}
+
+function filaFactura(f, urlDetalle) {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+        <td>${f.id_factura}</td>
+        <td>${escaparHtml(f.fecha)}</td>
+        <td>${escaparHtml(f.cliente || 'Venta rápida')}</td>
+        <td>${METODOS_PAGO[f.metodo_pago] || '-'}</td>
+        <td>$${Number(f.total || 0).toFixed(2)}</td>
+        <td>$${Number(f.ganancia || 0).toFixed(2)}</td>
+        <td>
+            <a href="${urlDetalle.replace(/\/0$/, '/' + f.id_factura)}" class="btn btn-sm btn-info">
+                <i class="fas fa-eye"></i> Ver detalle
+            </a>
+        </td>`;
+    return tr;
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const boton = document.getElementById('facturas_cargar_mas');
+    const tbody = document.querySelector('#tabla_facturas tbody');
+    if (!boton || !tbody) return;
+
+    boton.addEventListener('click', async function() {
+        boton.disabled = true;
+        const url = new URL(boton.dataset.api, window.location.origin);
+        url.searchParams.set('cursor', boton.dataset.cursor);
+        try {
+            const resp = await fetch(url);
+            const data = await resp.json();
+            data.facturas.forEach(f => tbody.appendChild(filaFactura(f, boton.dataset.detalle)));
+            if (data.siguiente) {
+                boton.dataset.cursor = data.siguiente;
+                boton.disabled = false;
+            } else {
+                boton.remove();
+            }
+        } catch (e) {
+            console.error('Error cargando facturas', e);
+            boton.disabled = false;
+        }
+    });
+});
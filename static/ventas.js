@@ -0,0 +1,248 @@
+// Pantalla de ventas: clientes y productos se piden a la API a medida que se tipea o escanea.
+// La página no trae listados; cada producto agregado es una fila con su id oculto y la cantidad.
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+}
+
+function actualizarEstadoVenta() {
+    const hay = document.querySelectorAll('#productos .fila-producto').length > 0;
+    document.getElementById('productos_vacio').style.display = hay ? 'none' : '';
+    document.getElementById('btn_confirmar').disabled = !hay;
+}
+
+// Agrega un producto al formulario (id_producto, descripcion, precio, stock); si ya está, suma la cantidad
+function agregarProductoDesdeObjeto(prod, cantidad) {
+    cantidad = cantidad || 1;
+    const existente = document.querySelector(`#productos .fila-producto[data-id="${prod.id_producto}"]`);
+    if (existente) {
+        const input = existente.querySelector('input[name="cantidad[]"]');
+        input.value = (parseInt(input.value, 10) || 0) + cantidad;
+        return;
+    }
+    const div = document.createElement('div');
+    div.className = 'form-row align-items-center mb-2 fila-producto';
+    div.dataset.id = prod.id_producto;
+    div.innerHTML = `
+        <div class="col-7">
+            <input type="hidden" name="producto[]" value="${prod.id_producto}">
+            <span class="form-control-plaintext">${escaparHtml(prod.descripcion)} - $${Number(prod.precio).toFixed(2)} (Stock: ${prod.stock})</span>
+        </div>
+        <div class="col-3">
+            <input type="number" class="form-control" name="cantidad[]" value="${cantidad}" min="1" max="${prod.stock}">
+        </div>
+        <div class="col-2 text-right">
+            <button type="button" class="btn btn-outline-danger btn-sm" title="Quitar"><i class="fas fa-times"></i></button>
+        </div>`;
+    div.querySelector('button').addEventListener('click', function() {
+        div.remove();
+        actualizarEstadoVenta();
+    });
+    document.getElementById('productos').appendChild(div);
+    actualizarEstadoVenta();
+}
+
+/**
+ * Buscador con lista desplegable: espera a que se deje de tipear, descarta respuestas
+ * viejas y muestra lo que devuelva la API (ya acotada en el servidor). Con `buscarLocal`
+ * y la caja sin conexión, busca en la copia local en lugar de la API.
+ */
+function initBuscador(input, resultados, url, texto, elegir, buscarLocal) {
+    let espera = null;
+    let pedido = 0;
+    input.addEventListener('input', function() {
+        clearTimeout(espera);
+        const q = input.value.trim();
+        if (!q) {
+            resultados.style.display = 'none';
+            return;
+        }
+        espera = setTimeout(async function() {
+            const actual = ++pedido;
+            try {
+                const data = buscarLocal && cajaOffline.activo()
+                    ? await buscarLocal(q)
+                    : await (await fetch(url + '?' + new URLSearchParams({ q: q }))).json();
+                if (actual !== pedido) return;
+                resultados.innerHTML = '';
+                data.forEach(function(item) {
+                    const a = document.createElement('a');
+                    a.href = '#';
+                    a.className = 'list-group-item list-group-item-action';
+                    a.textContent = texto(item);
+                    a.addEventListener('click', function(e) {
+                        e.preventDefault();
+                        elegir(item);
+                        resultados.style.display = 'none';
+                    });
+                    resultados.appendChild(a);
+                });
+                resultados.style.display = data.length ? '' : 'none';
+            } catch (e) {
+                resultados.style.display = 'none';
+            }
+        }, 200);
+    });
+    // cerrar resultados al hacer click fuera
+    document.addEventListener('click', function(e) {
+        if (e.target !== input && !resultados.contains(e.target)) resultados.style.display = 'none';
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('form_venta');
+    if (!form) return;
+
+    // Cliente: el input muestra el nombre y el id va en el campo oculto; borrar el texto vuelve a venta rápida
+    const buscarCliente = document.getElementById('buscar_cliente');
+    const idCliente = document.getElementById('id_cliente');
+    initBuscador(buscarCliente, document.getElementById('clientes_resultados'), form.dataset.apiClientes,
+        c => `${c.nombre} (#${c.id_cliente})${c.email ? ' - ' + c.email : ''}`,
+        function(c) {
+            idCliente.value = c.id_cliente;
+            buscarCliente.value = c.nombre;
+        });
+    buscarCliente.addEventListener('input', function() {
+        idCliente.value = '';
+    });
+
+    const buscarProducto = document.getElementById('search_producto');
+    initBuscador(buscarProducto, document.getElementById('search_results'), form.dataset.apiProductos,
+        p => `${p.descripcion} - $${Number(p.precio).toFixed(2)} (Stock: ${p.stock})`,
+        function(p) {
+            agregarProductoDesdeObjeto(p, 1);
+            buscarProducto.value = '';
+        },
+        q => cajaOffline.buscarProductos(q));
+
+    // Lector de código de barras: el lector "tipea" el código y manda Enter
+    const barcode = document.getElementById('barcode_input');
+    barcode.addEventListener('keydown', async function(e) {
+        if (e.key !== 'Enter') return;
+        e.preventDefault();
+        const codigo = barcode.value.trim();
+        if (!codigo) return;
+        let producto = null;
+        let status = 0;
+        if (!cajaOffline.activo()) {
+            try {
+                const resp = await fetch(form.dataset.apiCodigo.replace('__codigo__', encodeURIComponent(codigo)));
+                status = resp.status;
+                if (resp.ok) producto = await resp.json();
+            } catch (err) {
+                status = 0;
+            }
+        }
+        // Sin conexión (o si el servidor no respondió) se busca en la copia local del catálogo
+        if (status === 0) {
+            producto = await cajaOffline.buscarPorCodigo(codigo);
+            status = producto ? 200 : 404;
+        }
+        if (producto) {
+            agregarProductoDesdeObjeto(producto, 1);
+            barcode.value = '';
+        } else if (status === 404) {
+            alert('Producto no encontrado para el código: ' + codigo);
+        } else {
+            alert('Error buscando el producto por código.');
+        }
+    });
+
+    initModoOffline(form);
+    actualizarEstadoVenta();
+});
+
+function limpiarVenta() {
+    document.getElementById('productos').innerHTML = '';
+    document.getElementById('id_cliente').value = '';
+    document.getElementById('buscar_cliente').value = '';
+    actualizarEstadoVenta();
+}
+
+/**
+ * Cola local: pendientes y rechazadas. Una rechazada se puede reintentar (si ya se arregló
+ * el motivo, p. ej. se cargó stock), registrar igual sin controlar stock (la mercadería ya
+ * salió) o descartar.
+ */
+async function actualizarColaOffline(form) {
+    const ventas = await cajaOffline.ventas();
+    const pendientes = ventas.filter(v => v.estado === 'pendiente').length;
+    const rechazadas = ventas.filter(v => v.estado === 'rechazada');
+    document.getElementById('offline_pendientes').textContent = pendientes;
+    const lista = document.getElementById('offline_rechazadas');
+    lista.innerHTML = '';
+    rechazadas.forEach(function(v) {
+        const li = document.createElement('li');
+        li.className = 'list-group-item d-flex justify-content-between align-items-center';
+        li.innerHTML = `<span>${escaparHtml(v.fecha)}: ${escaparHtml(v.error)}</span>
+            <span class="text-nowrap">
+                <button type="button" class="btn btn-sm btn-outline-primary btn-reintentar">Reintentar</button>
+                <button type="button" class="btn btn-sm btn-outline-warning btn-forzar"
+                        title="Registra la venta aunque no haya stock en el sistema">Registrar igual</button>
+                <button type="button" class="btn btn-sm btn-outline-danger btn-descartar">Descartar</button>
+            </span>`;
+        li.querySelector('.btn-reintentar').addEventListener('click', async function() {
+            await cajaOffline.reintentar(v.clave, false);
+            sincronizarCaja(form);
+        });
+        li.querySelector('.btn-forzar').addEventListener('click', async function() {
+            if (!confirm('¿Registrar la venta aunque no haya stock? El stock de esos productos queda en cero.')) return;
+            await cajaOffline.reintentar(v.clave, true);
+            sincronizarCaja(form);
+        });
+        li.querySelector('.btn-descartar').addEventListener('click', async function() {
+            await cajaOffline.descartar(v.clave);
+            actualizarColaOffline(form);
+        });
+        lista.appendChild(li);
+    });
+    document.getElementById('offline_rechazadas_card').style.display = rechazadas.length ? '' : 'none';
+}
+
+async function sincronizarCaja(form) {
+    const resumen = await cajaOffline.sincronizar(form.dataset.apiLote);
+    await actualizarColaOffline(form);
+    return resumen;
+}
+
+/**
+ * Modo sin conexión: la venta se guarda en la cola local (con su clave) en lugar de
+ * postear el formulario, y la cola se sincroniza por lotes cuando hay red.
+ */
+function initModoOffline(form) {
+    const interruptor = document.getElementById('modo_offline');
+    interruptor.checked = localStorage.getItem('caja_offline') === '1';
+    interruptor.addEventListener('change', function() {
+        localStorage.setItem('caja_offline', interruptor.checked ? '1' : '0');
+        if (!interruptor.checked) sincronizarCaja(form);
+    });
+
+    form.addEventListener('submit', async function(e) {
+        if (!cajaOffline.activo()) return;
+        e.preventDefault();
+        const items = Array.from(document.querySelectorAll('#productos .fila-producto')).map(fila => ({
+            id_producto: parseInt(fila.dataset.id, 10),
+            cantidad: parseInt(fila.querySelector('input[name="cantidad[]"]').value, 10) || 0
+        }));
+        await cajaOffline.encolarVenta({
+            id_cliente: document.getElementById('id_cliente').value || null,
+            metodo_pago: document.getElementById('metodo_pago').value,
+            items: items
+        });
+        limpiarVenta();
+        await actualizarColaOffline(form);
+        sincronizarCaja(form);
+    });
+
+    document.getElementById('btn_sincronizar').addEventListener('click', () => sincronizarCaja(form));
+    window.addEventListener('online', () => sincronizarCaja(form));
+    setInterval(() => sincronizarCaja(form), 15000);
+
+    // Con red, la copia del catálogo se renueva en segundo plano
+    if (navigator.onLine) {
+        cajaOffline.actualizarCatalogo(form.dataset.apiCatalogo).catch(err => console.error(err));
+    }
+    sincronizarCaja(form);
+}
@@ -0,0 +1,201 @@
+// Modo sin conexión de la caja: el catálogo se copia a IndexedDB y las ventas se encolan
+// en el navegador con una clave propia. La cola se manda por lotes a /api/ventas/lote,
+// que descarta las claves ya registradas, así reenviar un lote nunca duplica ventas.
+
+const cajaOffline = (function() {
+    const BASE = 'kiosco_caja';
+    const LOTE = 200;                       // VENTAS_LOTE_MAX en el servidor
+    const PAGINA_CATALOGO = 500;            // PRODUCTOS_POR_PAGINA_MAX en el servidor
+    const VIGENCIA_CATALOGO = 10 * 60 * 1000;
+    let base = null;
+    let sincronizando = false;
+
+    function pedido(req) {
+        return new Promise((resolve, reject) => {
+            req.onsuccess = () => resolve(req.result);
+            req.onerror = () => reject(req.error);
+        });
+    }
+
+    function terminada(tx) {
+        return new Promise((resolve, reject) => {
+            tx.oncomplete = () => resolve();
+            tx.onerror = tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function abrir() {
+        if (!base) {
+            const req = indexedDB.open(BASE, 1);
+            req.onupgradeneeded = function() {
+                const db = req.result;
+                db.createObjectStore('productos', { keyPath: 'id_producto' }).createIndex('codigo_barras', 'codigo_barras');
+                db.createObjectStore('ventas', { keyPath: 'clave' });
+                db.createObjectStore('meta');
+            };
+            base = pedido(req);
+        }
+        return base;
+    }
+
+    async function store(nombre, modo) {
+        return (await abrir()).transaction(nombre, modo || 'readonly').objectStore(nombre);
+    }
+
+    function normalizar(texto) {
+        return String(texto || '').normalize('NFD').replace(/[\u0300-\u036f]/g, '').toLowerCase();
+    }
+
+    // Clave de idempotencia; crypto.randomUUID solo existe en contextos seguros (https/localhost)
+    function nuevaClave() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        const bytes = crypto.getRandomValues(new Uint8Array(16));
+        return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    function fechaLocal(d) {
+        const dos = n => String(n).padStart(2, '0');
+        return `${d.getFullYear()}-${dos(d.getMonth() + 1)}-${dos(d.getDate())} ` +
+               `${dos(d.getHours())}:${dos(d.getMinutes())}:${dos(d.getSeconds())}`;
+    }
+
+    function activo() {
+        return localStorage.getItem('caja_offline') === '1' || !navigator.onLine;
+    }
+
+    /**
+     * Copia el catálogo recorriendo /api/productos/grilla por id. Se escribe todo junto
+     * al final: si la red se corta a mitad de camino queda la copia anterior entera.
+     */
+    async function actualizarCatalogo(urlGrilla, forzar) {
+        const meta = await store('meta');
+        const ultima = await pedido(meta.get('catalogo_actualizado'));
+        if (!forzar && ultima && Date.now() - ultima < VIGENCIA_CATALOGO) return false;
+
+        const productos = [];
+        let cursor = null;
+        do {
+            const url = new URL(urlGrilla, window.location.origin);
+            url.searchParams.set('orden', 'id_producto');
+            url.searchParams.set('columnas', 'id_producto,descripcion,precio,stock,codigo_barras');
+            url.searchParams.set('limite', PAGINA_CATALOGO);
+            if (cursor) url.searchParams.set('cursor', cursor);
+            const resp = await fetch(url);
+            if (!resp.ok) throw new Error('No se pudo descargar el catálogo');
+            const data = await resp.json();
+            data.productos.forEach(p => productos.push(Object.assign(p, { busqueda: normalizar(p.descripcion) })));
+            cursor = data.siguiente;
+        } while (cursor);
+
+        const tx = (await abrir()).transaction(['productos', 'meta'], 'readwrite');
+        tx.objectStore('productos').clear();
+        productos.forEach(p => tx.objectStore('productos').put(p));
+        tx.objectStore('meta').put(Date.now(), 'catalogo_actualizado');
+        await terminada(tx);
+        return true;
+    }
+
+    async function buscarPorCodigo(codigo) {
+        return (await pedido((await store('productos')).index('codigo_barras').get(codigo))) || null;
+    }
+
+    // Como la búsqueda del servidor: todas las palabras tienen que aparecer como prefijo de alguna
+    async function buscarProductos(q, limite) {
+        const palabras = normalizar(q).split(/\W+/).filter(Boolean);
+        const encontrados = [];
+        if (!palabras.length) return encontrados;
+        const req = (await store('productos')).openCursor();
+        return new Promise((resolve, reject) => {
+            req.onerror = () => reject(req.error);
+            req.onsuccess = function() {
+                const c = req.result;
+                if (!c || encontrados.length >= (limite || 20)) return resolve(encontrados);
+                const propias = c.value.busqueda.split(/\W+/);
+                if (palabras.every(p => propias.some(w => w.startsWith(p)))) encontrados.push(c.value);
+                c.continue();
+            };
+        });
+    }
+
+    async function encolarVenta(venta) {
+        venta = Object.assign({ clave: nuevaClave(), fecha: fechaLocal(new Date()), estado: 'pendiente' }, venta);
+        const tx = (await abrir()).transaction('ventas', 'readwrite');
+        tx.objectStore('ventas').put(venta);
+        await terminada(tx);
+        // El stock local baja también, para no vender de más entre sincronizaciones
+        const productos = await store('productos', 'readwrite');
+        for (const item of venta.items) {
+            const p = await pedido(productos.get(item.id_producto));
+            if (p) productos.put(Object.assign(p, { stock: p.stock - item.cantidad }));
+        }
+        return venta;
+    }
+
+    async function ventas() {
+        return pedido((await store('ventas')).getAll());
+    }
+
+    /**
+     * Manda las ventas pendientes en lotes. Las registradas o duplicadas salen de la cola;
+     * las rechazadas quedan marcadas para revisarlas y no se reenvían solas (ver reintentar).
+     * Si no hay red se deja todo como estaba y se reintenta en la próxima vuelta.
+     */
+    async function sincronizar(urlLote) {
+        if (sincronizando || !navigator.onLine) return null;
+        sincronizando = true;
+        const resumen = { registradas: 0, rechazadas: 0 };
+        try {
+            let pendientes = (await ventas()).filter(v => v.estado === 'pendiente');
+            while (pendientes.length) {
+                const lote = pendientes.slice(0, LOTE);
+                pendientes = pendientes.slice(LOTE);
+                const resp = await fetch(urlLote, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ ventas: lote.map(({ estado, error, ...v }) => v) })
+                });
+                if (!resp.ok) break;
+                const data = await resp.json();
+                const tx = (await abrir()).transaction('ventas', 'readwrite');
+                data.resultados.forEach(function(r, i) {
+                    if (r.estado === 'rechazada') {
+                        tx.objectStore('ventas').put(Object.assign(lote[i], { estado: 'rechazada', error: r.error }));
+                        resumen.rechazadas++;
+                    } else {
+                        tx.objectStore('ventas').delete(lote[i].clave);
+                        resumen.registradas++;
+                    }
+                });
+                await terminada(tx);
+            }
+        } catch (e) {
+            console.error('No se pudo sincronizar la caja', e);
+        } finally {
+            sincronizando = false;
+        }
+        return resumen;
+    }
+
+    /**
+     * Vuelve a poner en la cola una venta rechazada. Con forzarStock el servidor la registra
+     * aunque no tenga stock: la mercadería ya se entregó y el stock queda en cero.
+     */
+    async function reintentar(clave, forzarStock) {
+        const tx = (await abrir()).transaction('ventas', 'readwrite');
+        const ventas = tx.objectStore('ventas');
+        const venta = await pedido(ventas.get(clave));
+        if (venta) {
+            delete venta.error;
+            ventas.put(Object.assign(venta, { estado: 'pendiente' }, forzarStock ? { forzar_stock: true } : {}));
+        }
+        await terminada(tx);
+    }
+
+    async function descartar(clave) {
+        const tx = (await abrir()).transaction('ventas', 'readwrite');
+        tx.objectStore('ventas').delete(clave);
+        await terminada(tx);
+    }
+
+    return { activo, actualizarCatalogo, buscarPorCodigo, buscarProductos, encolarVenta, ventas, sincronizar, reintentar, descartar };
+})();
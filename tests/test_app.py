@@ -1,18 +1,910 @@
+import io
+from datetime import datetime, timedelta
+import json
+import shutil
+import os
+import sqlite3
 import pytest
-from app import app as flask_app
+from app import app as flask_app, get_db_connection, close_db_pool, migrar_base, SCHEMA_VERSION
+from app import backfill_ganancias, get_dashboard_data, reconstruir_ventas_diarias, reconstruir_compras_clientes
+from app import reconstruir_saldos_proveedores
+from app import TAREAS, encolar_tarea, ejecutar_tareas_pendientes, programar_tareas_periodicas
 
 
 @pytest.fixture
-def client():
+def client(tmp_path):
+    # Base nueva por test, creada por las migraciones, para no tocar la del repo
+    db_path = tmp_path / "kiosco.db"
+    migrar_base(str(db_path))
+    originales = {clave: flask_app.config[clave] for clave in ("DATABASE", "TAREAS_EN_SEGUNDO_PLANO", "IMPRESIONES_FOLDER")}
+    flask_app.config["DATABASE"] = str(db_path)
+    # Las tareas se corren a mano con ejecutar_tareas_pendientes()
+    flask_app.config["TAREAS_EN_SEGUNDO_PLANO"] = False
+    flask_app.config["IMPRESIONES_FOLDER"] = str(tmp_path / "impresiones")
     with flask_app.test_client() as client:
         yield client
+    close_db_pool()
+    flask_app.config.update(originales)
 
 
 def test_home(client):
+    # La raíz manda al login
     response = client.get("/")
-    assert response.status_code == 200
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/login")
 
 
 def test_about(client):
     response = client.get("/about")
     assert response.status_code == 200
+
+
+def test_db_connection_reused_in_context(client):
+    with flask_app.app_context():
+        conn = get_db_connection()
+        conn.close()
+        assert get_db_connection() is conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with flask_app.app_context():
+        # Mismo hilo: el pool devuelve la misma conexión en el siguiente request
+        assert get_db_connection() is conn
+
+
+def test_migraciones_sobre_base_existente(tmp_path):
+    db_path = tmp_path / "vieja.db"
+    shutil.copy(os.path.join(flask_app.root_path, "basededatosflask.db"), db_path)
+    assert migrar_base(str(db_path)) == (0, SCHEMA_VERSION)
+    # Correrlas de nuevo no hace nada
+    assert migrar_base(str(db_path)) == (SCHEMA_VERSION, SCHEMA_VERSION)
+
+
+def test_base_sin_migrar_no_arranca(tmp_path):
+    db_path = tmp_path / "vacia.db"
+    sqlite3.connect(db_path).close()
+    original = flask_app.config["DATABASE"]
+    flask_app.config["DATABASE"] = str(db_path)
+    try:
+        with flask_app.app_context():
+            with pytest.raises(RuntimeError):
+                get_db_connection()
+    finally:
+        flask_app.config["DATABASE"] = original
+
+
+# --------------------------------------------- Planes de consulta ---------------------------------------------
+
+def _sembrar_datos_minimos():
+    conn = get_db_connection()
+    conn.execute("INSERT INTO clientes (id_cliente, nombre, email) VALUES (1, 'Ana', 'ana@test')")
+    conn.execute("INSERT INTO productos (id_producto, descripcion, precio, stock, precio_costo, codigo_barras) VALUES (1, 'Yerba', 100, 3, 60, '779')")
+    conn.execute("INSERT INTO facturas (id_factura, id_cliente, fecha, total) VALUES (1, 1, '2026-01-02 10:00:00', 200)")
+    conn.execute("INSERT INTO detalle_factura (id_factura, id_producto, cantidad, precio_unitario, subtotal, metodo_pago) VALUES (1, 1, 2, 100, 200, 'efectivo')")
+    conn.execute("INSERT INTO proveedores (id, razon_social, cuit) VALUES (1, 'Distribuidora', '20-1')")
+    conn.execute("INSERT INTO facturas_proveedores (id_proveedor, numero, monto, creado_en) VALUES (1, 'A-1', 500, '2026-01-02 10:00:00')")
+    conn.commit()
+
+
+# Endpoints calientes y las tablas que todavía se recorren completas a propósito
+HOT_ENDPOINTS = {
+    "/dashboard": set(),
+    "/dashboard/listado_facturas": set(),
+    "/dashboard/listado_facturas?desde=2026-01-01&hasta=2026-01-31&cliente=Ana": set(),
+    "/api/facturas?cursor=2026-01-02%2010:00:00|1": set(),
+    "/dashboard/factura/1": set(),
+    "/dashboard/factura/1/print": set(),
+    "/dashboard/proveedores/1/facturas": set(),
+    "/dashboard/proveedores": set(),
+    "/api/proveedores?q=dist": set(),
+    "/api/proveedores?q=20-1&orden=-monto_adeudado&cursor=[100,1]": set(),
+    "/api/productos/by_codigo/779": {"productos"},  # carga inicial del catálogo en memoria
+    "/api/productos/search?q=yer": set(),
+    "/dashboard/gestion_productos": set(),
+    "/api/clientes/buscar?q=an": set(),
+    "/api/clientes/buscar?q=11": set(),
+    "/dashboard/clientes": set(),
+    "/api/clientes?q=ana@t&orden=-total_compras&cursor=[100,1]": set(),
+    "/api/clientes?q=%C3%81na&cursor=[\"ana\",1]": set(),
+    "/api/productos/grilla?orden=-precio&cursor=[100,1]": set(),
+    "/api/productos/grilla?q=yer&stock_min=1&codigo_barras=77": set(),
+}
+
+
+def _scans_completos(conn, sql):
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    scans = []
+    for fila in plan:
+        detalle = fila[3]
+        # "SCAN tabla" sin "USING ... INDEX" es un recorrido completo de la tabla
+        if (detalle.startswith("SCAN ") and " USING " not in detalle
+                and "VIRTUAL TABLE INDEX" not in detalle and detalle != "SCAN CONSTANT ROW"):
+            scans.append(detalle.split()[1])
+    return scans
+
+
+@pytest.mark.parametrize("url", sorted(HOT_ENDPOINTS))
+def test_consultas_calientes_usan_indices(client, url):
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    sentencias = []
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        conn.set_trace_callback(sentencias.append)
+    try:
+        response = client.get(url)
+    finally:
+        conn.set_trace_callback(None)
+    assert response.status_code == 200
+
+    # Fuera quedan las lecturas internas de SQLite/FTS5 ('main'.'productos_fts_config') y del catálogo del esquema
+    selects = [s for s in sentencias if s.lstrip().upper().startswith("SELECT")
+               and "'main'." not in s and "sqlite_master" not in s]
+    assert selects
+    for sql in selects:
+        inesperados = set(_scans_completos(conn, sql)) - HOT_ENDPOINTS[url]
+        assert not inesperados, f"Full scan de {inesperados} en: {sql}"
+
+
+# --------------------------------------------------- Ventas ---------------------------------------------------
+
+def test_venta_agrupa_productos_y_descuenta_stock(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    response = client.post("/dashboard/ventas", data={
+        "id_cliente": "1", "metodo_pago": "efectivo",
+        "producto[]": ["1", "1"], "cantidad[]": ["1", "2"],
+    })
+    assert response.status_code == 302
+    with flask_app.app_context():
+        conn = get_db_connection()
+        assert conn.execute("SELECT stock FROM productos WHERE id_producto = 1").fetchone()[0] == 0
+        factura = conn.execute("SELECT * FROM facturas ORDER BY id_factura DESC LIMIT 1").fetchone()
+        assert factura["total"] == 300
+        assert factura["ganancia"] == 120
+        assert factura["metodo_pago"] == "efectivo"
+        lineas = conn.execute("SELECT cantidad FROM detalle_factura WHERE id_factura = ?", (factura["id_factura"],)).fetchall()
+        assert [l["cantidad"] for l in lineas] == [3]
+
+
+def test_venta_sin_stock_no_deja_rastros(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    response = client.post("/dashboard/ventas", data={
+        "id_cliente": "1", "metodo_pago": "efectivo",
+        "producto[]": ["1"], "cantidad[]": ["4"],
+    })
+    assert response.headers["Location"].endswith("/dashboard/ventas")
+    with flask_app.app_context():
+        conn = get_db_connection()
+        assert conn.execute("SELECT stock FROM productos WHERE id_producto = 1").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM facturas").fetchone()[0] == 1
+
+
+def test_venta_con_cliente_invalido_o_inexistente_se_rechaza(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    for id_cliente in ("abc", "999", "99999999999999999999999"):
+        response = client.post("/dashboard/ventas", data={
+            "id_cliente": id_cliente, "metodo_pago": "efectivo",
+            "producto[]": ["1"], "cantidad[]": ["1"],
+        })
+        assert response.headers["Location"].endswith("/dashboard/ventas")
+    with flask_app.app_context():
+        conn = get_db_connection()
+        assert conn.execute("SELECT stock FROM productos WHERE id_producto = 1").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM facturas").fetchone()[0] == 1
+
+
+def test_lote_de_ventas_offline_deduplica_por_clave(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    assert client.post("/api/ventas/lote", json={"ventas": []}).status_code == 401
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    assert client.post("/api/ventas/lote", json={"ventas": []}).status_code == 400
+
+    def venta(clave, cantidad):
+        return {"clave": clave, "fecha": "2026-03-01 09:30:00", "id_cliente": 1, "metodo_pago": "efectivo",
+                "items": [{"id_producto": 1, "cantidad": cantidad}]}
+    lote = {"ventas": [venta("caja1-0001", 2), venta("caja1-0002", 5), venta("caja1-0001", 2), venta("x", 1)]}
+    resultados = client.post("/api/ventas/lote", json=lote).get_json()["resultados"]
+    assert [r["estado"] for r in resultados] == ["registrada", "rechazada", "duplicada", "rechazada"]
+    assert resultados[0]["total"] == 200 and resultados[2]["id_factura"] == resultados[0]["id_factura"]
+    assert "Stock insuficiente" in resultados[1]["error"]
+
+    # Reenviar el lote (la caja no recibió la respuesta) no duplica nada
+    reenvio = client.post("/api/ventas/lote", json=lote).get_json()["resultados"]
+    assert [r["estado"] for r in reenvio] == ["duplicada", "rechazada", "duplicada", "rechazada"]
+    assert reenvio[0]["id_factura"] == resultados[0]["id_factura"]
+    with flask_app.app_context():
+        conn = get_db_connection()
+        assert conn.execute("SELECT stock FROM productos WHERE id_producto = 1").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM facturas").fetchone()[0] == 2
+        assert conn.execute("SELECT total FROM ventas_diarias WHERE fecha = '2026-03-01'").fetchone()[0] == 200
+        assert conn.execute("SELECT cantidad_compras FROM clientes WHERE id_cliente = 1").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM tareas WHERE tipo = 'renderizar_impresiones'").fetchone()[0] == 1
+
+    # Venta sin cliente (id_cliente NULL) y ventas con números que no entran en un INTEGER:
+    # cada una se resuelve sola, el lote no falla entero
+    sin_cliente = dict(venta("caja1-0003", 1), id_cliente=None)
+    enorme = dict(venta("caja1-0004", 1), items=[{"id_producto": 10 ** 20, "cantidad": 1}])
+    cliente_enorme = dict(venta("caja1-0005", 1), id_cliente=10 ** 20)
+    # Lo que no es un entero de JSON o viene del futuro se rechaza, no se corrige
+    decimal = venta("caja1-0008", 1.7)
+    booleana = venta("caja1-0009", True)
+    futura = dict(venta("caja1-0010", 1), fecha="2099-01-01 10:00:00")
+    cliente_inexistente = dict(venta("caja1-0011", 1), id_cliente=999)
+    respuesta = client.post("/api/ventas/lote", json={"ventas": [enorme, sin_cliente, cliente_enorme,
+                                                                 decimal, booleana, futura, cliente_inexistente]})
+    assert respuesta.status_code == 200
+    otros = respuesta.get_json()["resultados"]
+    assert [r["estado"] for r in otros] == ["rechazada", "registrada"] + ["rechazada"] * 5
+    assert "posterior a la actual" in otros[5]["error"]
+    with flask_app.app_context():
+        conn = get_db_connection()
+        assert conn.execute("SELECT id_cliente FROM facturas WHERE id_factura = ?",
+                            (otros[1]["id_factura"],)).fetchone()[0] is None
+        assert conn.execute("SELECT stock FROM productos WHERE id_producto = 1").fetchone()[0] == 0
+
+    # Registrar igual una venta rechazada por stock (la mercadería ya se entregó): el stock queda en cero
+    forzada = dict(venta("caja1-0002", 5), forzar_stock=True)
+    assert client.post("/api/ventas/lote", json={"ventas": [forzada]}).get_json()["resultados"][0]["estado"] == "registrada"
+
+    # La caja abierta al sincronizar solo se queda con las ventas posteriores a su apertura
+    with flask_app.app_context():
+        conn = get_db_connection()
+        assert conn.execute("SELECT stock FROM productos WHERE id_producto = 1").fetchone()[0] == 0
+        conn.execute("UPDATE productos SET stock = 5 WHERE id_producto = 1")
+        id_caja = conn.execute("INSERT INTO cajas (fecha_apertura, usuario, monto_apertura, estado) "
+                               "VALUES ('2026-03-02 08:00:00', 'test', 0, 'abierta')").lastrowid
+        conn.commit()
+    antes = dict(venta("caja1-0006", 1), fecha="2026-03-01 20:00:00")
+    despues = dict(venta("caja1-0007", 1), fecha="2026-03-02 09:00:00")
+    porcaja = client.post("/api/ventas/lote", json={"ventas": [antes, despues]}).get_json()["resultados"]
+    with flask_app.app_context():
+        conn = get_db_connection()
+        cajas = [conn.execute("SELECT id_caja FROM facturas WHERE id_factura = ?", (r["id_factura"],)).fetchone()[0]
+                 for r in porcaja]
+        assert cajas == [None, id_caja]
+        assert conn.execute("SELECT stock FROM productos WHERE id_producto = 1").fetchone()[0] == 3
+
+
+def test_api_facturas_paginada(client):
+    with flask_app.app_context():
+        conn = get_db_connection()
+        conn.execute("INSERT INTO clientes (id_cliente, nombre) VALUES (1, 'Ana')")
+        conn.executemany("INSERT INTO facturas (id_cliente, fecha, total) VALUES (1, ?, ?)",
+                         [(f"2026-01-{dia:02d} 10:00:00", dia) for dia in range(1, 6)]
+                         + [("2026-01-03 10:00:00", 99)])
+        conn.commit()
+
+    vistas = []
+    cursor = ""
+    while True:
+        data = client.get(f"/api/facturas?limite=2&cursor={cursor}").get_json()
+        vistas.extend(f["id_factura"] for f in data["facturas"])
+        if not data["siguiente"]:
+            break
+        cursor = data["siguiente"]
+    # fecha desc y, a igual fecha, id desc; sin repetidos ni faltantes
+    assert vistas == [5, 4, 6, 3, 2, 1]
+
+    data = client.get("/api/facturas?desde=2026-01-02&hasta=2026-01-03").get_json()
+    assert [f["id_factura"] for f in data["facturas"]] == [6, 3, 2]
+
+
+def test_backfill_ganancias(client):
+    with flask_app.app_context():
+        # _sembrar_datos_minimos deja una factura "vieja", sin ganancia ni costo por línea
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        assert backfill_ganancias(conn) == 1
+        factura = conn.execute("SELECT ganancia, metodo_pago FROM facturas WHERE id_factura = 1").fetchone()
+        assert (factura["ganancia"], factura["metodo_pago"]) == (80, "efectivo")
+        # Un cambio de costo posterior no altera la ganancia ya guardada
+        conn.execute("UPDATE productos SET precio_costo = 90 WHERE id_producto = 1")
+        conn.commit()
+        assert backfill_ganancias(conn) == 0
+    data = client.get("/api/facturas").get_json()
+    assert data["facturas"][0]["ganancia"] == 80
+
+
+# -------------------------------------------- Catálogo en memoria --------------------------------------------
+
+def test_catalogo_cache_codigo_y_busqueda(client):
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    antes = client.get("/api/productos/cache").get_json()
+    assert client.get("/api/productos/by_codigo/779").get_json()["descripcion"] == "Yerba"
+    assert client.get("/api/productos/by_codigo/779").status_code == 200
+    despues = client.get("/api/productos/cache").get_json()
+    assert despues["hits"] - antes["hits"] == 1
+    assert [p["id_producto"] for p in client.get("/api/productos/search?q=yer").get_json()] == [1]
+
+    # Editar el producto invalida su entrada: el código viejo deja de encontrarse
+    client.post("/productos/editar/1", data={"descripcion": "Yerba mate", "precio": "100", "stock": "3", "codigo_barras": "780"})
+    assert client.get("/api/productos/by_codigo/779").status_code == 404
+    assert client.get("/api/productos/by_codigo/780").get_json()["descripcion"] == "Yerba mate"
+    assert [p["id_producto"] for p in client.get("/api/productos/search?q=mat").get_json()] == [1]
+
+    # Vender todo el stock lo saca de la búsqueda
+    client.post("/dashboard/ventas", data={"id_cliente": "1", "metodo_pago": "efectivo",
+                                           "producto[]": ["1"], "cantidad[]": ["3"]})
+    assert client.get("/api/productos/search?q=yerba").get_json() == []
+
+
+def test_busqueda_fts_ignora_acentos_y_orden(client):
+    with flask_app.app_context():
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO productos (descripcion, precio, stock) VALUES (?, 10, ?)", [
+            ("Azúcar común 1kg", 5),
+            ("Galletitas de agua", 5),
+            ("Azúcar impalpable 500g", 0),
+            ("Caramelos sin azúcar", 5),
+        ])
+        conn.commit()
+    resultado = client.get("/api/productos/search?q=azucar").get_json()
+    assert {p["descripcion"] for p in resultado} == {"Azúcar común 1kg", "Caramelos sin azúcar"}
+    resultado = client.get("/api/productos/search?q=comun AZU").get_json()
+    assert [p["descripcion"] for p in resultado] == ["Azúcar común 1kg"]
+
+
+def test_dashboard_cacheado_se_invalida_con_una_venta(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        stats = get_dashboard_data()
+        assert (stats["total_clientes"], stats["productos_stock"], stats["stock_bajo"]) == (1, 1, 1)
+        # Un cambio fuera de una venta no se ve hasta que vence el TTL
+        conn = get_db_connection()
+        conn.execute("INSERT INTO clientes (nombre) VALUES ('Beto')")
+        conn.commit()
+        assert get_dashboard_data()["total_clientes"] == 1
+    client.post("/dashboard/ventas", data={"id_cliente": "1", "metodo_pago": "efectivo",
+                                           "producto[]": ["1"], "cantidad[]": ["1"]})
+    with flask_app.app_context():
+        stats = get_dashboard_data()
+        assert stats["total_clientes"] == 2
+        assert (stats["ventas_hoy"], stats["total_dia"]) == (1, 100)
+
+
+def test_ventas_diarias_se_mantiene_y_se_reconstruye(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        conn.execute("UPDATE productos SET stock = 10 WHERE id_producto = 1")
+        conn.commit()
+    for metodo, cantidad in [("efectivo", "1"), ("efectivo", "2"), ("transferencia", "1")]:
+        client.post("/dashboard/ventas", data={"id_cliente": "1", "metodo_pago": metodo,
+                                               "producto[]": ["1"], "cantidad[]": [cantidad]})
+    with flask_app.app_context():
+        conn = get_db_connection()
+        consulta = "SELECT fecha, metodo_pago, cantidad_ventas, total, ganancia, items FROM ventas_diarias ORDER BY 1, 2"
+        incremental = [tuple(r) for r in conn.execute(consulta)]
+        hoy = incremental[0][0]
+        assert incremental == [(hoy, "efectivo", 2, 300, 120, 3), (hoy, "transferencia", 1, 100, 40, 1)]
+        # La factura sembrada a mano no pasó por registrar_venta; reconstruir la incluye
+        backfill_ganancias(conn)
+        assert reconstruir_ventas_diarias(conn) == 3
+        assert [tuple(r) for r in conn.execute(consulta)] == [("2026-01-02", "efectivo", 1, 200, 80, 2)] + incremental
+
+    serie = client.get("/api/reportes/ventas_diarias?desde=2026-01-01&hasta=2026-01-03").get_json()
+    assert [(d["fecha"], d["total"]) for d in serie] == [("2026-01-01", 0), ("2026-01-02", 200), ("2026-01-03", 0)]
+    assert client.get("/api/reportes/ventas_diarias?desde=2026-01-03&hasta=2026-01-01").status_code == 400
+    assert client.get("/api/reportes/ventas_diarias?desde=2025-01-01&hasta=2025-12-31").status_code == 200
+    assert client.get("/api/reportes/ventas_diarias?desde=2000-01-01&hasta=2026-01-01").status_code == 400
+
+
+def test_exportar_detalle_por_rango(client):
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO facturas (id_factura, id_cliente, fecha, total) VALUES (2, 1, '2026-02-01 09:00:00', 100)")
+        conn.execute("INSERT INTO detalle_factura (id_factura, id_producto, cantidad, precio_unitario, subtotal) VALUES (2, 1, 1, 100, 100)")
+        conn.commit()
+    response = client.get("/dashboard/exportar/detalle_factura?desde=2026-01-01&hasta=2026-01-31")
+    assert response.status_code == 200
+    assert response.is_streamed
+    lineas = response.get_data(as_text=True).splitlines()
+    assert lineas[0].startswith("id_detalle,id_factura,fecha")
+    assert len(lineas) == 2 and ",Yerba," in lineas[1]
+
+    excel = client.get("/dashboard/exportar/facturas?formato=excel").get_data(as_text=True)
+    assert excel.startswith("\ufeffid_factura;fecha")
+    assert len(excel.splitlines()) == 3
+
+    # La factura de proveedor sembrada no tiene fecha: entra igual, por el día en que se cargó
+    proveedores = client.get("/dashboard/exportar/facturas_proveedores").get_data(as_text=True).splitlines()
+    assert len(proveedores) == 2 and ",A-1," in proveedores[1]
+    enero = client.get("/dashboard/exportar/facturas_proveedores?desde=2026-01-01&hasta=2026-01-31")
+    assert len(enero.get_data(as_text=True).splitlines()) == 2
+    febrero = client.get("/dashboard/exportar/facturas_proveedores?desde=2026-02-01&hasta=2026-02-28")
+    assert len(febrero.get_data(as_text=True).splitlines()) == 1
+
+
+def test_importar_productos_csv(client):
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        conn.execute("UPDATE productos SET margen_ganancia = 50 WHERE id_producto = 1")
+        conn.commit()
+    csv_texto = (
+        "codigo_barras;descripcion;precio;precio_costo;margen_ganancia;stock\n"
+        "779;Yerba 1kg;;80;;\n"          # existente: nuevo costo, reprecio con el margen guardado
+        "100;Fideos;;50;20;10\n"         # alta con precio calculado
+        "101;Arroz;abc;;;5\n"            # error
+        ";Sin código;10;;;1\n"           # error
+        "102;Azúcar;10;;;inf\n"          # error: no finito
+        "103;Sal;nan;;;1\n"              # error: no finito
+    )
+    response = client.post("/productos/importar", content_type="multipart/form-data",
+                           data={"archivo": (io.BytesIO(csv_texto.encode("utf-8-sig")), "lista.csv")})
+    assert response.status_code == 302
+    with flask_app.app_context():
+        conn = get_db_connection()
+        yerba = conn.execute("SELECT * FROM productos WHERE codigo_barras = '779'").fetchone()
+        assert (yerba["descripcion"], yerba["precio"], yerba["stock"]) == ("Yerba 1kg", 120, 3)
+        fideos = conn.execute("SELECT * FROM productos WHERE codigo_barras = '100'").fetchone()
+        assert (fideos["precio"], fideos["stock"]) == (60, 10)
+        assert conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0] == 2
+    with client.session_transaction() as sess:
+        mensajes = [m for _, m in sess["_flashes"]]
+    assert mensajes[0].startswith("Importación terminada: 2 productos, 4 filas con errores")
+    assert "Línea 4: valor numérico inválido" in mensajes
+    assert "Línea 5: falta codigo_barras" in mensajes
+    assert "Línea 6: valor numérico inválido" in mensajes
+    assert "Línea 7: valor numérico inválido" in mensajes
+
+
+def test_repreciar_vista_previa_y_aplicar(client):
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    with flask_app.app_context():
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO productos (descripcion, precio, stock, precio_costo, margen_ganancia, categoria) "
+                         "VALUES (?, ?, 1, ?, ?, ?)", [
+                             ("Gaseosa", 150, 100, 50, "bebidas"),
+                             ("Agua", 10, None, None, "bebidas"),
+                             ("Galletitas", 130, 100, 30, "almacen"),
+                         ])
+        conn.commit()
+
+    pedido = {"filtros": {"categoria": "bebidas"}, "porcentaje_costo": 10}
+    vista = client.post("/api/productos/repreciar", json=pedido).get_json()
+    assert vista["afectados"] == 2 and not vista["aplicado"]
+    assert [(p["descripcion"], p["precio"], p["precio_nuevo"]) for p in vista["vista"]] == [
+        ("Agua", 10, 11), ("Gaseosa", 150, 165)]
+
+    aplicado = client.post("/api/productos/repreciar", json=dict(pedido, aplicar=True)).get_json()
+    assert aplicado["aplicado"] and aplicado["afectados"] == 2
+    aplicado = client.post("/api/productos/repreciar", json={"filtros": {"margen_hasta": 40}, "margen": 40, "aplicar": True}).get_json()
+    with flask_app.app_context():
+        precios = dict(get_db_connection().execute("SELECT descripcion, precio FROM productos").fetchall())
+    assert precios == {"Gaseosa": 165, "Agua": 11, "Galletitas": 140}
+
+    # Valores no finitos o cuerpos que no son objetos: 400 y nada cambia
+    for malo in ({"margen": "nan", "aplicar": True}, {"porcentaje_costo": "inf", "aplicar": True},
+                 {"porcentaje_costo": "nan", "aplicar": True}, {"filtros": {"margen_desde": "-inf"}, "margen": 10},
+                 {"filtros": [1], "margen": 10}, [1]):
+        assert client.post("/api/productos/repreciar", json=malo).status_code == 400
+    with flask_app.app_context():
+        assert dict(get_db_connection().execute("SELECT descripcion, precio FROM productos").fetchall()) == precios
+
+
+# --------------------------------------------------- Cajas ---------------------------------------------------
+
+def test_cierre_de_caja_concilia_con_las_ventas_del_turno(client):
+    from app import registrar_venta, VentaError
+    with client.session_transaction() as sess:
+        sess["user"] = "cajero"
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        get_db_connection().execute("UPDATE productos SET stock = 10 WHERE id_producto = 1").connection.commit()
+    # Montos no finitos: no se abre nada
+    client.post("/dashboard/cajas/abrir", data={"monto_apertura": "inf"})
+    client.post("/dashboard/cajas/abrir", data={"monto_apertura": "1000"})
+    for metodo in ("efectivo", "efectivo", "tarjeta_debito"):
+        client.post("/dashboard/ventas", data={"id_cliente": "1", "producto[]": ["1"], "cantidad[]": ["1"],
+                                               "metodo_pago": metodo})
+
+    parcial = client.get("/api/cajas/1/conciliacion").get_json()
+    assert parcial["estado"] == "abierta" and parcial["cantidad_ventas"] == 3
+    assert parcial["efectivo_esperado"] == 1200 and parcial["diferencia"] is None
+    assert {m["metodo_pago"]: m["total"] for m in parcial["por_metodo"]} == {"efectivo": 200, "tarjeta_debito": 100}
+
+    # Un monto de cierre no finito deja la caja abierta
+    client.post("/dashboard/cajas/cerrar/1", data={"monto_cierre": "nan"})
+    assert client.get("/api/cajas/1/conciliacion").get_json()["estado"] == "abierta"
+    response = client.post("/dashboard/cajas/cerrar/1", data={"monto_cierre": "1150"}, follow_redirects=True)
+    assert "faltante de $50.00" in response.get_data(as_text=True)
+    with flask_app.app_context():
+        conn = get_db_connection()
+        caja = conn.execute("SELECT estado, monto_esperado, diferencia FROM cajas WHERE id_caja = 1").fetchone()
+        assert tuple(caja) == ("cerrada", 1200, -50)
+        # Cerrada la caja, no se le pueden sumar ventas
+        with pytest.raises(VentaError):
+            registrar_venta(conn, 1, [(1, 1)], "efectivo", id_caja=1)
+        assert conn.execute("SELECT COUNT(*) FROM facturas WHERE id_caja = 1").fetchone()[0] == 3
+    assert client.post("/dashboard/cajas/cerrar/1", data={"monto_cierre": "1"}).status_code == 302
+    assert client.get("/api/cajas/1/conciliacion").get_json()["diferencia"] == -50
+    assert "tarjeta_debito" in client.get("/dashboard/cajas/1").get_data(as_text=True)
+
+
+def test_pantalla_de_ventas_no_trae_listados_y_busca_a_pedido(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO clientes (nombre) VALUES (?)", [("ANALÍA",), ("Bruno",), ("100% Kiosco",)])
+        conn.commit()
+        sentencias = []
+        conn.set_trace_callback(sentencias.append)
+    try:
+        response = client.get("/dashboard/ventas")
+    finally:
+        conn.set_trace_callback(None)
+    assert response.status_code == 200 and b"Yerba" not in response.data and b"Ana" not in response.data
+    assert not [s for s in sentencias if "SELECT" in s.upper()]
+
+    clientes = client.get("/api/clientes/buscar?q=an")
+    assert [c["nombre"] for c in clientes.get_json()] == ["Ana", "ANALÍA"]
+    assert clientes.headers["Cache-Control"] in ("private, max-age=60", "max-age=60, private")
+    assert [c["nombre"] for c in client.get("/api/clientes/buscar?q=100%25").get_json()] == ["100% Kiosco"]
+    assert client.get("/api/clientes/buscar?q=%25").get_json() == []
+    assert [c["id_cliente"] for c in client.get("/api/clientes/buscar?q=2").get_json()] == [2]
+
+    productos = client.get("/api/productos/search?q=yer&limite=500")
+    assert [p["descripcion"] for p in productos.get_json()] == ["Yerba"]
+    assert "max-age=10" in productos.headers["Cache-Control"]
+
+
+def test_directorio_clientes_busca_pagina_y_acumula_compras(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO clientes (nombre, telefono, email) VALUES (?, ?, ?)", [
+            ("José Pérez", "(011) 4555-1234", "JPEREZ@Mail.com"), ("JOSEFINA Núñez", None, None), ("Bruno", "11 2233", None)])
+        conn.commit()
+        # La factura sembrada no pasó por registrar_venta: la reconstrucción la suma
+        assert reconstruir_compras_clientes(conn) == 4
+        assert conn.execute("SELECT total_compras, ultima_compra FROM clientes WHERE id_cliente = 1").fetchone()[:] == \
+            (200, "2026-01-02 10:00:00")
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+
+    def nombres(url):
+        return [c["nombre"] for c in client.get(url).get_json()["clientes"]]
+    assert nombres("/api/clientes?q=jose") == ["José Pérez", "JOSEFINA Núñez"]
+    assert nombres("/api/clientes?q=Josefina%20nu") == ["JOSEFINA Núñez"]
+    assert nombres("/api/clientes?q=0114555") == ["José Pérez"]
+    assert nombres("/api/clientes?q=jperez@mail") == ["José Pérez"]
+    assert nombres("/api/clientes?q=99999999999999999999999") == []
+    assert client.get("/api/clientes/buscar?q=99999999999999999999999").get_json() == []
+    client.post("/dashboard/clientes/editar/4", data={"nombre": "Bruno Álvarez", "email": "", "telefono": "", "direccion": ""})
+    assert nombres("/api/clientes?q=alvarez") == [] and nombres("/api/clientes?q=bruno%20alv") == ["Bruno Álvarez"]
+
+    primera = client.get("/api/clientes?limite=2").get_json()
+    assert [c["nombre"] for c in primera["clientes"]] == ["Ana", "Bruno Álvarez"]
+    segunda = client.get("/api/clientes", query_string={"limite": 2, "cursor": primera["siguiente"]}).get_json()
+    assert [c["nombre"] for c in segunda["clientes"]] == ["José Pérez", "JOSEFINA Núñez"] and segunda["siguiente"] is None
+    assert client.get("/api/clientes?orden=email").status_code == 400
+
+    client.post("/dashboard/ventas", data={"id_cliente": "2", "metodo_pago": "efectivo", "producto[]": ["1"], "cantidad[]": ["3"]})
+    mejores = client.get("/api/clientes?orden=-total_compras&limite=1").get_json()["clientes"]
+    assert [(c["nombre"], c["cantidad_compras"], c["total_compras"]) for c in mejores] == [("José Pérez", 1, 300)]
+    assert mejores[0]["ultima_compra"] > "2026-01-02"
+    pagina = client.get("/dashboard/clientes").get_data(as_text=True)
+    inicial = json.loads(pagina.split('<script id="clientes_inicial" type="application/json">')[1].split("</script>")[0])
+    assert [c["nombre"] for c in inicial["clientes"]][:2] == ["Ana", "Bruno Álvarez"]
+
+    # Espacios de más en el nombre o en lo tipeado no cambian la clave
+    client.post("/dashboard/clientes/editar/4", data={"nombre": " Bruno   Álvarez ", "email": "", "telefono": "", "direccion": ""})
+    assert nombres("/api/clientes?q=bruno%20%20%C3%A1lv") == [" Bruno   Álvarez "]
+    assert nombres("/api/clientes?q=bruno%20alv") == [" Bruno   Álvarez "]
+
+
+# --------------------------------------------------- Productos ---------------------------------------------------
+
+def test_grilla_productos_pagina_filtra_y_ordena(client):
+    with flask_app.app_context():
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO productos (descripcion, precio, stock, codigo_barras) VALUES (?, ?, ?, ?)",
+                         [(f"Alfajor {i:02d}", 100 + i % 3, i, f"779{i:03d}") for i in range(1, 11)]
+                         + [("Yerba", 500, 0, "123")])
+        conn.commit()
+
+    def pagina(**params):
+        return client.get("/api/productos/grilla", query_string=params).get_json()
+
+    vistos, cursor = [], None
+    while True:
+        data = pagina(limite=4, columnas="descripcion,stock", **({"cursor": cursor} if cursor else {}))
+        assert all(set(p) == {"descripcion", "stock"} for p in data["productos"])
+        vistos += [p["descripcion"] for p in data["productos"]]
+        cursor = data["siguiente"]
+        if not cursor:
+            break
+    assert vistos == [f"Alfajor {i:02d}" for i in range(1, 11)] + ["Yerba"]
+
+    # Orden descendente por precio con empates: el cursor desempata por id sin repetir ni saltear
+    primera = pagina(orden="-precio", limite=5, columnas="id_producto,precio")
+    segunda = pagina(orden="-precio", limite=20, columnas="id_producto,precio", cursor=primera["siguiente"])
+    orden = [(p["precio"], p["id_producto"]) for p in primera["productos"] + segunda["productos"]]
+    assert orden == sorted(orden, key=lambda x: (-x[0], -x[1])) and len(orden) == 11
+
+    assert [p["stock"] for p in pagina(stock_min=3, stock_max=5)["productos"]] == [3, 4, 5]
+    assert [p["codigo_barras"] for p in pagina(codigo_barras="77900")["productos"]] == [
+        f"779{i:03d}" for i in range(1, 10)]
+    assert [p["descripcion"] for p in pagina(q="alfajor", stock_max=1)["productos"]] == ["Alfajor 01"]
+    assert client.get("/api/productos/grilla?orden=stock;drop").status_code == 400
+    assert client.get("/api/productos/grilla?cursor=no-json").status_code == 400
+    assert client.get("/api/productos/grilla?stock_min=99999999999999999999999").status_code == 400
+
+
+# ------------------------------------------------ Impresiones ------------------------------------------------
+
+def test_impresion_se_renderiza_una_vez_y_usa_etag(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    response = client.get("/dashboard/factura/1/print?type=invoice&copies=2")
+    assert response.status_code == 200 and b"Ana" in response.data and b"Yerba" in response.data
+    etag = response.headers["ETag"]
+    assert client.get("/dashboard/factura/1/print", headers={"If-None-Match": etag}).status_code == 304
+    recibo = client.get("/dashboard/factura/1/print?type=receipt")
+    assert recibo.headers["ETag"] != etag and b"Gracias por su compra" in recibo.data
+
+    # Lo ya renderizado se sirve desde disco sin volver a consultar la base
+    sentencias = []
+    with flask_app.app_context():
+        conn = get_db_connection()
+        conn.set_trace_callback(sentencias.append)
+    try:
+        assert client.get("/dashboard/factura/1/print").data == response.data
+    finally:
+        conn.set_trace_callback(None)
+    assert not [s for s in sentencias if "SELECT" in s.upper()]
+    assert len(os.listdir(flask_app.config["IMPRESIONES_FOLDER"])) == 2
+
+    assert client.get("/dashboard/factura/99/print").status_code == 302
+    assert client.get("/dashboard/factura/99").status_code == 302
+
+
+def test_venta_deja_los_comprobantes_renderizados(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    client.post("/dashboard/ventas", data={"id_cliente": "1", "producto[]": ["1"], "cantidad[]": ["1"],
+                                           "metodo_pago": "efectivo"})
+    assert ejecutar_tareas_pendientes() == 1
+    assert sorted(n.split("-")[:2] for n in os.listdir(flask_app.config["IMPRESIONES_FOLDER"])) == [
+        ["2", "invoice"], ["2", "receipt"]]
+
+
+def test_ticket_escpos_y_salidas(client, tmp_path, monkeypatch):
+    from app import renderizar_ticket, obtener_factura, salida_impresora, impresora_falsa, SalidaArchivo, SalidaTcp
+    from app import TicketEscPos
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        ticket = renderizar_ticket(*obtener_factura(get_db_connection(), 1), columnas=32)
+    assert ticket.startswith(b"\x1b@") and ticket.endswith(b"\x1dVB\x03")
+    assert b"\x1dkI\x04{BF1" in ticket  # código de barras CODE128 con el número de factura
+    assert "Venta rápida".encode("cp850") not in ticket and b"Cliente: Ana" in ticket
+    assert b"  2 x $100.00" + b" " * 12 + b"$200.00\n" in ticket  # 32 columnas justas
+    assert b"TOTAL    $200.00\n" in ticket  # en doble ancho entran 16
+    angosto = TicketEscPos(columnas=10)
+    angosto.columnas_texto("Pago", "efectivo, transferencia")
+    assert angosto.datos().endswith(b"efectivo, \n")
+
+    assert isinstance(salida_impresora("tcp://10.0.0.5"), SalidaTcp)
+    archivo = salida_impresora(f"archivo:{tmp_path / 'lp0'}")
+    archivo.enviar(ticket)
+    assert isinstance(archivo, SalidaArchivo) and (tmp_path / "lp0").read_bytes() == ticket
+
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    monkeypatch.setitem(flask_app.config, "IMPRESORA_TERMICA", "falsa")
+    monkeypatch.setattr(impresora_falsa, "tickets", [])
+    client.post("/dashboard/factura/1/ticket", data={"copias": "2"})
+    assert impresora_falsa.tickets and impresora_falsa.tickets[0].count(b"\x1b@") == 2
+    # Con impresora configurada cada venta encola su ticket
+    client.post("/dashboard/ventas", data={"id_cliente": "1", "producto[]": ["1"], "cantidad[]": ["1"],
+                                           "metodo_pago": "efectivo"})
+    assert ejecutar_tareas_pendientes() == 2
+    assert len(impresora_falsa.tickets) == 2 and b"Factura: 2" in impresora_falsa.tickets[1]
+
+
+# ------------------------------------------------ Proveedores ------------------------------------------------
+
+def test_directorio_proveedores_busca_y_lleva_saldos(client):
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO proveedores (razon_social, nombre_comercial, cuit) VALUES ('Lácteos del Sur SA', 'La Vaquita', '30-7123-9')")
+        conn.commit()
+        # La factura sembrada no pasó por los handlers: la reconstrucción la suma
+        assert reconstruir_saldos_proveedores(conn) == 2
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+
+    def proveedores(url):
+        return [(p["razon_social"], p["cantidad_facturas"], p["monto_adeudado"])
+                for p in client.get(url).get_json()["proveedores"]]
+    assert proveedores("/api/proveedores?q=lacteos") == [("Lácteos del Sur SA", 0, 0)]
+    assert proveedores("/api/proveedores?q=la%20vaq") == [("Lácteos del Sur SA", 0, 0)]
+    assert proveedores("/api/proveedores?q=307") == [("Lácteos del Sur SA", 0, 0)]
+    assert proveedores("/api/proveedores?q=20-1") == [("Distribuidora", 1, 500)]
+
+    client.post("/dashboard/proveedores/2/facturas", data={"numero": "B-1", "monto": "120"})
+    client.post("/dashboard/proveedores/2/facturas", data={"numero": "B-2", "monto": "30"})
+    assert proveedores("/api/proveedores?q=lac") == [("Lácteos del Sur SA", 2, 150)]
+    client.post("/dashboard/proveedores/facturas/editar/2", data={"numero": "B-1", "monto": "1000"})
+    client.post("/dashboard/proveedores/facturas/eliminar/3")
+    assert proveedores("/api/proveedores?q=lac") == [("Lácteos del Sur SA", 1, 1000)]
+
+    primera = client.get("/api/proveedores?orden=-monto_adeudado&limite=1").get_json()
+    assert [p["razon_social"] for p in primera["proveedores"]] == ["Lácteos del Sur SA"]
+    segunda = client.get("/api/proveedores", query_string={"orden": "-monto_adeudado", "cursor": primera["siguiente"]})
+    assert [p["razon_social"] for p in segunda.get_json()["proveedores"]] == ["Distribuidora"]
+
+    # Guardar redirige: la página no recarga la tabla dentro del POST
+    response = client.post("/dashboard/proveedores", data={"razon_social": "Bebidas Norte", "cuit": "30-2"})
+    assert response.status_code == 302
+    assert proveedores("/api/proveedores?q=bebidas") == [("Bebidas Norte", 0, 0)]
+
+
+# ------------------------------------------ Archivos de proveedores ------------------------------------------
+
+def test_pdf_proveedor_deduplicado_descarga_y_borrado(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setitem(flask_app.config, "ARCHIVOS_GRACIA_SEGUNDOS", 0)
+    os.makedirs(flask_app.config["UPLOAD_FOLDER"])
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    pdf = b"%PDF-1.4 factura de prueba " * 100
+    for numero in ("B-1", "B-2"):
+        client.post("/dashboard/proveedores/1/facturas", content_type="multipart/form-data",
+                    data={"numero": numero, "archivo": (io.BytesIO(pdf), "factura.pdf")})
+
+    with flask_app.app_context():
+        filas = get_db_connection().execute(
+            "SELECT id, archivo FROM facturas_proveedores WHERE archivo IS NOT NULL ORDER BY id").fetchall()
+    assert len(filas) == 2 and filas[0]["archivo"] == filas[1]["archivo"]
+    guardados = [n for _, _, ns in os.walk(flask_app.config["UPLOAD_FOLDER"]) for n in ns]
+    assert guardados == [filas[0]["archivo"]]
+
+    url = f"/dashboard/proveedores/facturas/descargar/{filas[0]['id']}"
+    response = client.get(url)
+    assert response.data == pdf
+    etag = response.headers["ETag"]
+    assert etag.strip('"') == filas[0]["archivo"][:64]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    parcial = client.get(url, headers={"Range": "bytes=0-7"})
+    assert parcial.status_code == 206 and parcial.data == b"%PDF-1.4"
+
+    # Borrar una factura no borra el archivo que comparte con la otra
+    client.post(f"/dashboard/proveedores/facturas/eliminar/{filas[0]['id']}")
+    assert ejecutar_tareas_pendientes() == 1
+    assert client.get(f"/dashboard/proveedores/facturas/descargar/{filas[1]['id']}").status_code == 200
+    client.post(f"/dashboard/proveedores/facturas/eliminar/{filas[1]['id']}")
+    assert ejecutar_tareas_pendientes() == 1
+    assert [n for _, _, ns in os.walk(flask_app.config["UPLOAD_FOLDER"]) for n in ns] == []
+
+
+def test_limpieza_de_huerfanos_periodica_y_tope_de_subida(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setitem(flask_app.config, "ARCHIVOS_GRACIA_SEGUNDOS", 0)
+    os.makedirs(flask_app.config["UPLOAD_FOLDER"])
+    huerfano = tmp_path / "uploads" / "ab" / ("ab" + "0" * 62 + ".pdf")
+    huerfano.parent.mkdir()
+    huerfano.write_bytes(b"%PDF-1.4")
+    with flask_app.app_context():
+        conn = get_db_connection()
+        # Programarla dos veces deja una sola pendiente
+        programar_tareas_periodicas(conn)
+        programar_tareas_periodicas(conn)
+        assert conn.execute("SELECT COUNT(*) FROM tareas WHERE tipo = 'limpiar_huerfanos'").fetchone()[0] == 1
+    assert ejecutar_tareas_pendientes() == 1
+    assert not huerfano.exists()
+    with flask_app.app_context():
+        siguiente = get_db_connection().execute(
+            "SELECT ejecutar_desde FROM tareas WHERE tipo = 'limpiar_huerfanos' AND estado = 'pendiente'").fetchall()
+    # La próxima vuelta queda a un intervalo (un día por defecto) de esta
+    manana = (datetime.now() + timedelta(hours=23)).strftime("%Y-%m-%d %H:%M:%S")
+    assert len(siguiente) == 1 and siguiente[0][0] > manana
+    assert ejecutar_tareas_pendientes() == 0
+
+    # Un envío por encima del tope se corta con 413 antes de leer el cuerpo
+    monkeypatch.setitem(flask_app.config, "MAX_CONTENT_LENGTH", 1024)
+    with client.session_transaction() as sess:
+        sess["user"] = "test"
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    response = client.post("/dashboard/proveedores/1/facturas", content_type="multipart/form-data",
+                           data={"numero": "B-9", "archivo": (io.BytesIO(b"%PDF-1.4" * 1000), "factura.pdf")})
+    assert response.status_code == 302
+    with flask_app.app_context():
+        assert get_db_connection().execute("SELECT COUNT(*) FROM facturas_proveedores WHERE numero = 'B-9'").fetchone()[0] == 0
+    assert [n for _, _, ns in os.walk(flask_app.config["UPLOAD_FOLDER"]) for n in ns] == []
+    response = client.post("/api/ventas/lote", json={"ventas": [{"relleno": "x" * 2000}]})
+    assert response.status_code == 413 and "error" in response.get_json()
+
+
+# ------------------------------------------ Cola de tareas ------------------------------------------
+
+def test_cola_tareas_reintenta_y_reporta_estado(client, monkeypatch):
+    llamadas = []
+
+    def inestable(datos):
+        llamadas.append(datos["n"])
+        if len(llamadas) < 2:
+            raise RuntimeError("falla transitoria")
+
+    monkeypatch.setitem(TAREAS, "prueba", inestable)
+    monkeypatch.setitem(TAREAS, "rota", lambda datos: 1 / 0)
+    with flask_app.app_context():
+        conn = get_db_connection()
+        id_prueba = encolar_tarea(conn, "prueba", {"n": 7})
+        id_rota = encolar_tarea(conn, "rota", max_intentos=1)
+        with pytest.raises(ValueError):
+            encolar_tarea(conn, "inexistente")
+
+    assert ejecutar_tareas_pendientes() == 2
+    tarea = client.get(f"/api/tareas/{id_prueba}").get_json()
+    assert tarea["estado"] == "pendiente" and tarea["intentos"] == 1 and "falla transitoria" in tarea["error"]
+    assert client.get(f"/api/tareas/{id_rota}").get_json()["estado"] == "fallida"
+
+    # El reintento espera; se adelanta para no dormir en el test
+    with flask_app.app_context():
+        conn = get_db_connection()
+        conn.execute("UPDATE tareas SET ejecutar_desde = '2000-01-01 00:00:00' WHERE id_tarea = ?", (id_prueba,))
+        conn.commit()
+    assert ejecutar_tareas_pendientes() == 1
+    assert llamadas == [7, 7]
+    assert client.get(f"/api/tareas/{id_prueba}").get_json()["estado"] == "hecha"
+    resumen = client.get("/api/tareas").get_json()
+    assert [f["id_tarea"] for f in resumen["fallidas"]] == [id_rota]
+    assert client.get("/api/tareas/999").status_code == 404
+
+
+# ------------------------------------------------ Métricas ------------------------------------------------
+
+def test_metricas_de_requests_y_sql(client, caplog, monkeypatch):
+    import json
+    from app import metricas
+    metricas.reiniciar()
+    with flask_app.app_context():
+        _sembrar_datos_minimos()
+    monkeypatch.setitem(flask_app.config, "METRICAS_SQL_LENTA_MS", 0)
+    with caplog.at_level("INFO", logger="kiosco"):
+        client.get("/api/productos/search?q=yer")
+        client.get("/api/facturas?limite=5")
+        client.get("/no-existe")
+
+    eventos = [json.loads(r.getMessage()) for r in caplog.records if r.name == "kiosco"]
+    requests = [e for e in eventos if e["evento"] == "request"]
+    assert [r["endpoint"] for r in requests] == ["api_productos_search", "api_facturas", "sin_ruta"]
+    assert requests[1]["consultas"] >= 1 and requests[2]["estado"] == 404
+    lentas = [e for e in eventos if e["evento"] == "sql_lenta"]
+    assert any("LIMIT ?" in e["sql"] and e["parametros"] == "[6]" for e in lentas)  # limite + 1
+
+    # Uno más lento que el último bucket: cuenta solo en +Inf y no pisa la suma
+    metricas.observar_request("lento", "GET", 200, 12.0)
+    metricas.observar_request("lento", "GET", 200, 0.003)
+    texto = client.get("/metrics").get_data(as_text=True)
+    lineas = texto.splitlines()
+    assert 'kiosco_http_request_duration_seconds_count{endpoint="api_facturas",method="GET"} 1' in lineas
+    assert 'kiosco_http_request_duration_seconds_bucket{endpoint="api_facturas",method="GET",le="+Inf"} 1' in lineas
+    assert 'kiosco_http_request_duration_seconds_bucket{endpoint="lento",method="GET",le="0.005"} 1' in lineas
+    assert 'kiosco_http_request_duration_seconds_bucket{endpoint="lento",method="GET",le="10"} 1' in lineas
+    assert 'kiosco_http_request_duration_seconds_bucket{endpoint="lento",method="GET",le="+Inf"} 2' in lineas
+    assert 'kiosco_http_request_duration_seconds_sum{endpoint="lento",method="GET"} 12.003000' in lineas
+    assert 'kiosco_http_request_duration_seconds_count{endpoint="lento",method="GET"} 2' in lineas
+    assert 'kiosco_http_requests_total{endpoint="sin_ruta",method="GET",status="404"} 1' in lineas
+    assert "kiosco_sql_queries_total{query=" in texto
+    # Los valores quedan fuera de la consulta normalizada
+    assert all("'" not in c["sql"] for c in metricas.consultas())